@@ -1,17 +1,15 @@
 import streamlit as st
 import sys
 import os
-import pandas as pd 
 
 # Yolu ekle
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
-# Modül importları
+# Modül importları — sayfa modülleri router üzerinden ilk açıldıklarında yüklenir
 try:
-    # FILE_FINANS ve SHEET_YATILI'yı da utils'den çekiyoruz
-    from modules.utils import check_password, fetch_google_models, FILE_FINANS, SHEET_YATILI
-    from modules import irsaliye, fatura, menu, finans
+    from modules.utils import check_password, fetch_google_models
+    from modules import router, tracing
 except ImportError as e:
     st.error(f"🚨 MODÜL HATASI: {e}")
     st.stop()
@@ -28,13 +26,7 @@ with st.sidebar:
     st.title("🍳 Mutfak ERP")
     st.caption("Yönetici Paneli v1.2")
     
-    page = st.radio("Modül Seç", [
-        "🏠 Ana Sayfa",
-        "📝 Tüketim Fişi (İrsaliye)", 
-        "🧾 Fatura & Fiyat Girişi", 
-        "📅 Menü Planlayıcı",
-        "💰 Öğrenci Finans"
-    ])
+    page = st.radio("Modül Seç", ["🏠 Ana Sayfa"] + list(router.PAGES))
     
     st.divider()
     
@@ -54,78 +46,118 @@ with st.sidebar:
         
     sel_model = st.selectbox("🤖 AI Modeli:", current_list, index=def_ix)
     
+    with st.expander("⏱️ Açılış Profili"):
+        load_times = router.get_load_times()
+        if load_times:
+            st.caption("Bu süreçte modüllerin ilk yüklenme süreleri:")
+            st.dataframe([{"modül": k, "sn": round(v, 3)} for k, v in load_times.items()], hide_index=True)
+        prof_mod = st.selectbox("Modül", ["modules.utils"] + list(router.PAGES.values()), key="prof_mod")
+        if st.button("-X importtime çalıştır"):
+            with st.spinner("Temiz süreçte import ediliyor..."):
+                st.session_state['import_profile'] = (prof_mod, router.profile_imports(prof_mod))
+        if 'import_profile' in st.session_state:
+            mod, rows = st.session_state['import_profile']
+            if rows:
+                st.metric(mod, f"{rows[0]['cumulative_ms']:.0f} ms")
+                st.dataframe(rows[:30], hide_index=True)
+            else:
+                st.warning("Profil alınamadı.")
+
+    with st.expander("🔬 İzleme (Trace)"):
+        stats = tracing.get_stats()
+        if stats:
+            st.caption("Çağrı sayıları ve süreler (süreç başından beri):")
+            st.dataframe(stats, hide_index=True)
+        traces = tracing.get_traces()
+        if traces:
+            ix = st.selectbox(
+                "Son istekler", range(len(traces)),
+                format_func=lambda i: f"{traces[i].name} — {traces[i].duration * 1000:.0f} ms"
+            )
+            st.dataframe(tracing.flatten(traces[ix]), hide_index=True)
+            st.download_button("📥 JSONL indir", tracing.export_jsonl(traces), file_name="traces.jsonl", mime="application/jsonl")
+        else:
+            st.caption("Henüz kayıt yok.")
+        if st.button("🧹 Sıfırla", key="trace_reset"):
+            tracing.reset()
+
+    with st.expander("⏳ Arka Plan İşleri"):
+        job_list = router.load_module("modules.jobs").get_job_runner().list(limit=15)
+        if job_list:
+            st.dataframe([
+                {"iş": j["label"], "durum": j["status"], "%": round(j["progress"] * 100), "mesaj": j["error"] or j["message"]}
+                for j in job_list
+            ], hide_index=True)
+        else:
+            st.caption("Henüz iş yok.")
+
     st.markdown("---")
     if st.button("🔒 Çıkış Yap"):
         st.session_state.clear()
         st.rerun()
 
 # 3. SAYFA YÖNLENDİRME & DASHBOARD
-if page == "🏠 Ana Sayfa":
-    st.header("📊 Genel Bakış")
-    st.markdown("Hoş geldin Hocam. İşte durum özeti:")
+# Her sayfa çizimi bir trace; içindeki Sheets/Drive/model çağrıları alt span olur
+with tracing.span(f"sayfa: {page}"):
+    if page == "🏠 Ana Sayfa":
+        st.header("📊 Genel Bakış")
+        st.markdown("Hoş geldin Hocam. İşte durum özeti:")
     
-    col1, col2, col3 = st.columns(3)
+        col1, col2, col3 = st.columns(3)
     
-    # --- DÜZELTME BURADA ---
-    # Değişkenleri önce 0 olarak tanımlıyoruz (Veri yoksa hata vermesin diye)
-    toplam_beklenti = 0
-    toplam_tahsilat = 0
-    ogrenci_sayisi = 0
-    kalan_alacak = 0
-    tahsilat_orani = 0.0
+        # --- DÜZELTME BURADA ---
+        # Değişkenleri önce 0 olarak tanımlıyoruz (Veri yoksa hata vermesin diye)
+        toplam_tahsilat = 0
+        ogrenci_sayisi = 0
+        kalan_alacak = 0
+        tahsilat_orani = 0.0
+        agg = None
 
-    # Veriyi çekmeye çalışıyoruz
-    try:
-        # Finans modülündeki hazır fonksiyonu kullanıyoruz, daha güvenli.
-        df_yatili = finans.get_data(SHEET_YATILI)
-        
-        if not df_yatili.empty:
-            # Sayısal dönüşüm (Excel'den string gelebilir)
-            for col in ['Toplam_Yillik_Ucret', 'Odenen_Toplam']:
-                 if col in df_yatili.columns:
-                     df_yatili[col] = pd.to_numeric(df_yatili[col], errors='coerce').fillna(0)
-            
-            toplam_beklenti = df_yatili['Toplam_Yillik_Ucret'].sum()
-            toplam_tahsilat = df_yatili['Odenen_Toplam'].sum()
-            ogrenci_sayisi = len(df_yatili)
-            kalan_alacak = toplam_beklenti - toplam_tahsilat
-            
-            if toplam_beklenti > 0:
-                tahsilat_orani = (toplam_tahsilat / toplam_beklenti) * 100
-            else:
-                tahsilat_orani = 0.0
-                
-    except Exception as e:
-        st.error(f"Veri çekme hatası: {e}")
+        # Özet deposu: tam hesap saatte bir, ödemeler artımlı eklenir
+        try:
+            finans = router.load_module("modules.finans")
+            agg = finans.get_finance_aggregates()
+            ogrenci_sayisi = agg.ogrenci_sayisi
+            toplam_tahsilat = agg.toplam_tahsilat
+            kalan_alacak = agg.kalan_alacak
+            tahsilat_orani = agg.tahsilat_orani
+        except Exception as e:
+            st.error(f"Veri çekme hatası: {e}")
 
-    # Kartları Göster
-    with col1:
-        st.metric("👨‍🎓 Yatılı Öğrenci", f"{ogrenci_sayisi} Kişi")
+        # Kartları Göster
+        with col1:
+            st.metric("👨‍🎓 Yatılı Öğrenci", f"{ogrenci_sayisi} Kişi")
         
-    with col2:
-        # Hata veren satır artık güvenli, çünkü değişkenler yukarıda tanımlandı.
-        st.metric("💰 Toplam Tahsilat", f"{toplam_tahsilat:,.0f} ₺", delta=f"%{tahsilat_orani:.1f} Tahsil edildi")
+        with col2:
+            # Hata veren satır artık güvenli, çünkü değişkenler yukarıda tanımlandı.
+            st.metric("💰 Toplam Tahsilat", f"{toplam_tahsilat:,.0f} ₺", delta=f"%{tahsilat_orani:.1f} Tahsil edildi")
         
-    with col3:
-        st.metric("📉 Beklenen Alacak", f"{kalan_alacak:,.0f} ₺", delta_color="inverse")
-
-    st.divider()
-    
-    c1, c2 = st.columns(2)
-    with c1:
-        st.info("💡 **İpucu:** Mutfaktan çıkan malzemeleri 'Tüketim Fişi'nden, yeni gelen malzemeleri 'Fatura'dan gir.")
-    with c2:
-        if st.button("📂 Google Drive Klasörünü Aç"):
-            st.markdown("[Drive'a Git](https://drive.google.com)", unsafe_allow_html=True)
-
-elif page == "📝 Tüketim Fişi (İrsaliye)":
-    irsaliye.render_page(sel_model)
+        with col3:
+            st.metric("📉 Beklenen Alacak", f"{kalan_alacak:,.0f} ₺", delta_color="inverse")
 
-elif page == "🧾 Fatura & Fiyat Girişi":
-    fatura.render_page(sel_model)
+        if agg is not None and agg.built_at:
+            t1, t2, t3 = st.columns(3)
+            with t1:
+                st.markdown("📈 **Aylık Tahsilat**")
+                df_ay = agg.month_frame()
+                if not df_ay.empty: st.bar_chart(df_ay)
+                else: st.caption("Henüz tahsilat yok.")
+            with t2:
+                st.markdown("🏫 **Sınıf Bazında**")
+                df_sinif = agg.class_frame()
+                if not df_sinif.empty: st.dataframe(df_sinif, hide_index=True, use_container_width=True)
+            with t3:
+                st.markdown("🧾 **Taksit Bazında**")
+                st.dataframe(agg.installment_frame(), hide_index=True, use_container_width=True)
 
-elif page == "📅 Menü Planlayıcı":
-    menu.render_page(sel_model)
+        st.divider()
+    
+        c1, c2 = st.columns(2)
+        with c1:
+            st.info("💡 **İpucu:** Mutfaktan çıkan malzemeleri 'Tüketim Fişi'nden, yeni gelen malzemeleri 'Fatura'dan gir.")
+        with c2:
+            if st.button("📂 Google Drive Klasörünü Aç"):
+                st.markdown("[Drive'a Git](https://drive.google.com)", unsafe_allow_html=True)
 
-elif page == "💰 Öğrenci Finans":
-    finans.render_page(sel_model)
+    else:
+        router.render(page, sel_model)
@@ -0,0 +1,210 @@
+"""
+Uçtan uca belge alım hattı ölçümü (ağ yok): model okuma -> ayrıştırma ->
+isim eşleştirme -> stok güncelleme -> firma defteri.
+
+    python benchmarks/bench_ingestion.py
+    python benchmarks/bench_ingestion.py --catalog 100 1000 20000 --lines 5 50 200 --model-latency-ms 1500
+    python benchmarks/bench_ingestion.py --json sonuc.json
+    python benchmarks/bench_ingestion.py --stream --model-latency-ms 20000   # ilk satıra kadar geçen süre
+
+Model cevapları sentetik belgeler için geçici bir fixture klasörüne üretilir
+(FixtureModelBackend), Sheets sahte istemciyle çalışır. Her (katalog, satır)
+hücresi için fatura ve irsaliye ayrı ayrı koşulur; aşama süreleri trace
+ağacından, API çağrıları sahte istemciden, tepe bellek tracemalloc'tan alınır.
+Stok defteri, sayfa önbelleği ve diğer yerel durum geçici bir klasöre yazılır;
+her koşu boş bir defterle başlar (uygulamanın data/ klasörüne dokunulmaz).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("MUTFAK_SHEETS_BACKEND", "fake")
+# Modüller yüklenmeden önce: LOCAL_DATA_DIR'den türeyen bütün yollar geçici klasöre
+STATE_DIR = tempfile.TemporaryDirectory(prefix="mutfak-bench-")
+os.environ["MUTFAK_DATA_DIR"] = STATE_DIR.name
+os.environ["MUTFAK_STOCK_LEDGER_PATH"] = os.path.join(STATE_DIR.name, "stock_ledger.sqlite")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from modules import utils, tracing
+from modules.fake_sheets import FakeSheetsClient
+from modules.model_backend import FixtureModelBackend, FixtureStore, set_model_backend
+from modules.stock_ledger import StockLedger, set_stock_ledger
+
+COMPANY = "Bench Gıda"
+MODEL = "gemini-bench"
+
+# Rapor sütunları: (etiket, span adları)
+STAGES = [
+    ("model", ("model.generateContent", "model.streamGenerateContent")),
+    ("ayrıştırma", ("extraction.parse",)),
+    ("stok_okuma", ("fatura.load_stock", "irsaliye.load_stock")),
+    ("eşleştirme", ("fatura.resolve_names", "irsaliye.resolve_names")),
+    ("stok_yazma", ("fatura.stock_update", "irsaliye.stock_update")),
+    ("defter", ("fatura.ledger_append", "irsaliye.ledger_append")),
+]
+
+class UploadedDoc(io.BytesIO):
+    """st.file_uploader nesnesinin kullanılan kısmı (getvalue/seek/type)"""
+
+    def __init__(self, data, mime_type):
+        super().__init__(data)
+        self.type = mime_type
+
+def seed_stock(client, n_products):
+    header = ["TEDARİKÇİ", "ÜRÜN ADI", "BİRİM FİYAT", "PARA BİRİMİ", "GÜNCELLEME TARİHİ", "KALAN KOTA", "KOTA BİRİMİ"]
+    rows = [header] + [[COMPANY, f"Ürün {i:05d}", f"{10 + i % 90},50", "TL", "01.01.2025", 100, "KG"] for i in range(n_products)]
+    client.seed(utils.FILE_STOK, utils.PRICE_SHEET_NAME, rows)
+    client.seed(utils.FILE_STOK, utils.SHEET_STOK_AYARLAR, [["FİRMA LİSTESİ"], [COMPANY]])
+
+def ocr_noise(name, rng, rate):
+    """OCR hatası taklidi: Türkçe harf kaybı / büyük harf / fazladan boşluk"""
+    if rng.random() >= rate:
+        return name
+    return rng.choice([
+        lambda s: s.replace("Ü", "U").replace("ü", "u"),
+        lambda s: s.upper(),
+        lambda s: s.replace(" ", "  "),
+    ])(name)
+
+def invoice_text(catalog, lines, rng, noise):
+    out = []
+    for i in range(lines):
+        # Birkaç satır katalogda yok -> yeni ürün yolu da ölçülsün
+        name = f"Ürün {rng.randrange(catalog):05d}" if i % 10 else f"Yeni Ürün {rng.randrange(10 ** 6):06d}"
+        out.append({"urun_adi": ocr_noise(name, rng, noise), "birim_fiyat": rng.randint(5, 300) + 0.5, "miktar": rng.randint(1, 40), "birim": "KG"})
+    return json.dumps({"kalemler": out}, ensure_ascii=False)
+
+def waybill_text(catalog, lines, rng, noise):
+    out = []
+    for _ in range(lines):
+        out.append({"urun_adi": ocr_noise(f"Ürün {rng.randrange(catalog):05d}", rng, noise), "miktar": rng.randint(1, 20), "birim": "KG"})
+    return json.dumps({"kalemler": out}, ensure_ascii=False)
+
+def fixture_response(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}]}
+
+def make_invoice(store, tag, text):
+    data = f"%PDF-1.4 bench {tag}\n".encode() + os.urandom(2048)
+    store.put(hashlib.sha256(data).hexdigest(), fixture_response(text))
+    return UploadedDoc(data, "application/pdf")
+
+def make_waybill(store, tag, text):
+    rng = random.Random(tag)
+    img = Image.new("RGB", (320, 240), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    # analyze_receipt_image ile aynı kodlama -> aynı fixture anahtarı
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    store.put(hashlib.sha256(buf.getvalue()).hexdigest(), fixture_response(text))
+    return img
+
+def stage_times(trace):
+    """Trace ağacındaki span sürelerini aşama etiketlerine göre toplar (ms)"""
+    totals = {label: 0.0 for label, _ in STAGES}
+    lookup = {n: label for label, names in STAGES for n in names}
+
+    def walk(s):
+        label = lookup.get(s.name)
+        if label:
+            totals[label] += (s.duration or 0) * 1000
+            return
+        for c in s.children: walk(c)
+
+    walk(trace)
+    return {k: round(v, 1) for k, v in totals.items()}
+
+def run_pipeline(kind, doc, client, stream=False):
+    from modules import fatura, irsaliye
+
+    first_row = []
+    on_rows = (lambda df: first_row or first_row.append(time.perf_counter())) if stream else None
+    if kind == "fatura":
+        analyze = lambda: fatura.analyze_invoice_file(doc, MODEL, on_rows=on_rows)
+        save = fatura.update_price_list_dataframe
+    else:
+        analyze = lambda: irsaliye.analyze_receipt_image(doc, MODEL, on_rows=on_rows)
+        save = irsaliye.save_receipt_dataframe
+
+    client.reset_stats()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with tracing.span(f"bench.{kind}") as root:
+        ok, df = analyze()
+        if not ok:
+            raise RuntimeError(df)
+        ok, msg = save(df, COMPANY, datetime(2025, 2, 1))
+    total_ms = (time.perf_counter() - t0) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if not ok:
+        raise RuntimeError(msg)
+    return {
+        "belge": kind,
+        "satir": len(df),
+        "toplam_ms": round(total_ms, 1),
+        "ilk_satir_ms": round((first_row[0] - t0) * 1000, 1) if first_row else "",
+        **stage_times(root),
+        "api_cagri": client.total_calls,
+        "tepe_bellek_kb": round(peak / 1024, 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Fatura/irsaliye alım hattı ölçümü")
+    ap.add_argument("--catalog", type=int, nargs="+", default=[100, 1000, 5000], help="katalogdaki ürün sayıları")
+    ap.add_argument("--lines", type=int, nargs="+", default=[5, 50, 200], help="belgedeki satır sayıları")
+    ap.add_argument("--model-latency-ms", type=float, default=0)
+    ap.add_argument("--sheets-latency-ms", type=float, default=0)
+    ap.add_argument("--noise", type=float, default=0.2, help="OCR gürültüsü uygulanan satır oranı")
+    ap.add_argument("--stream", action="store_true", help="model cevabını streamGenerateContent ile oku")
+    ap.add_argument("--json", help="sonuçların yazılacağı dosya")
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    results = []
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        store = FixtureStore(fixture_dir)
+        set_model_backend(FixtureModelBackend(fixture_dir, latency_ms=args.model_latency_ms, seed=1))
+        for n_catalog in args.catalog:
+            for n_lines in args.lines:
+                tag = f"{n_catalog}-{n_lines}"
+                docs = {
+                    "fatura": make_invoice(store, tag, invoice_text(n_catalog, n_lines, rng, args.noise)),
+                    "irsaliye": make_waybill(store, tag, waybill_text(n_catalog, n_lines, rng, args.noise)),
+                }
+                for kind, doc in docs.items():
+                    # Her koşu temiz katalog ve boş defterle başlar
+                    client = FakeSheetsClient(latency_ms=args.sheets_latency_ms, seed=1)
+                    utils.set_fake_sheets_client(client)
+                    seed_stock(client, n_catalog)
+                    set_stock_ledger(StockLedger(os.path.join(STATE_DIR.name, f"stock_ledger_{tag}_{kind}.sqlite")))
+                    try:
+                        row = run_pipeline(kind, doc, client, stream=args.stream)
+                    except Exception as e:
+                        row = {"belge": kind, "hata": f"{type(e).__name__}: {e}"}
+                    results.append({"katalog": n_catalog, **row})
+
+    cols = ["katalog", "belge", "satir", "toplam_ms", "ilk_satir_ms"] + [label for label, _ in STAGES] + ["api_cagri", "tepe_bellek_kb"]
+    print(f"\nmodel_gecikme={args.model_latency_ms}ms sheets_gecikme={args.sheets_latency_ms}ms gürültü={args.noise} akış={args.stream}")
+    print("  ".join(f"{c:>12}" for c in cols))
+    for r in results:
+        if "hata" in r:
+            print(f"{r['katalog']:>12}  {r['belge']:>12}  HATA: {r['hata']}")
+            continue
+        print("  ".join(f"{r.get(c, ''):>12}" for c in cols))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n{args.json} yazıldı")
+
+if __name__ == "__main__":
+    main()
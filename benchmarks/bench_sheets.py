@@ -0,0 +1,103 @@
+"""
+Kayıt yollarının sahte Sheets üzerinde yük testi (ağ yok).
+
+    python benchmarks/bench_sheets.py --products 2000 --lines 50 --latency-ms 80
+    python benchmarks/bench_sheets.py --quota 60      # kota aşımını yeniden üret
+
+Her senaryo için süre, API çağrı sayısı (türlerine göre) ve kota hatası raporlanır.
+Yerel durum (finans özeti, stok defteri, önbellekler) geçici bir klasöre yazılır;
+uygulamanın data/ klasörüne dokunulmaz.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("MUTFAK_SHEETS_BACKEND", "fake")
+# Modüller yüklenmeden önce: LOCAL_DATA_DIR'den türeyen bütün yollar geçici klasöre
+STATE_DIR = tempfile.TemporaryDirectory(prefix="mutfak-bench-")
+os.environ["MUTFAK_DATA_DIR"] = STATE_DIR.name
+os.environ["MUTFAK_STOCK_LEDGER_PATH"] = os.path.join(STATE_DIR.name, "stock_ledger.sqlite")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from modules import utils
+from modules.fake_sheets import FakeSheetsClient
+
+COMPANY = "Bench Gıda"
+
+def seed_stock(client, n_products):
+    header = ["TEDARİKÇİ", "ÜRÜN ADI", "BİRİM FİYAT", "PARA BİRİMİ", "GÜNCELLEME TARİHİ", "KALAN KOTA", "KOTA BİRİMİ"]
+    rows = [header] + [[COMPANY, f"Ürün {i:05d}", f"{10 + i % 90},50", "TL", "01.01.2025", 100, "KG"] for i in range(n_products)]
+    client.seed(utils.FILE_STOK, utils.PRICE_SHEET_NAME, rows)
+    client.seed(utils.FILE_STOK, utils.SHEET_STOK_AYARLAR, [["FİRMA LİSTESİ"], [COMPANY]])
+
+def seed_finance(client, n_students):
+    header = ["Ad_Soyad", "Sinif", "Toplam_Yillik_Ucret", "Odenen_Toplam", "Kalan_Borc", "Taksit1_Tutar", "Taksit2_Tutar", "Taksit3_Tutar", "Taksit4_Tutar"]
+    rows = [header] + [[f"Öğrenci {i:04d} Yılmaz", f"{9 + i % 4}A", 20000, 0, 20000, 5000, 5000, 5000, 5000] for i in range(n_students)]
+    client.seed(utils.FILE_FINANS, utils.SHEET_YATILI, rows)
+    client.seed(utils.FILE_FINANS, utils.SHEET_GUNDUZLU, [["TC", "Ad_Soyad", "Sinif", "Tarih", "Ogun", "Adet", "Tutar", "Durum", "Dekont", "Islem_Anahtari"]])
+
+def run(name, client, fn):
+    client.reset_stats()
+    t0 = time.perf_counter()
+    err = ""
+    try:
+        fn()
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+    ms = (time.perf_counter() - t0) * 1000
+    calls = dict(client.calls)
+    return {"senaryo": name, "ms": round(ms, 1), "api_cagri": client.total_calls, "kota_hatasi": calls.pop("quota_exceeded", 0), "detay": calls, "hata": err}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--products", type=int, default=1000)
+    ap.add_argument("--lines", type=int, default=30)
+    ap.add_argument("--students", type=int, default=300)
+    ap.add_argument("--receipts", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--quota", type=int, default=None, help="dakikadaki istek sınırı")
+    args = ap.parse_args()
+
+    client = FakeSheetsClient(latency_ms=args.latency_ms, quota_per_minute=args.quota, seed=1)
+    utils.set_fake_sheets_client(client)
+    seed_stock(client, args.products)
+    seed_finance(client, args.students)
+
+    from modules import fatura, irsaliye, finans
+    finans._AGGREGATES = finans.FinanceAggregates()  # özet boş başlasın
+
+    invoice = pd.DataFrame([
+        {"ÜRÜN ADI": f"Ürün {i * 7 % args.products:05d}", "BİRİM FİYAT": "12.5", "MİKTAR": "3", "BİRİM": "KG"}
+        for i in range(args.lines)
+    ])
+    waybill = invoice[["ÜRÜN ADI", "MİKTAR", "BİRİM"]]
+    receipts = [
+        {"ogrenci_ad": f"Ogrenci {i * 3 % args.students:04d} Yilmaz", "tutar": 5000, "tarih": "2025-02-01", "tur_tahmini": "TAKSİT"}
+        for i in range(args.receipts)
+    ]
+
+    def gunduzlu():
+        buf = finans.GunduzluAppendBuffer()
+        for i in range(args.receipts):
+            buf.add({"ogrenci_ad": "Misafir", "tutar": 150 + i, "tarih": "2025-02-01"}, f"link{i}", f"file{i}")
+        buf.flush()
+
+    results = [
+        run("fatura.update_price_list_dataframe", client, lambda: fatura.update_price_list_dataframe(invoice, COMPANY, datetime(2025, 2, 1))),
+        run("irsaliye.save_receipt_dataframe", client, lambda: irsaliye.save_receipt_dataframe(waybill, COMPANY, datetime(2025, 2, 2))),
+        run("finans.process_yatili_payments_bulk", client, lambda: finans.process_yatili_payments_bulk(receipts)),
+        run("finans.GunduzluAppendBuffer", client, gunduzlu),
+    ]
+
+    print(f"\nürün={args.products} satır={args.lines} öğrenci={args.students} dekont={args.receipts} gecikme={args.latency_ms}ms kota={args.quota}")
+    for r in results:
+        print(f"{r['senaryo']:<40} {r['ms']:>10.1f} ms  {r['api_cagri']:>5} çağrı  kota_hatası={r['kota_hatasi']}  {r['hata']}")
+        print(f"{'':<40} {r['detay']}")
+
+if __name__ == "__main__":
+    main()
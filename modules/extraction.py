@@ -0,0 +1,345 @@
+import json
+import re
+
+import pandas as pd
+
+from modules.model_backend import get_model_backend, ModelError
+from modules.utils import clean_number
+from modules.tracing import span
+
+# =========================================================
+# 🧾 YAPILANDIRILMIŞ ÇIKTI (JSON ŞEMA)
+# =========================================================
+# Fatura / irsaliye / dekont okumaları modelden responseSchema ile kısıtlı JSON
+# ister. Cevap tek yerde:
+#   1) akış ayrıştırıcısıyla okunur (bozuk kalem atlanır, diğerleri kurtarılır),
+#   2) şemadan bir kez derlenen doğrulayıcıdan geçer (sayı/metin dönüşümleri dahil),
+#   3) geçersizse hata listesiyle birlikte modele yeniden sorulur.
+# Model JSON yerine eski boru (|) formatında cevap verirse (ör. eski fixture'lar)
+# modülün eski metin ayrıştırıcısına düşülür.
+
+class ExtractionError(Exception):
+    pass
+
+# --- Şema derleyici ---
+_NUM_JUNK = re.compile(r"[^\d,.\-]")
+
+def _to_number(v):
+    """12 / 12.5 / "1.500,50" / "12,5 TL" -> float (clean_number kuralları); rakam yoksa ValueError"""
+    if isinstance(v, bool):
+        raise ValueError("sayı bekleniyordu")
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = _NUM_JUNK.sub("", str(v))
+    if not any(ch.isdigit() for ch in s):
+        raise ValueError("sayı bekleniyordu")
+    return clean_number(s)
+
+def compile_schema(schema, path="$"):
+    """
+    responseSchema (OpenAPI alt kümesi) -> check(value, errors) fonksiyonu.
+    Derleme şema başına bir kez yapılır; doğrulama sırasında sözlük gezilmez.
+    ARRAY içindeki hatalı öğeler atlanır ve hata listesine yazılır (kısmi kurtarma).
+    """
+    t = str(schema.get("type", "STRING")).upper()
+
+    if t == "OBJECT":
+        props = {k: compile_schema(v, f"{path}.{k}") for k, v in schema.get("properties", {}).items()}
+        required = set(schema.get("required", []))
+
+        def check(v, errors):
+            if not isinstance(v, dict):
+                errors.append(f"{path}: nesne bekleniyordu")
+                return None
+            out = {}
+            for k, fn in props.items():
+                if v.get(k) is None:
+                    if k in required:
+                        errors.append(f"{path}.{k}: eksik")
+                    out[k] = None
+                else:
+                    out[k] = fn(v[k], errors)
+            return out
+        return check
+
+    if t == "ARRAY":
+        item = compile_schema(schema.get("items", {}), f"{path}[]")
+
+        def check(v, errors):
+            if not isinstance(v, list):
+                errors.append(f"{path}: liste bekleniyordu")
+                return None
+            out = []
+            for i, x in enumerate(v):
+                item_errors = []
+                val = item(x, item_errors)
+                if item_errors:
+                    errors.extend(f"[{i}] {e}" for e in item_errors)
+                else:
+                    out.append(val)
+            return out
+        return check
+
+    if t in ("NUMBER", "INTEGER"):
+        cast = int if t == "INTEGER" else float
+
+        def check(v, errors):
+            try:
+                return cast(_to_number(v))
+            except (TypeError, ValueError):
+                errors.append(f"{path}: sayı değil ({v!r})")
+                return None
+        return check
+
+    if t == "BOOLEAN":
+        def check(v, errors):
+            if isinstance(v, bool): return v
+            if str(v).lower() in ("true", "false"): return str(v).lower() == "true"
+            errors.append(f"{path}: mantıksal değer değil ({v!r})")
+            return None
+        return check
+
+    enum = schema.get("enum")
+
+    def check(v, errors):
+        s = v if isinstance(v, str) else str(v)
+        s = s.strip()
+        if enum and s not in enum:
+            errors.append(f"{path}: {s!r} izinli değil ({', '.join(enum)})")
+            return None
+        return s
+    return check
+
+# --- Akış ayrıştırıcısı ---
+class JsonArrayStream:
+    """
+    Parça parça gelen JSON metninden `key` dizisinin öğelerini tamamlandıkça çıkarır.
+        stream = JsonArrayStream("kalemler")
+        for chunk in chunks: for item in stream.feed(chunk): ...
+        stream.close()  # sonda kalan bozuk/yarım öğeleri kurtarmayı dener
+    Dizinin yeri bulunamazsa (ör. model düz metin döndürdü) hiç öğe üretmez.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, key):
+        self.key_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buf = ""
+        self.pos = None      # dizinin içindeki okuma konumu
+        self.done = False
+        self.skipped = 0     # bozuk olduğu için atlanan öğe sayısı
+        self.seeking = False # bozuk öğeden sonra sıradaki '{' aranıyor
+
+    def feed(self, chunk):
+        self.buf += chunk
+        return list(self._drain(final=False))
+
+    def close(self):
+        return list(self._drain(final=True))
+
+    def _drain(self, final):
+        if self.done:
+            return
+        if self.pos is None:
+            m = self.key_re.search(self.buf)
+            if not m:
+                return
+            self.pos = m.end()
+        while True:
+            if self.seeking:
+                nxt = self.buf.find("{", self.pos)
+                close = self.buf.find("]", self.pos)
+                if close >= 0 and (nxt < 0 or close < nxt):
+                    self.done = True
+                    return
+                if nxt < 0:
+                    self.done = final
+                    return
+                self.pos = nxt
+                self.seeking = False
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos >= len(self.buf):
+                return
+            if self.buf[self.pos] == "]":
+                self.done = True
+                return
+            try:
+                item, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if not final and self._incomplete(e):
+                    return  # öğe henüz tamamlanmadı, yeni parça bekle
+                # Bozuk öğe (ya da akış bitti): atla, sıradaki '{' den devam et
+                self.skipped += 1
+                self.pos += 1
+                self.seeking = True
+                continue
+            self.pos = end
+            yield item
+
+    def _incomplete(self, e):
+        # Hata noktasından sonra kapanış yoksa metin yarım gelmiştir; varsa öğe gerçekten bozuktur
+        return e.msg.startswith("Unterminated") or not any(ch in "}]" for ch in self.buf[e.pos:])
+
+def _strip_fences(text):
+    return text.strip().replace("```json", "").replace("```", "").strip()
+
+def looks_like_json(text):
+    return _strip_fences(text)[:1] in ("{", "[")
+
+# --- Çıkarım tanımı ---
+class ExtractionSpec:
+    """
+    prompt: modele verilen talimat (çıktı formatı şemadan gelir)
+    schema: responseSchema
+    array_key: kalem listesi içeren şemalarda listenin alanı (akış ayrıştırıcısı için)
+    columns: {şema alanı: DataFrame sütunu}; verilirse sonuç DataFrame'e çevrilir
+    fallback: model düz metin döndürürse kullanılacak eski ayrıştırıcı (metin -> sonuç)
+    """
+
+    def __init__(self, name, prompt, schema, array_key=None, columns=None, fallback=None):
+        self.name = name
+        self.prompt = prompt
+        self.schema = schema
+        self.array_key = array_key
+        self.columns = columns
+        self.fallback = fallback
+        self.validate = compile_schema(schema)
+        # Akışta kalemler tek tek doğrulanır
+        self.validate_item = compile_schema(schema["properties"][array_key]["items"], f"$.{array_key}[]") if array_key else None
+
+    @property
+    def generation_config(self):
+        return {"responseMimeType": "application/json", "responseSchema": self.schema}
+
+    def frame(self, items):
+        cols = self.columns
+        # Boş isteğe bağlı alanlar editörde "None" görünmesin
+        return pd.DataFrame([{cols[k]: "" if it.get(k) is None else it[k] for k in cols} for it in items], columns=list(cols.values()))
+
+    def shape(self, data):
+        """Doğrulanmış veriyi modülün beklediği biçime çevirir"""
+        if self.columns and self.array_key:
+            return self.frame(data.get(self.array_key) or [])
+        return data
+
+class ExtractionResult:
+    def __init__(self, data, warnings, attempts, raw):
+        self.data = data
+        self.warnings = warnings
+        self.attempts = attempts
+        self.raw = raw
+
+def parse_response(spec, raw):
+    """
+    Ham model metnini ayrıştırıp doğrular: (veri, uyarılar, yeniden_sor_mu).
+    Dizi şemalarında tamamlanmış kalemler bozuk olanlardan bağımsız kurtarılır.
+    """
+    errors = []
+    text = _strip_fences(raw)
+    with span("extraction.parse", spec=spec.name, chars=len(text)):
+        try:
+            value = json.loads(text)
+        except ValueError:
+            if not spec.array_key:
+                return None, ["JSON çözülemedi"], True
+            # Kesik/bozuk cevap: tamamlanmış kalemleri topla
+            stream = JsonArrayStream(spec.array_key)
+            items = stream.feed(text) + stream.close()
+            if not items:
+                return None, ["JSON çözülemedi"], True
+            errors.append(f"Cevap bozuk; {len(items)} kalem kurtarıldı, {stream.skipped} kalem atlandı")
+            value = {spec.array_key: items}
+        data = spec.validate(value, errors)
+
+    if data is None:
+        return None, errors, True
+    if spec.array_key and not data.get(spec.array_key) and errors:
+        return None, errors, True   # hiçbir kalem geçerli değil
+    # Nesne şemasında zorunlu alan eksikse tekrar sor; dizide tekil bozuk kalemler uyarı olarak kalır
+    retry = not spec.array_key and bool(errors)
+    return data, errors, retry
+
+def _retry_prompt(spec, errors):
+    return spec.prompt + "\n\nÖNCEKİ CEVAP GEÇERSİZDİ:\n- " + "\n- ".join(errors[:10]) + "\nSadece şemaya uygun JSON döndür."
+
+def extract(spec, model_name, data, mime_type, retries=1, prompt=None):
+    """
+    Belgeyi şemalı JSON modunda okur. Geçersiz cevapta hatalar istemin sonuna
+    eklenerek en fazla `retries` kez yeniden sorulur. ExtractionResult döner;
+    ModelError (ağ/kota) olduğu gibi yükselir, hiçbir deneme geçerli değilse ExtractionError.
+    """
+    backend = get_model_backend()
+    prompt = prompt or spec.prompt
+    last_errors = []
+    for attempt in range(1, retries + 2):
+        raw = backend.generate_text(model_name, prompt, data, mime_type, spec.generation_config)
+        if not looks_like_json(raw) and spec.fallback:
+            return ExtractionResult(spec.fallback(raw), [], attempt, raw)
+        value, errors, retry = parse_response(spec, raw)
+        if value is not None and not retry:
+            return ExtractionResult(spec.shape(value), errors, attempt, raw)
+        last_errors = errors
+        prompt = _retry_prompt(spec, errors)
+    raise ExtractionError("; ".join(last_errors[:5]) or "Geçersiz model cevabı")
+
+def extract_stream(spec, model_name, data, mime_type, on_rows, retries=1):
+    """
+    streamGenerateContent ile okur; tamamlanan her kalem doğrulanıp on_rows(DataFrame)
+    ile (o ana kadarki tüm satırlar) bildirilir. Akış bitince tüm cevap extract ile aynı
+    kurallarla doğrulanır; geçersizse normal (akışsız) yeniden sormaya düşülür.
+    Eski boru formatındaki cevaplarda tamamlanan satırlar spec.fallback ile ayrıştırılır.
+    """
+    backend = get_model_backend()
+    stream = JsonArrayStream(spec.array_key)
+    parts, rows, frames = [], [], []
+    legacy = None       # cevabın biçimi ilk anlamlı karakterlerden anlaşılır
+    line_buf = ""
+
+    for text in backend.generate_text_stream(model_name, spec.prompt, data, mime_type, spec.generation_config):
+        parts.append(text)
+        if legacy is None:
+            head = "".join(parts).lstrip()
+            if "\n" not in head and len(head) < 16:
+                continue
+            legacy = not looks_like_json(head) and spec.fallback is not None
+            text = "".join(parts)
+        if legacy:
+            line_buf += text
+            complete, _, line_buf = line_buf.rpartition("\n")
+            if complete:
+                df = spec.fallback(complete)
+                if len(df):
+                    frames.append(df)
+                    on_rows(pd.concat(frames, ignore_index=True))
+            continue
+        fresh = []
+        for item in stream.feed(text):
+            errs = []
+            val = spec.validate_item(item, errs)
+            if not errs:
+                fresh.append(val)
+        if fresh:
+            rows.extend(fresh)
+            on_rows(spec.frame(rows))
+
+    raw = "".join(parts)
+    if legacy or (not looks_like_json(raw) and spec.fallback):
+        return ExtractionResult(spec.fallback(raw), [], 1, raw)
+    value, errors, retry = parse_response(spec, raw)
+    if value is not None and not retry:
+        return ExtractionResult(spec.shape(value), errors, 1, raw)
+    if retries < 1:
+        raise ExtractionError("; ".join(errors[:5]) or "Geçersiz model cevabı")
+    res = extract(spec, model_name, data, mime_type, retries - 1, prompt=_retry_prompt(spec, errors))
+    res.attempts += 1
+    return res
+
+def extract_safe(spec, model_name, data, mime_type, retries=1, on_rows=None):
+    """(True, ExtractionResult) ya da (False, hata mesajı). on_rows verilirse akışlı okunur."""
+    try:
+        if on_rows is not None and spec.array_key:
+            return True, extract_stream(spec, model_name, data, mime_type, on_rows, retries)
+        return True, extract(spec, model_name, data, mime_type, retries)
+    except (ModelError, ExtractionError) as e:
+        return False, str(e)
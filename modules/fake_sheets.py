@@ -0,0 +1,274 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+# =========================================================
+# 🧪 SAHTE GOOGLE SHEETS (YEREL / AĞSIZ)
+# =========================================================
+# gspread'in bu projede kullanılan alt kümesini bellekte taklit eder:
+#   client.open(isim) -> Spreadsheet; worksheets / worksheet / add_worksheet
+#   get_all_values / get_all_records / col_values / row_values
+#   append_row(s) / update / update_cell / batch_update / clear
+# Gecikme ve kota (dakikadaki istek sayısı) enjekte edilebilir; her çağrı sayılır.
+# Ayarlardan SHEETS_BACKEND = "fake" seçilince get_gspread_client bunu döndürür.
+
+class FakeSheetsError(Exception):
+    pass
+
+class FakeQuotaExceeded(FakeSheetsError):
+    """Gerçek API'nin 429 RESOURCE_EXHAUSTED cevabının karşılığı"""
+
+class FakeSpreadsheetNotFound(FakeSheetsError):
+    pass
+
+class FakeWorksheetNotFound(FakeSheetsError):
+    pass
+
+def a1_to_rowcol(label):
+    """'C5' -> (5, 3); 'A1:C3' gibi aralıkta sol üst köşe alınır"""
+    m = re.match(r"([A-Za-z]+)(\d+)", label.split(":")[0].split("!")[-1])
+    if not m:
+        raise FakeSheetsError(f"Geçersiz aralık: {label}")
+    col = 0
+    for ch in m.group(1).upper():
+        col = col * 26 + (ord(ch) - 64)
+    return int(m.group(2)), col
+
+def _cell_str(v):
+    # Sheets biçimlenmiş değer döndürür: 20000.0 -> "20000"
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def _numericise(v):
+    if v == "": return ""
+    try: return int(v)
+    except ValueError: pass
+    try: return float(v)
+    except ValueError: return v
+
+class FakeSheetsClient:
+    """
+    latency_ms: her API çağrısına eklenen gecikme (± jitter_ms)
+    quota_per_minute: kayan 60 sn pencerede izin verilen çağrı sayısı (None = sınırsız)
+    autocreate: olmayan dosya açılınca boş dosya oluşturulsun mu
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, quota_per_minute=None, autocreate=True, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.quota_per_minute = quota_per_minute
+        self.autocreate = autocreate
+        self.files = {}
+        self.calls = Counter()
+        self._window = deque()
+        self._lock = threading.RLock()
+        self._rng = random.Random(seed)
+
+    # --- Enjeksiyon / sayaç ---
+    def _api_call(self, name):
+        with self._lock:
+            now = time.monotonic()
+            if self.quota_per_minute is not None:
+                while self._window and now - self._window[0] > 60:
+                    self._window.popleft()
+                if len(self._window) >= self.quota_per_minute:
+                    self.calls["quota_exceeded"] += 1
+                    raise FakeQuotaExceeded("APIError: [429]: Quota exceeded for quota metric 'Read requests'")
+                self._window.append(now)
+            self.calls[name] += 1
+            delay = self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self._window.clear()
+
+    @property
+    def total_calls(self):
+        return sum(v for k, v in self.calls.items() if k != "quota_exceeded")
+
+    # --- gspread.Client alt kümesi ---
+    def open(self, title):
+        self._api_call("open")
+        with self._lock:
+            if title not in self.files:
+                if not self.autocreate:
+                    raise FakeSpreadsheetNotFound(title)
+                self.files[title] = FakeSpreadsheet(self, title)
+            return self.files[title]
+
+    # --- Test/benchmark verisi ---
+    def seed(self, file_title, sheet_title, rows):
+        """API çağrısı saymadan sayfayı verilen satırlarla doldurur"""
+        with self._lock:
+            if file_title not in self.files:
+                self.files[file_title] = FakeSpreadsheet(self, file_title)
+            sh = self.files[file_title]
+            ws = sh._sheets.get(sheet_title) or sh._new_sheet(sheet_title)
+            ws._rows = [[_cell_str(c) for c in r] for r in rows]
+            sh._touch()
+            return ws
+
+    def dump(self):
+        with self._lock:
+            return {f: {t: ws._rows for t, ws in sh._sheets.items()} for f, sh in self.files.items()}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.dump(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        client = cls(**kwargs)
+        with open(path, encoding="utf-8") as f:
+            for file_title, sheets in json.load(f).items():
+                for sheet_title, rows in sheets.items():
+                    client.seed(file_title, sheet_title, rows)
+        return client
+
+class FakeSpreadsheet:
+    def __init__(self, client, title):
+        self.client = client
+        self.title = title
+        self.id = uuid.uuid4().hex
+        self._sheets = {}
+        self._modified = datetime.now(timezone.utc)
+
+    def _touch(self):
+        self._modified = datetime.now(timezone.utc)
+
+    def _new_sheet(self, title, rows=1000, cols=26):
+        ws = FakeWorksheet(self, title)
+        self._sheets[title] = ws
+        return ws
+
+    def get_lastUpdateTime(self):
+        """gspread 6 ile aynı: Drive modifiedTime (ISO 8601)"""
+        self.client._api_call("drive.get")
+        return self._modified.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def worksheets(self):
+        self.client._api_call("worksheets")
+        return list(self._sheets.values())
+
+    def worksheet(self, title):
+        self.client._api_call("worksheet")
+        if title not in self._sheets:
+            raise FakeWorksheetNotFound(title)
+        return self._sheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        self.client._api_call("add_worksheet")
+        with self.client._lock:
+            if title in self._sheets:
+                raise FakeSheetsError(f'A sheet with the name "{title}" already exists.')
+            self._touch()
+            return self._new_sheet(title, rows, cols)
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = abs(hash((spreadsheet.id, title))) % (10 ** 9)
+        self._rows = []
+
+    @property
+    def _client(self):
+        return self.spreadsheet.client
+
+    def _write(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        r = self._rows[row - 1]
+        while len(r) < col:
+            r.append("")
+        r[col - 1] = _cell_str(value)
+
+    def _write_block(self, row, col, values):
+        for i, vals in enumerate(values):
+            for j, v in enumerate(vals):
+                self._write(row + i, col + j, v)
+        self.spreadsheet._touch()
+
+    # --- Okuma ---
+    def get_all_values(self, *args, **kwargs):
+        self._client._api_call("get_all_values")
+        with self._client._lock:
+            width = max((len(r) for r in self._rows), default=0)
+            return [list(r) + [""] * (width - len(r)) for r in self._rows]
+
+    def get_all_records(self, head=1, default_blank="", **kwargs):
+        self._client._api_call("get_all_records")
+        with self._client._lock:
+            if len(self._rows) < head:
+                return []
+            header = self._rows[head - 1]
+            out = []
+            for r in self._rows[head:]:
+                r = list(r) + [""] * (len(header) - len(r))
+                out.append({h: (_numericise(v) if v != "" else default_blank) for h, v in zip(header, r)})
+            return out
+
+    def col_values(self, col, *args, **kwargs):
+        self._client._api_call("col_values")
+        with self._client._lock:
+            vals = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while vals and vals[-1] == "":
+            vals.pop()
+        return vals
+
+    def row_values(self, row, *args, **kwargs):
+        self._client._api_call("row_values")
+        with self._client._lock:
+            vals = list(self._rows[row - 1]) if len(self._rows) >= row else []
+        while vals and vals[-1] == "":
+            vals.pop()
+        return vals
+
+    # --- Yazma ---
+    def append_row(self, values, *args, **kwargs):
+        self.append_rows([values], _call="append_row")
+
+    def append_rows(self, values, *args, _call="append_rows", **kwargs):
+        self._client._api_call(_call)
+        with self._client._lock:
+            # Sheets tabloyu son dolu satırdan sonra genişletir
+            while self._rows and not any(self._rows[-1]):
+                self._rows.pop()
+            self._rows.extend([[_cell_str(v) for v in r] for r in values])
+            self.spreadsheet._touch()
+
+    def update(self, values=None, range_name=None, *args, **kwargs):
+        # Eski imza: update("A1", [[...]]) — gspread 6 da iki sırayı kabul ediyor
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self._client._api_call("update")
+        with self._client._lock:
+            row, col = a1_to_rowcol(range_name or "A1")
+            self._write_block(row, col, values or [])
+
+    def update_cell(self, row, col, value):
+        self._client._api_call("update_cell")
+        with self._client._lock:
+            self._write_block(row, col, [[value]])
+
+    def batch_update(self, data, *args, **kwargs):
+        self._client._api_call("batch_update")
+        with self._client._lock:
+            for item in data:
+                row, col = a1_to_rowcol(item["range"])
+                self._write_block(row, col, item["values"])
+
+    def clear(self):
+        self._client._api_call("clear")
+        with self._client._lock:
+            self._rows = []
+            self.spreadsheet._touch()
@@ -1,7 +1,4 @@
 import streamlit as st
-import requests
-import json
-import base64
 import pandas as pd
 from datetime import datetime
 import io
@@ -11,52 +8,75 @@ from modules.utils import (
     get_or_create_worksheet,
     get_company_list,
     resolve_product_name, 
+    record_corrections,
+    invalidate_snapshot,
     clean_number, 
     FILE_STOK, 
     PRICE_SHEET_NAME
 )
+from modules.tracing import span, traced
+from modules.extraction import ExtractionSpec, extract_safe
+from modules.pdf_ingest import extract_pdf, PdfPageError
+from modules.jobs import INLINE, JobCancelled, JobError, register, submit, render_job
+from modules.stock_ledger import get_stock_ledger, render_ledger_panel, batch_id, product_key, KIND_INVOICE
 
 # --- AI ANALİZ ---
-def analyze_invoice_file(uploaded_file, model_name):
-    api_key = st.secrets["GOOGLE_API_KEY"]
-    clean_model = model_name if "models/" not in model_name else model_name.replace("models/", "")
-    
-    uploaded_file.seek(0)
-    file_bytes = uploaded_file.getvalue()
-    base64_data = base64.b64encode(file_bytes).decode('utf-8')
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{clean_model}:generateContent?key={api_key}"
-    headers = {'Content-Type': 'application/json'}
-    
-    # PROMPT DEĞİŞTİ: Firma ismini sormuyoruz, sadece ürünleri soruyoruz.
-    prompt = """
+# PROMPT DEĞİŞTİ: Firma ismini sormuyoruz, sadece ürünleri soruyoruz.
+INVOICE_PROMPT = """
     Bu FATURAYI analiz et.
     Sadece kalemleri çıkar. Firma ismine veya tarihe bakma.
     
     KURALLAR:
     1. Paket (Koli/Teneke) fiyatını paketin içindeki miktara bölerek KG/LT/ADET başı GERÇEK BİRİM FİYATI bul.
-    2. MİKTAR ve FİYATLARI yazarken "Binlik Ayracı" KULLANMA. (1.500 yazma, 1500 yaz). Ondalık için nokta kullan.
+    2. MİKTAR ve FİYATLARI sayı olarak ver; binlik ayracı kullanma.
     
-    ÇIKTI FORMATI:
-    ÜRÜN ADI | BİRİM FİYAT (Sayı) | MİKTAR (Sayı) | BİRİM
+    Her kalem için: urun_adi, birim_fiyat, miktar, birim
+    """
+
+INVOICE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "kalemler": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "urun_adi": {"type": "STRING"},
+                    "birim_fiyat": {"type": "NUMBER"},
+                    "miktar": {"type": "NUMBER"},
+                    "birim": {"type": "STRING"},
+                },
+                "required": ["urun_adi", "birim_fiyat", "miktar"],
+                "propertyOrdering": ["urun_adi", "birim_fiyat", "miktar", "birim"],
+            },
+        }
+    },
+    "required": ["kalemler"],
+}
+
+def analyze_invoice_file(uploaded_file, model_name, on_rows=None):
     """
+    (True, kalem DataFrame'i) ya da (False, hata). Uyarılar df.attrs['uyarilar'] içinde.
+    on_rows verilirse cevap akışla okunur ve satırlar geldikçe on_rows(df) çağrılır.
+    """
+    uploaded_file.seek(0)
+    file_bytes = uploaded_file.getvalue()
     
-    payload = {
-        "contents": [{
-            "parts": [
-                {"text": prompt},
-                {"inline_data": {"mime_type": uploaded_file.type, "data": base64_data}}
-            ]
-        }],
-        "safetySettings": [{"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}]
-    }
+    # Çok sayfalı PDF: sayfa grupları paralel okunur (tek sayfalık/küçük belgeler eski yoldan)
+    if uploaded_file.type == "application/pdf":
+        try:
+            split = extract_pdf(INVOICE_SPEC, model_name, file_bytes, on_rows=on_rows)
+        except PdfPageError as e:
+            return False, str(e)
+        if split is not None:
+            df, warnings = split
+            df.attrs['uyarilar'] = warnings
+            return True, df
     
-    try:
-        res = requests.post(url, headers=headers, data=json.dumps(payload))
-        if res.status_code == 200:
-            return True, res.json()['candidates'][0]['content']['parts'][0]['text']
-        return False, "API Cevap Vermedi"
-    except Exception as e: return False, str(e)
+    ok, res = extract_safe(INVOICE_SPEC, model_name, file_bytes, uploaded_file.type, on_rows=on_rows)
+    if not ok: return False, res
+    res.data.attrs['uyarilar'] = res.warnings
+    return True, res.data
 
 def text_to_dataframe_fatura(raw_text):
     data = []
@@ -79,7 +99,14 @@ def text_to_dataframe_fatura(raw_text):
             })
     return pd.DataFrame(data)
 
+INVOICE_SPEC = ExtractionSpec(
+    "fatura", INVOICE_PROMPT, INVOICE_SCHEMA, array_key="kalemler",
+    columns={"urun_adi": "ÜRÜN ADI", "birim_fiyat": "BİRİM FİYAT", "miktar": "MİKTAR", "birim": "BİRİM"},
+    fallback=text_to_dataframe_fatura
+)
+
 # --- VERİTABANI VE KONTROL ---
+@traced("fatura.check_invoice_duplicate")
 def check_invoice_duplicate(client, company, date_str):
     """
     Seçilen firmanın kendi sayfasına bakar.
@@ -109,28 +136,75 @@ def check_invoice_duplicate(client, company, date_str):
         return False
     except: return False
 
-def update_price_list_dataframe(df, company, date_obj):
+@traced("fatura.update_price_list_dataframe")
+def update_price_list_dataframe(df, company, date_obj, ctx=INLINE):
+    """
+    ctx: arka plan işinden çağrılırsa JobContext. Plan (yazılacak hücreler) ayrı bir
+    adımda çıkarılıp saklanır; süreç yazma sırasında ölürse iş, stoğu yeniden
+    okumadan aynı planla kalan adımlardan devam eder (kota iki kez artmaz).
+    Kota artışı stok defterine hareket olarak eklenir; KALAN KOTA hücresine
+    defterdeki bakiye yazılır (sayfadaki değere ekleme yapılmaz).
+    """
     client = get_gspread_client()
     if not client: return False, "Bağlantı Hatası"
     
     date_str = date_obj.strftime("%d.%m.%Y")
     
-    # 1. DUPLICATE KONTROLÜ
-    if check_invoice_duplicate(client, company, date_str):
-        return False, [f"⛔ HATA: {company} firmasına ait {date_str} tarihli fatura ZATEN GİRİLMİŞ!"]
-    
-    log_messages = []
     try:
         sh = client.open(FILE_STOK)
-        
         # Fiyat Anahtarı (Stok Deposu)
         ws_price = get_or_create_worksheet(sh, PRICE_SHEET_NAME, 7, [])
-        price_data = ws_price.get_all_values()
-        
         # Firma Sayfası (Cari Ekstresi Gibi)
         # Başlıklar: TARİH | ÜRÜN ADI | MİKTAR | BİRİM | BİRİM FİYAT | TUTAR | İŞLEM TÜRÜ
         ws_company = get_or_create_worksheet(sh, company, 10, ["TARİH", "ÜRÜN ADI", "MİKTAR", "BİRİM", "BİRİM FİYAT", "TUTAR", "İŞLEM TÜRÜ"])
         
+        ctx.progress(0.1, "Stok okunuyor")
+        plan = ctx.step("plan", lambda: _plan_invoice(client, ws_price, df, company, date_str))
+        if plan.get("duplicate"):
+            return False, [f"⛔ HATA: {company} firmasına ait {date_str} tarihli fatura ZATEN GİRİLMİŞ!"]
+                
+        # Stok defteri: hareketler tek işlemde eklenir, bakiye defterden okunur
+        ctx.progress(0.5, "Stok defterine işleniyor")
+        ledger = get_stock_ledger()
+        movements = plan.get("movements", [])
+        added = ctx.step("stok_defteri", lambda: ledger.record(
+            company, date_str, movements, KIND_INVOICE,
+            batch=batch_id(KIND_INVOICE, company, date_str, movements), sheet_quotas=plan.get("sheet_quotas")
+        ))
+        if movements and not added:
+            plan["logs"].append("⚠️ Bu faturanın hareketleri stok defterinde zaten var, tekrar eklenmedi.")
+        balances = ledger.balance_of(company, plan.get("quota_rows", {}))
+        quota_updates = [{'range': f'F{r}', 'values': [[balances[p]]]} for p, r in plan.get("quota_rows", {}).items()]
+
+        # Toplu İşlemler
+        ctx.progress(0.6, "Stok güncelleniyor")
+        with span("fatura.stock_update", updates=len(quota_updates), new=len(plan["new_rows"])):
+            if plan["updates"] or quota_updates:
+                ctx.step("stok_guncelle", lambda: ws_price.batch_update(plan["updates"] + quota_updates))
+                ledger.mark_synced(company, balances)
+            if plan["new_rows"]:
+                ctx.step("yeni_urun", lambda: ws_price.append_rows(plan["new_rows"]))
+                invalidate_snapshot(FILE_STOK, PRICE_SHEET_NAME)  # yeni ürünler eşleştirmeye hemen girsin
+        ctx.progress(0.85, "Cariye işleniyor")
+        with span("fatura.ledger_append", rows=len(plan["ledger"])):
+            if plan["ledger"]: ctx.step("defter", lambda: ws_company.append_rows(plan["ledger"]))
+        
+        return True, plan["logs"] + [f"📒 {p}: Yeni Stok {q}" for p, q in balances.items()]
+        
+    except JobCancelled: raise
+    except Exception as e: return False, [str(e)]
+
+def _plan_invoice(client, ws_price, df, company, date_str):
+    """Faturanın stoğa/cariye yazılacak satırlarını çıkarır (JSON'a çevrilebilir)"""
+    # 1. DUPLICATE KONTROLÜ
+    if check_invoice_duplicate(client, company, date_str):
+        return {"duplicate": True}
+    
+    with span("fatura.load_stock"):
+        # Defter durumu sayfadan önce okunur: aradaki kayıtlar düzeltme sayılmasın
+        seen = get_stock_ledger().sheet_state(company)
+        price_data = ws_price.get_all_values()
+        
         # Mevcut Stok Haritası
         product_map = {}
         for idx, row in enumerate(price_data):
@@ -143,61 +217,70 @@ def update_price_list_dataframe(df, company, date_obj):
                 # Sadece seçili firmanın ürünlerini haritalayalım
                 if db_comp == company:
                     product_map[db_prod.lower()] = {"row": idx + 1, "quota": clean_number(row[5]) if len(row) >= 6 else 0.0}
+    
+    # Ürün isimlerini, sadece o firmanın DB'sinde ara
+    with span("fatura.resolve_names", lines=len(df)):
+        final_names = [resolve_product_name(str(p), client, company) for p in df["ÜRÜN ADI"]]
+    
+    updates_batch = []
+    new_rows_batch = []
+    company_log_rows = []
+    log_messages = []
+    movements = []          # stok defteri: [ürün, +miktar, birim, fiyat]
+    sheet_quotas = {}       # defterle mutabakat: [sayfadaki KALAN KOTA, okunan bakiye, son yazılan]
+    quota_rows = {}         # KALAN KOTA'sı defter bakiyesiyle yazılacak satırlar
+    
+    for (index, row), final_prod in zip(df.iterrows(), final_names):
         
-        updates_batch = []
-        new_rows_batch = []
-        company_log_rows = []
+        fiyat = clean_number(row["BİRİM FİYAT"])
+        miktar = clean_number(row["MİKTAR"])
+        birim = str(row["BİRİM"]).upper()
+        tutar = fiyat * miktar
         
-        for index, row in df.iterrows():
-            raw_prod = str(row["ÜRÜN ADI"])
-            # Ürün ismini, sadece o firmanın DB'sinde ara
-            final_prod = resolve_product_name(raw_prod, client, company)
-            
-            fiyat = clean_number(row["BİRİM FİYAT"])
-            miktar = clean_number(row["MİKTAR"])
-            birim = str(row["BİRİM"]).upper()
-            tutar = fiyat * miktar
-            
-            if fiyat == 0: continue
-            
-            key = final_prod.lower()
-            
-            # Güncelleme mi Yeni mi?
-            if key in product_map:
-                item = product_map[key]
-                # FATURA GİRİŞİ -> STOK ARTAR (+)
-                new_quota = item['quota'] + miktar
-                
-                updates_batch.append({'range': f'C{item["row"]}', 'values': [[fiyat]]}) # Yeni Fiyat
-                updates_batch.append({'range': f'E{item["row"]}', 'values': [[date_str]]}) # Güncelleme Tarihi
-                updates_batch.append({'range': f'F{item["row"]}', 'values': [[new_quota]]}) # Kota Artır
-                updates_batch.append({'range': f'G{item["row"]}', 'values': [[birim]]})
-                
-                log_messages.append(f"➕ EKLENDİ: {final_prod} -> +{miktar} {birim} (Yeni Stok: {new_quota})")
-            else:
-                # Yeni Ürün (Kota = Miktar)
-                new_rows_batch.append([company, final_prod, fiyat, "TL", date_str, miktar, birim])
-                log_messages.append(f"✨ YENİ ÜRÜN: {final_prod} ({miktar} {birim})")
-            
-            # Firma Sayfasına Log (Cari Kaydı)
-            company_log_rows.append([
-                date_str, 
-                final_prod, 
-                miktar, 
-                birim, 
-                fiyat, 
-                f"{tutar:.2f}", 
-                "Fatura Girişi" # Bu ifade duplicate kontrolü için önemli
-            ])
-                
-        # Toplu İşlemler
-        if updates_batch: ws_price.batch_update(updates_batch)
-        if new_rows_batch: ws_price.append_rows(new_rows_batch)
-        if company_log_rows: ws_company.append_rows(company_log_rows)
+        if fiyat == 0: continue
         
-        return True, log_messages
+        key = final_prod.lower()
         
-    except Exception as e: return False, [str(e)]
+        # Güncelleme mi Yeni mi?
+        if key in product_map:
+            item = product_map[key]
+            # FATURA GİRİŞİ -> STOK ARTAR (+); kota hücresi yazma anında defterden
+            updates_batch.append({'range': f'C{item["row"]}', 'values': [[fiyat]]}) # Yeni Fiyat
+            updates_batch.append({'range': f'E{item["row"]}', 'values': [[date_str]]}) # Güncelleme Tarihi
+            updates_batch.append({'range': f'G{item["row"]}', 'values': [[birim]]})
+            sheet_quotas[final_prod] = [item['quota'], *seen.get(product_key(final_prod), [None, None])]
+            quota_rows[final_prod] = item['row']
+            
+            log_messages.append(f"➕ EKLENDİ: {final_prod} -> +{miktar} {birim}")
+        else:
+            # Yeni Ürün (Kota = Miktar)
+            new_rows_batch.append([company, final_prod, fiyat, "TL", date_str, miktar, birim])
+            log_messages.append(f"✨ YENİ ÜRÜN: {final_prod} ({miktar} {birim})")
+        movements.append([final_prod, miktar, birim, fiyat])
+        
+        # Firma Sayfasına Log (Cari Kaydı)
+        company_log_rows.append([
+            date_str, 
+            final_prod, 
+            miktar, 
+            birim, 
+            fiyat, 
+            f"{tutar:.2f}", 
+            "Fatura Girişi" # Bu ifade duplicate kontrolü için önemli
+        ])
+    
+    return {
+        "updates": updates_batch, "new_rows": new_rows_batch, "ledger": company_log_rows, "logs": log_messages,
+        "movements": movements, "sheet_quotas": sheet_quotas, "quota_rows": quota_rows,
+    }
+
+@register("fatura.kaydet")
+def invoice_commit_job(ctx, rows, company, date_str):
+    """Arka plan işi: onaylanan fatura satırlarını stoğa ve cariye işler"""
+    ok, logs = update_price_list_dataframe(pd.DataFrame(rows), company, datetime.strptime(date_str, "%d.%m.%Y"), ctx=ctx)
+    if not ok:
+        raise JobError(logs[0] if isinstance(logs, list) else logs)
+    return {"company": company, "logs": logs}
 
 # --- ARAYÜZ ---
 def render_page(sel_model):
@@ -216,32 +299,53 @@ def render_page(sel_model):
     c1, c2 = st.columns(2)
     selected_company = c1.selectbox("Firma Seç", companies)
     selected_date = c2.date_input("Fatura Tarihi", datetime.now())
+    render_ledger_panel(selected_company)
 
     # 2. DOSYA YÜKLEME
     uploaded_file = st.file_uploader("Fatura Yükle (PDF/Resim)", type=['pdf', 'jpg', 'png', 'jpeg'])
     
     if uploaded_file and st.button("🔍 Faturayı Analiz Et", type="primary"):
         with st.spinner("AI ürünleri okuyor..."):
-            s, raw_text = analyze_invoice_file(uploaded_file, sel_model)
+            # Satırlar model yazdıkça tabloya düşer
+            canli = st.empty()
+            s, res = analyze_invoice_file(uploaded_file, sel_model, on_rows=lambda df: canli.dataframe(df, use_container_width=True))
+            canli.empty()
             if s:
-                st.session_state['fatura_df'] = text_to_dataframe_fatura(raw_text)
+                for w in res.attrs.get('uyarilar', []): st.warning(w)
+                st.session_state['fatura_df'] = res
             else:
-                st.error(f"Hata: {raw_text}")
+                st.error(f"Hata: {res}")
     
     # 3. KONTROL VE KAYIT
     if 'fatura_df' in st.session_state:
         st.subheader("Ürün Kontrolü")
         edited_df = st.data_editor(st.session_state['fatura_df'], num_rows="dynamic", use_container_width=True)
         
-        if st.button("💾 Kaydet ve Stok İşle", type="primary"):
-            with st.spinner("Stok artırılıyor ve cariye işleniyor..."):
-                success, logs = update_price_list_dataframe(edited_df, selected_company, selected_date)
-                
-                if success:
-                    st.balloons()
-                    st.success(f"✅ {selected_company} Faturası başarıyla işlendi!")
-                    with st.expander("Detaylar", expanded=True):
-                        for log in logs: st.text(log)
-                    del st.session_state['fatura_df']
-                else:
-                    st.error(logs[0]) # Hata mesajını göster
+        if st.button("💾 Kaydet ve Stok İşle", type="primary", disabled='fatura_job' in st.session_state):
+            # Elle düzeltilen ürün adları kayıt başarılı olunca sözlüğe yazılır (bkz. on_done)
+            st.session_state['fatura_duzeltmeler'] = (selected_company, st.session_state['fatura_df'], edited_df)
+            # Kayıt arka planda koşar; sayfa yenilense de yarım kalmaz
+            st.session_state['fatura_job'] = submit(
+                "fatura.kaydet",
+                {"rows": edited_df.to_dict('records'), "company": selected_company, "date_str": selected_date.strftime("%d.%m.%Y")},
+                label=f"{selected_company} faturası"
+            )
+    
+    if 'fatura_job' in st.session_state:
+        def on_done(result):
+            logs = result["logs"]
+            # Düzeltilen ürün adları sözlüğe: aynı firmanın sonraki faturalarında doğrudan eşleşir
+            pending = st.session_state.pop('fatura_duzeltmeler', None)
+            if pending:
+                learned = record_corrections(client, *pending)
+                if learned: logs = logs + [f"📚 {learned} yeni eşleşme öğrenildi"]
+            st.session_state['fatura_logs'] = logs
+            st.session_state.pop('fatura_df', None)
+        render_job(st.session_state['fatura_job'], on_done)
+        if st.session_state.get(f"job_done_{st.session_state['fatura_job']}"):
+            del st.session_state['fatura_job']
+    
+    if 'fatura_logs' in st.session_state:
+        st.balloons()
+        with st.expander("Detaylar", expanded=True):
+            for log in st.session_state.pop('fatura_logs'): st.text(log)
@@ -1,21 +1,29 @@
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
 import json
 import difflib
 import re 
 import os
+import threading
+import time
+import hashlib
+from collections import defaultdict
 from modules.utils import (
     get_gspread_client, 
     get_drive_service,
     find_folder_id,
+    get_sheet_snapshot,
+    invalidate_snapshot,
+    SNAPSHOT_TTL,
+    LOCAL_DATA_DIR,
     FILE_FINANS, 
     SHEET_YATILI, 
     SHEET_GUNDUZLU, 
     SHEET_FINANS_AYARLAR
 )
-
-genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+from modules.tracing import span, traced
+from modules.extraction import ExtractionSpec, extract_safe
+from modules.jobs import INLINE, register, submit, render_job
 
 # --- YENİ EKLENEN FONKSİYON: TÜRKÇE BAŞLIK DÜZENLEME ---
 def tr_title_case(metin):
@@ -52,8 +60,10 @@ def tr_title_case(metin):
 # --- DRIVE İŞLEMLERİ ---
 def download_file_from_drive(service, file_id):
     try:
-        request = service.files().get_media(fileId=file_id)
-        return request.execute()
+        with span("drive.files.get_media") as s:
+            data = service.files().get_media(fileId=file_id).execute()
+            s.set(bytes=len(data or b''))
+        return data
     except Exception as e:
         st.error(f"Drive İndirme Hatası: {e}")
         return None
@@ -68,27 +78,132 @@ def move_and_rename_file_in_drive(service, file_id, source_folder_id, destinatio
         file_metadata = {}
         if new_name:
             file_metadata['name'] = sanitize_filename(new_name)
-        service.files().update(
-            fileId=file_id,
-            addParents=destination_folder_id, 
-            removeParents=source_folder_id,
-            body=file_metadata,
-            fields='id, parents, name'
-        ).execute()
+        with span("drive.files.update"):
+            service.files().update(
+                fileId=file_id,
+                addParents=destination_folder_id, 
+                removeParents=source_folder_id,
+                body=file_metadata,
+                fields='id, parents, name'
+            ).execute()
         return True
     except Exception as e:
         st.error(f"Dosya taşıma hatası: {e}")
         return False
 
+def list_files_in_folder(service, folder_id):
+    """Klasördeki tüm dosyalar (sayfalama dahil)"""
+    files, token = [], None
+    while True:
+        with span("drive.files.list"):
+            res = service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields="nextPageToken, files(id, name, mimeType)",
+                pageSize=1000, pageToken=token
+            ).execute()
+        files.extend(res.get('files', []))
+        token = res.get('nextPageToken')
+        if not token: return files
+
+# --- TOPLU ARŞİVLEME ---
+DRIVE_BATCH_SIZE = 100           # Drive batch uç noktasının istek başına üst sınırı
+DRIVE_RETRY_STATUSES = {429, 500, 502, 503, 504}
+DRIVE_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}  # sadece bu 403'ler geçici
+
+class DriveArchiver:
+    """
+    Taşı + yeniden adlandır işlemlerini biriktirir ve Drive'ın batch HTTP uç
+    noktasıyla gruplar halinde gönderir. Her işlemin sonucu ayrı raporlanır;
+    yeniden denemede sadece geçici hata alanlar tekrar gönderilir.
+    """
+
+    def __init__(self, service, batch_size=DRIVE_BATCH_SIZE, max_retries=3):
+        self.service = service
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.ops = {}  # file_id -> işlem (aynı dosya iki kez eklenmez)
+
+    def add(self, file_id, source_folder_id, destination_folder_id, new_name=None):
+        self.ops[file_id] = {
+            'fileId': file_id,
+            'addParents': destination_folder_id,
+            'removeParents': source_folder_id,
+            'body': {'name': sanitize_filename(new_name)} if new_name else {},
+            'fields': 'id, parents, name'
+        }
+
+    def flush(self):
+        """({başarılı file_id listesi}, {file_id: hata mesajı}) döndürür."""
+        pending = list(self.ops.values())
+        basarili, hatalar = [], {}
+        for deneme in range(self.max_retries + 1):
+            if deneme: time.sleep(2 ** (deneme - 1))
+            failed = self._send(pending)
+            basarili += [op['fileId'] for op in pending if op['fileId'] not in failed]
+            pending = []
+            for op in self.ops.values():
+                exc = failed.get(op['fileId'])
+                if exc is None: continue
+                hatalar[op['fileId']] = str(exc)
+                if self._is_retryable(exc): pending.append(op)
+            if not pending: break
+            if deneme < self.max_retries:
+                for op in pending: hatalar.pop(op['fileId'], None)
+        self.ops = {}
+        return basarili, hatalar
+
+    def _send(self, ops):
+        failed = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None: failed[request_id] = exception
+
+        for i in range(0, len(ops), self.batch_size):
+            chunk = ops[i:i + self.batch_size]
+            batch = self.service.new_batch_http_request(callback=callback)
+            for op in chunk:
+                batch.add(self.service.files().update(**op), request_id=op['fileId'])
+            try:
+                with span("drive.batch", ops=len(chunk)):
+                    batch.execute()
+            except Exception as e:
+                # Batch isteğinin kendisi düştü — gruptaki her işlem hatalı sayılır
+                for op in chunk: failed.setdefault(op['fileId'], e)
+        return failed
+
+    @staticmethod
+    def _error_reasons(exc):
+        """HttpError gövdesindeki error.errors[].reason değerleri"""
+        details = getattr(exc, 'error_details', None)
+        if isinstance(details, list):
+            reasons = {d.get('reason') for d in details if isinstance(d, dict)}
+            if reasons - {None}: return reasons
+        try:
+            body = json.loads(getattr(exc, 'content', b'') or b'{}')
+            return {e.get('reason') for e in body.get('error', {}).get('errors', [])}
+        except (ValueError, AttributeError, TypeError):
+            return set()
+
+    @staticmethod
+    def _is_retryable(exc):
+        status = getattr(getattr(exc, 'resp', None), 'status', None)
+        if status is None: return True
+        # Yetki/sahiplik 403'leri (paylaşılmamış klasör vb.) hemen hata; kota 403'leri beklenip denenir
+        if int(status) == 403: return bool(DriveArchiver._error_reasons(exc) & DRIVE_RATE_LIMIT_REASONS)
+        return int(status) in DRIVE_RETRY_STATUSES
+
 # --- DATABASE İŞLEMLERİ ---
-def get_data(sheet_name):
-    try:
-        client = get_gspread_client()
-        sh = client.open(FILE_FINANS) 
-        ws = sh.worksheet(sheet_name)
-        data = ws.get_all_records()
-        return pd.DataFrame(data)
-    except: return pd.DataFrame()
+def _a1(row, col):
+    """(3, 28) -> 'AB3'; gspread.utils'i açılışta yüklememek için yerel karşılık"""
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return f"{letters}{row}"
+
+def get_data(sheet_name, ttl=SNAPSHOT_TTL):
+    # Önbellekteki görüntünün kopyası — çağıran taraf sütunları değiştirebilir
+    return get_sheet_snapshot(FILE_FINANS, sheet_name, ttl).df.copy()
 
 def get_current_unit_price():
     try:
@@ -136,54 +251,375 @@ def distribute_yatili_installments(total_fee, year):
         
         ws_set = sh.worksheet(SHEET_FINANS_AYARLAR)
         ws_set.append_row([year, '', total_fee], value_input_option='USER_ENTERED')
+        invalidate_snapshot(FILE_FINANS, SHEET_YATILI)
+        _AGGREGATES.rebuild()
         
         return True, f"{len(student_names)} öğrenci güncellendi."
     except Exception as e: return False, str(e)
 
+# --- ÖZET DEPOSU (ANA SAYFA) ---
+AGGREGATE_REBUILD_TTL = 3600  # elle yapılan sayfa düzenlemelerini yakalamak için
+AGGREGATE_FILE = os.path.join(LOCAL_DATA_DIR, "finans_ozet.json")
+TAKSIT_SAYISI = 4
+
+def _month_key(tarih):
+    """'2025-01-15' / '15.01.2025' -> '2025-01'; okunamazsa bu ay"""
+    s = str(tarih or '').strip()
+    m = re.match(r'(\d{4})-(\d{1,2})', s)
+    if m: return f"{m.group(1)}-{int(m.group(2)):02d}"
+    m = re.match(r'\d{1,2}[./](\d{1,2})[./](\d{4})', s)
+    if m: return f"{m.group(2)}-{int(m.group(1)):02d}"
+    return time.strftime("%Y-%m")
+
+def _installment_coverage(paid, tot_fee):
+    """Ödenen tutarın taksitlere sırayla dağılımı: [t1, t2, t3, t4]"""
+    inst = tot_fee / TAKSIT_SAYISI if tot_fee > 0 else 0.0
+    return [min(max(paid - k * inst, 0.0), inst) for k in range(TAKSIT_SAYISI)]
+
+class FinanceAggregates:
+    """
+    Ana sayfa metrikleri için önceden hesaplanmış toplamlar.
+    Tam hesap sadece kurulumda (ve saatte bir) yapılır; işlenen her ödeme
+    apply_* ile artımlı eklenir. Aylık yatılı tahsilat sayfada tarihli tutulmadığı
+    için diske yazılır ve yeniden kurulumda korunur.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built_at = 0.0
+        self.ogrenci_sayisi = 0
+        self.toplam_beklenti = 0.0
+        self.toplam_tahsilat = 0.0
+        self.by_class = {}        # sınıf -> {ogrenci, beklenti, tahsilat}
+        self.by_installment = {}  # taksit_no -> tahsil edilen
+        self.by_month = {}        # 'YYYY-MM' -> {yatili, gunduzlu}
+        self._load_month_history()
+
+    # --- Tam hesap ---
+    def rebuild(self):
+        snap_y = get_sheet_snapshot(FILE_FINANS, SHEET_YATILI)
+        snap_g = get_sheet_snapshot(FILE_FINANS, SHEET_GUNDUZLU)
+        if not (snap_y.ok and snap_g.ok):
+            # Okunamadı: eski toplamlar korunur, built_at damgalanmaz; sonraki çağrı yeniden dener
+            return False
+        df_y, df_g = snap_y.df, snap_g.df
+        with self._lock:
+            self.by_class, self.by_installment = {}, {k: 0.0 for k in range(1, TAKSIT_SAYISI + 1)}
+            self.ogrenci_sayisi, self.toplam_beklenti, self.toplam_tahsilat = 0, 0.0, 0.0
+
+            if not df_y.empty and {'Toplam_Yillik_Ucret', 'Odenen_Toplam'} <= set(df_y.columns):
+                ucret = pd.to_numeric(df_y['Toplam_Yillik_Ucret'], errors='coerce').fillna(0)
+                odenen = pd.to_numeric(df_y['Odenen_Toplam'], errors='coerce').fillna(0)
+                sinif = df_y['Sinif'].astype(str).str.strip().replace('', 'Belirsiz') if 'Sinif' in df_y.columns else pd.Series('Belirsiz', index=df_y.index)
+
+                self.ogrenci_sayisi = len(df_y)
+                self.toplam_beklenti = float(ucret.sum())
+                self.toplam_tahsilat = float(odenen.sum())
+
+                grp = pd.DataFrame({'sinif': sinif, 'ucret': ucret, 'odenen': odenen}).groupby('sinif')
+                for s_name, row in grp.agg(ogrenci=('ucret', 'size'), beklenti=('ucret', 'sum'), tahsilat=('odenen', 'sum')).iterrows():
+                    self.by_class[s_name] = {'ogrenci': int(row['ogrenci']), 'beklenti': float(row['beklenti']), 'tahsilat': float(row['tahsilat'])}
+
+                inst = ucret / TAKSIT_SAYISI
+                for k in range(TAKSIT_SAYISI):
+                    self.by_installment[k + 1] = float((odenen - k * inst).clip(lower=0).clip(upper=inst).sum())
+
+            # Gündüzlü yemek ödemeleri sayfada tarihli — aylık kısmı her seferinde baştan
+            for month in self.by_month.values(): month['gunduzlu'] = 0.0
+            if not df_g.empty and df_g.shape[1] >= 7:
+                aylar = df_g.iloc[:, 3].map(_month_key)
+                tutar = pd.to_numeric(df_g.iloc[:, 6], errors='coerce').fillna(0)
+                for ay, top in tutar.groupby(aylar).sum().items():
+                    self._month(ay)['gunduzlu'] = float(top)
+
+            self.built_at = time.time()
+        return True
+
+    # --- Artımlı güncellemeler ---
+    # Kurulmamış depoda toplamlar atlanır (ilk kurulum sayfadan zaten okur),
+    # ama yatılı aylık geçmiş sayfada olmadığı için her durumda yazılır.
+    def apply_yatili_payment(self, sinif, tot_fee, cur_paid, amt, tarih):
+        with self._lock:
+            self._month(_month_key(tarih))['yatili'] += amt
+            self._save_month_history()
+            if not self.built_at: return
+            sinif = str(sinif or '').strip() or 'Belirsiz'
+            self.toplam_tahsilat += amt
+            c = self.by_class.setdefault(sinif, {'ogrenci': 0, 'beklenti': 0.0, 'tahsilat': 0.0})
+            c['tahsilat'] += amt
+            eski = _installment_coverage(cur_paid, tot_fee)
+            yeni = _installment_coverage(cur_paid + amt, tot_fee)
+            for k in range(TAKSIT_SAYISI):
+                self.by_installment[k + 1] = self.by_installment.get(k + 1, 0.0) + yeni[k] - eski[k]
+
+    def apply_gunduzlu_payment(self, amt, tarih):
+        with self._lock:
+            if not self.built_at: return
+            self._month(_month_key(tarih))['gunduzlu'] += amt
+
+    # --- Görünümler ---
+    @property
+    def kalan_alacak(self):
+        return self.toplam_beklenti - self.toplam_tahsilat
+
+    @property
+    def tahsilat_orani(self):
+        return (self.toplam_tahsilat / self.toplam_beklenti) * 100 if self.toplam_beklenti > 0 else 0.0
+
+    def class_frame(self):
+        rows = [{'Sınıf': k, 'Öğrenci': v['ogrenci'], 'Beklenen': v['beklenti'], 'Tahsilat': v['tahsilat']} for k, v in sorted(self.by_class.items())]
+        return pd.DataFrame(rows)
+
+    def month_frame(self):
+        rows = [{'Ay': k, 'Yatılı': v['yatili'], 'Gündüzlü': v['gunduzlu']} for k, v in sorted(self.by_month.items())]
+        return pd.DataFrame(rows).set_index('Ay') if rows else pd.DataFrame()
+
+    def installment_frame(self):
+        return pd.DataFrame({'Taksit': [f"Taksit {k}" for k in self.by_installment], 'Tahsilat': list(self.by_installment.values())})
+
+    # --- İç yardımcılar ---
+    def _month(self, ay):
+        return self.by_month.setdefault(ay, {'yatili': 0.0, 'gunduzlu': 0.0})
+
+    def _load_month_history(self):
+        try:
+            with open(AGGREGATE_FILE, encoding='utf-8') as f:
+                for ay, top in json.load(f).items():
+                    self._month(ay)['yatili'] = float(top)
+        except (OSError, ValueError): pass
+
+    def _save_month_history(self):
+        try:
+            os.makedirs(LOCAL_DATA_DIR, exist_ok=True)
+            with open(AGGREGATE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({ay: v['yatili'] for ay, v in self.by_month.items() if v['yatili']}, f)
+        except OSError: pass
+
+_AGGREGATES = FinanceAggregates()
+
+def get_finance_aggregates():
+    """Ana sayfa özetini döndürür; ilk çağrıda ya da süre dolunca baştan kurar."""
+    if time.time() - _AGGREGATES.built_at > AGGREGATE_REBUILD_TTL:
+        _AGGREGATES.rebuild()
+    return _AGGREGATES
+
 # --- İŞ MANTIĞI ---
-def find_best_match(name, name_list):
-    matches = difflib.get_close_matches(name, name_list, n=1, cutoff=0.6)
-    return matches[0] if matches else None
+_TR_FOLD = str.maketrans("ıçğöşü", "icgosu")
 
-def process_yatili_payment(analiz, dekont_link):
+def tr_name_key(metin):
+    """
+    İsmi eşleştirme anahtarına çevirir: tr_title_case'teki I/İ kuralıyla küçültür,
+    Türkçe harfleri sadeleştirir (dekontlarda ASCII yazım sık), noktalamayı atar
+    ve kelimeleri alfabetik sıralar.
+    Örnek: "YILMAZ, Ali İhsan" -> "ali ihsan yilmaz"
+    """
+    if not metin:
+        return ""
+    kucuk = str(metin).replace('I', 'ı').replace('İ', 'i').lower().translate(_TR_FOLD)
+    kucuk = re.sub(r'[^\w\s]', ' ', kucuk)
+    return " ".join(sorted(kucuk.split()))
+
+def tr_tc_key(tc):
+    """TC numarasından sadece rakamları bırakır, 11 hane değilse boş döner."""
+    rakamlar = re.sub(r'\D', '', str(tc or ''))
+    return rakamlar if len(rakamlar) == 11 else ""
+
+class StudentNameIndex:
+    """
+    Bir sayfa görüntüsü (DataFrame) için bir kez kurulan öğrenci arama indeksi.
+    Sıra: 1) TC birebir  2) normalize isim birebir  3) ortak kelimesi olan
+    adaylar arasında bulanık eşleştirme  4) son çare tüm liste.
+    """
+
+    def __init__(self, df, name_col='Ad_Soyad', tc_col=None):
+        self.names = []
+        self.keys = []
+        self.by_key = {}
+        self.by_tc = {}
+        self.by_token = defaultdict(set)
+
+        if df is None or df.empty or name_col not in df.columns:
+            return
+
+        if tc_col is None:
+            tc_col = next((c for c in df.columns if 'tc' in str(c).lower()), None)
+
+        isimler = df[name_col].astype(str).tolist()
+        tcler = df[tc_col].tolist() if tc_col in df.columns else [None] * len(isimler)
+
+        for pos, (isim, tc) in enumerate(zip(isimler, tcler)):
+            key = tr_name_key(isim)
+            self.names.append(isim.strip())
+            self.keys.append(key)
+            if not key:
+                continue
+            self.by_key.setdefault(key, pos)
+            for token in key.split():
+                self.by_token[token].add(pos)
+            tc_key = tr_tc_key(tc)
+            if tc_key:
+                self.by_tc.setdefault(tc_key, pos)
+
+    def match(self, name, tc=None, cutoff=0.6):
+        """
+        (satır_no, bulunan_isim, güven) döndürür. satır_no DataFrame'deki konumdur.
+        Bulunamazsa (None, None, 0.0).
+        """
+        tc_key = tr_tc_key(tc)
+        if tc_key and tc_key in self.by_tc:
+            pos = self.by_tc[tc_key]
+            return pos, self.names[pos], 1.0
+
+        key = tr_name_key(name)
+        if not key:
+            return None, None, 0.0
+        if key in self.by_key:
+            pos = self.by_key[key]
+            return pos, self.names[pos], 1.0
+
+        adaylar = set()
+        for token in key.split():
+            adaylar |= self.by_token.get(token, set())
+
+        best = self._best_of(key, adaylar)
+        if best[2] < cutoff:
+            # Tüm kelimeler OCR'da bozulmuş olabilir — tüm listeye bak
+            best = max(best, self._best_of(key, range(len(self.keys))), key=lambda x: x[2])
+        if best[2] < cutoff:
+            return None, None, best[2]
+        return best
+
+    def match_many(self, items, cutoff=0.6):
+        """[(isim, tc), ...] listesi için match sonuçlarını aynı sırada döndürür."""
+        return [self.match(isim, tc, cutoff) for isim, tc in items]
+
+    def _best_of(self, key, positions):
+        best = (None, None, 0.0)
+        sm = difflib.SequenceMatcher(autojunk=False)
+        sm.set_seq2(key)
+        for pos in positions:
+            aday = self.keys[pos]
+            if not aday:
+                continue
+            sm.set_seq1(aday)
+            # Ucuz üst sınırlar tutmuyorsa tam oranı hesaplama
+            if sm.real_quick_ratio() <= best[2] or sm.quick_ratio() <= best[2]:
+                continue
+            oran = sm.ratio()
+            if oran > best[2]:
+                best = (pos, self.names[pos], oran)
+        return best
+
+def _to_float(val):
+    try: return float(str(val).replace(',', '') or 0)
+    except ValueError: return 0.0
+
+@traced("finans.process_yatili_payments_bulk")
+def process_yatili_payments_bulk(analizler):
+    """
+    Birden çok taksit dekontunu tek okuma + tek batch_update ile işler.
+    Her dekont için (başarı, mesaj, taksit_no, güven) döndürür.
+    """
     try:
         client = get_gspread_client()
         sh = client.open(FILE_FINANS)
         ws = sh.worksheet(SHEET_YATILI)
-        df = pd.DataFrame(ws.get_all_records())
-        
-        aranan = analiz.get('ogrenci_ad', '')
-        # Buraya da bir koruma ekleyelim, listeden ararken temiz olsun
-        aranan = tr_title_case(aranan) 
-        
-        bulunan = find_best_match(aranan, df['Ad_Soyad'].tolist())
-        if not bulunan: return False, f"'{aranan}' bulunamadı.", 0
-            
-        row_idx = df[df['Ad_Soyad'] == bulunan].index[0]
-        sh_row = row_idx + 2 
-        
-        cur_paid = float(str(df.at[row_idx, 'Odenen_Toplam']).replace(',', '') or 0)
-        tot_fee = float(str(df.at[row_idx, 'Toplam_Yillik_Ucret']).replace(',', '') or 0)
-        amt = float(analiz.get('tutar', 0))
-        
-        new_paid = cur_paid + amt
-        new_rem = tot_fee - new_paid
-        
-        ws.update_cell(sh_row, df.columns.get_loc('Odenen_Toplam')+1, new_paid)
-        ws.update_cell(sh_row, df.columns.get_loc('Kalan_Borc')+1, new_rem)
-        
-        taksit_tutari = tot_fee / 4.0 if tot_fee > 0 else 1
-        taksit_no = int(cur_paid / taksit_tutari) + 1
-        return True, f"{bulunan}: {amt} TL işlendi.", taksit_no
-    except Exception as e: return False, f"Hata: {e}", 0
+        # Yazmadan önce taze okuma; indeks bu görüntüye bağlı kurulur
+        snap = get_sheet_snapshot(FILE_FINANS, SHEET_YATILI, ttl=0, ws=ws)
+        df = snap.df
+        if df.empty: return [(False, "Yatılı listesi okunamadı.", 0, 0.0) for _ in analizler]
+        index = snap.derived('student_index', StudentNameIndex)
 
-def write_to_gunduzlu_sheet(analiz, dekont_link):
-    try:
-        client = get_gspread_client()
-        sh = client.open(FILE_FINANS)
-        ws = sh.worksheet(SHEET_GUNDUZLU)
+        col_paid = df.columns.get_loc('Odenen_Toplam') + 1
+        col_rem = df.columns.get_loc('Kalan_Borc') + 1
+        paid_now = {}
+        applied = []
+        sonuclar = []
+
+        for analiz in analizler:
+            # Buraya da bir koruma ekleyelim, listeden ararken temiz olsun
+            aranan = tr_title_case(analiz.get('ogrenci_ad', ''))
+            row_idx, bulunan, guven = index.match(aranan, analiz.get('ogrenci_tc'))
+            if row_idx is None:
+                sonuclar.append((False, f"'{aranan}' bulunamadı.", 0, guven))
+                continue
+
+            cur_paid = paid_now.get(row_idx, _to_float(df.iat[row_idx, col_paid - 1]))
+            tot_fee = _to_float(df.at[row_idx, 'Toplam_Yillik_Ucret'])
+            amt = float(analiz.get('tutar', 0))
+            paid_now[row_idx] = cur_paid + amt
+            applied.append((df.at[row_idx, 'Sinif'] if 'Sinif' in df.columns else '', tot_fee, cur_paid, amt, analiz.get('tarih')))
+
+            taksit_tutari = tot_fee / 4.0 if tot_fee > 0 else 1
+            taksit_no = int(cur_paid / taksit_tutari) + 1
+            sonuclar.append((True, f"{bulunan}: {amt} TL işlendi. (eşleşme %{guven * 100:.0f})", taksit_no, guven))
+
+        updates = []
+        for row_idx, new_paid in paid_now.items():
+            sh_row = row_idx + 2
+            new_rem = _to_float(df.at[row_idx, 'Toplam_Yillik_Ucret']) - new_paid
+            updates.append({'range': _a1(sh_row, col_paid), 'values': [[new_paid]]})
+            updates.append({'range': _a1(sh_row, col_rem), 'values': [[new_rem]]})
+        if updates:
+            ws.batch_update(updates)
+            invalidate_snapshot(FILE_FINANS, SHEET_YATILI)
+            for args in applied: _AGGREGATES.apply_yatili_payment(*args)
+
+        return sonuclar
+    except Exception as e:
+        return [(False, f"Hata: {e}", 0, 0.0) for _ in analizler]
+
+def process_yatili_payment(analiz, dekont_link):
+    ok, msg, taksit_no, _ = process_yatili_payments_bulk([analiz])[0]
+    return ok, msg, taksit_no
+
+# --- GÜNDÜZLÜ YAZMA TAMPONU ---
+GUNDUZLU_KEY_HEADER = "Islem_Anahtari"
+GUNDUZLU_KEY_COL = 10          # J sütunu
+GUNDUZLU_KEY_TTL = 3600        # elle silinen satırlar için anahtar indeksi saatte bir tazelenir
+
+def gunduzlu_idempotency_key(file_id, tutar, tarih):
+    """Aynı dekontun (Drive dosyası + tutar + tarih) ikinci kez yazılmasını engelleyen anahtar"""
+    ham = f"{file_id}|{float(tutar or 0):.2f}|{str(tarih or '').strip()}"
+    return hashlib.sha1(ham.encode('utf-8')).hexdigest()[:16]
+
+def _file_id_from_link(link):
+    m = re.search(r'/d/([\w-]+)', str(link or ''))
+    return m.group(1) if m else str(link or '')
+
+class GunduzluAppendBuffer:
+    """
+    Onaylanan gündüzlü satırlarını biriktirip tek append_rows ile yazar.
+    Yazılmış anahtarlar süreç genelinde yerel bir kümede tutulur; tekrar tıklama
+    veya rerun sayfayı yeniden okumadan reddedilir.
+    """
+    _known_keys = set()
+    _keys_loaded_at = 0.0
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.rows = []
+        self.pending_keys = set()
+        self.written_keys = set()   # son flush'ta sayfaya gerçekten yazılan anahtarlar
+
+    @classmethod
+    def _load_keys(cls, ws):
+        if time.time() - cls._keys_loaded_at < GUNDUZLU_KEY_TTL: return
+        col = ws.col_values(GUNDUZLU_KEY_COL)
+        if not col or col[0] != GUNDUZLU_KEY_HEADER:
+            try: ws.update(values=[[GUNDUZLU_KEY_HEADER]], range_name=_a1(1, GUNDUZLU_KEY_COL))
+            except Exception: pass
+        cls._known_keys = {k.strip() for k in col[1:] if k.strip()}
+        cls._keys_loaded_at = time.time()
+
+    def add(self, analiz, dekont_link, file_id=None):
+        """Satırı tampona ekler; anahtar zaten yazılmışsa veya tamponda varsa False döner."""
+        file_id = file_id or _file_id_from_link(dekont_link)
+        key = gunduzlu_idempotency_key(file_id, analiz.get('tutar', 0), analiz.get('tarih', ''))
+        if key in self.pending_keys or key in GunduzluAppendBuffer._known_keys:
+            return False
         # İsmi kaydederken yine de tr_title_case kullanıyoruz, garanti olsun
-        new_row = [
+        self.rows.append([
             analiz.get('ogrenci_tc', ''), 
             tr_title_case(analiz.get('ogrenci_ad', 'Bilinmiyor')), 
             '', 
@@ -192,36 +628,210 @@ def write_to_gunduzlu_sheet(analiz, dekont_link):
             '', 
             analiz.get('tutar', 0), 
             'Ödendi', 
-            dekont_link
-        ]
-        ws.append_row(new_row, value_input_option='USER_ENTERED')
+            dekont_link,
+            key
+        ])
+        self.pending_keys.add(key)
         return True
-    except: return False
 
-def analyze_receipt_with_gemini(file_data, mime_type, model_name):
-    model = genai.GenerativeModel(model_name)
-    prompt = """Sen muhasebe asistanısın. Banka dekontunu oku. JSON ver: { "tarih": "YYYY-MM-DD", "gonderen_ad_soyad": "", "tutar": 0.0, "aciklama": "", "ogrenci_tc": "", "ogrenci_ad": "", "tur_tahmini": "'YEMEK' veya 'TAKSİT'" }"""
+    def flush(self, ws=None):
+        """
+        Tampondaki satırları tek çağrıda yazar. Yazılan satır sayısını döndürür;
+        anahtar indeksine karşı son kontrol kilit altında yapılır.
+        """
+        self.written_keys = set()
+        if not self.rows: return 0
+        if ws is None:
+            ws = get_gspread_client().open(FILE_FINANS).worksheet(SHEET_GUNDUZLU)
+        with GunduzluAppendBuffer._lock:
+            GunduzluAppendBuffer._load_keys(ws)
+            rows = [r for r in self.rows if r[-1] not in GunduzluAppendBuffer._known_keys]
+            if rows:
+                ws.append_rows(rows, value_input_option='USER_ENTERED')
+                GunduzluAppendBuffer._known_keys.update(r[-1] for r in rows)
+                self.written_keys = {r[-1] for r in rows}
+        if rows:
+            invalidate_snapshot(FILE_FINANS, SHEET_GUNDUZLU)
+            for r in rows: _AGGREGATES.apply_gunduzlu_payment(float(r[6] or 0), r[3])
+        self.rows, self.pending_keys = [], set()
+        return len(rows)
+
+def write_to_gunduzlu_sheet(analiz, dekont_link, file_id=None):
+    """Tek dekont için tampon + flush. (başarı, mesaj) döndürür; tekrar kayıt başarı sayılır."""
     try:
-        response = model.generate_content([prompt, {"mime_type": mime_type, "data": file_data}])
-        return json.loads(response.text.strip().replace("```json", "").replace("```", ""))
-    except: return None
+        buf = GunduzluAppendBuffer()
+        if not buf.add(analiz, dekont_link, file_id) or buf.flush() == 0:
+            return True, "Bu dekont zaten gündüzlü listesinde kayıtlı."
+        return True, "Gündüzlü listesine işlendi."
+    except Exception: return False, "Veritabanı hatası."
+
+RECEIPT_SPEC = ExtractionSpec(
+    "dekont",
+    "Sen muhasebe asistanısın. Banka dekontunu oku. Tarihi YYYY-MM-DD ver; tur_tahmini yemek ödemesi ise 'YEMEK', yatılı taksiti ise 'TAKSİT'.",
+    {
+        "type": "OBJECT",
+        "properties": {
+            "tarih": {"type": "STRING"},
+            "gonderen_ad_soyad": {"type": "STRING"},
+            "tutar": {"type": "NUMBER"},
+            "aciklama": {"type": "STRING"},
+            "ogrenci_tc": {"type": "STRING"},
+            "ogrenci_ad": {"type": "STRING"},
+            "tur_tahmini": {"type": "STRING", "enum": ["YEMEK", "TAKSİT"]},
+        },
+        "required": ["tarih", "tutar", "tur_tahmini"],
+        "propertyOrdering": ["tarih", "gonderen_ad_soyad", "tutar", "aciklama", "ogrenci_tc", "ogrenci_ad", "tur_tahmini"],
+    },
+)
+
+def analyze_receipt_with_gemini(file_data, mime_type, model_name):
+    ok, res = extract_safe(RECEIPT_SPEC, model_name, file_data, mime_type)
+    if not ok: return None
+    # Boş bırakılan isteğe bağlı alanlar None yerine "" olsun (eski davranış)
+    return {k: ("" if v is None else v) for k, v in res.data.items()}
+
+# --- TOPLU DEKONT İŞLEME ---
+def archive_name(analiz, orig_name, taksit_no=None):
+    """Arşivdeki dosya adı: Ad_Soyad_Yemek_Tarih.ext / Ad_Soyad_TaksitN.ext"""
+    kok = sanitize_filename(analiz.get('ogrenci_ad')) if analiz.get('ogrenci_ad') else "Bilinmiyor"
+    ext = os.path.splitext(orig_name)[1]
+    if analiz.get('tur_tahmini') == 'TAKSİT':
+        return f"{kok}_Taksit{taksit_no}{ext}"
+    return f"{kok}_Yemek_{analiz.get('tarih', 'Tarihsiz')}{ext}"
+
+def process_receipts_bulk(service, items, gelen_id, arsiv_yatili_id, arsiv_gunduzlu_id, ctx=INLINE):
+    """
+    items: [(dosya_meta, analiz), ...]. Gündüzlüler tek append_rows, yatılılar tek
+    batch_update, arşiv taşımaları Drive batch ile yapılır. Dosya başına rapor döner.
+    ctx: arka plan işinden çağrılırsa her grup ayrı, devam ettirilebilir bir adımdır.
+    """
+    rapor = {m['id']: {'Dosya': m['name'], 'Öğrenci': a.get('ogrenci_ad', ''), 'Tür': a.get('tur_tahmini', ''), 'Tutar': a.get('tutar', 0), 'Durum': '', 'Arşiv': ''} for m, a in items}
+    hedefler = {}  # file_id -> (hedef klasör, yeni ad)
+
+    yemek = [(m, a) for m, a in items if a.get('tur_tahmini') != 'TAKSİT']
+    taksit = [(m, a) for m, a in items if a.get('tur_tahmini') == 'TAKSİT']
+
+    if yemek:
+        def gunduzlu_adimi():
+            buf = GunduzluAppendBuffer()
+            # Durum flush'ın gerçekten yazdığı anahtarlardan çıkar (sayfada zaten olanları add göremez)
+            eklenen = {m['id']: buf.add(a, f"https://drive.google.com/file/d/{m['id']}/view", m['id']) for m, a in yemek}
+            try:
+                buf.flush()
+            except Exception as e:
+                return {fid: [f"Veritabanı hatası: {e}", False] for fid in eklenen}
+            return {
+                m['id']: [
+                    "Gündüzlü listesine işlendi." if eklenen[m['id']] and gunduzlu_idempotency_key(m['id'], a.get('tutar', 0), a.get('tarih', '')) in buf.written_keys else "Zaten kayıtlı.",
+                    True
+                ]
+                for m, a in yemek
+            }
+
+        ctx.progress(0.1, f"{len(yemek)} gündüzlü dekont işleniyor")
+        sonuc = ctx.step("gunduzlu", gunduzlu_adimi)
+        for m, a in yemek:
+            durum, arsivle = sonuc[m['id']]
+            rapor[m['id']]['Durum'] = durum
+            if arsivle: hedefler[m['id']] = (arsiv_gunduzlu_id, archive_name(a, m['name']))
+
+    if taksit:
+        ctx.progress(0.4, f"{len(taksit)} taksit işleniyor")
+        sonuclar = ctx.step("yatili", lambda: [list(r) for r in process_yatili_payments_bulk([a for _, a in taksit])])
+        for (m, a), (ok, msg, taksit_no, _) in zip(taksit, sonuclar):
+            rapor[m['id']]['Durum'] = msg
+            if ok: hedefler[m['id']] = (arsiv_yatili_id, archive_name(a, m['name'], taksit_no))
+
+    if hedefler:
+        def arsiv_adimi():
+            arsiv = DriveArchiver(service)
+            for fid, (hedef, ad) in hedefler.items():
+                arsiv.add(fid, gelen_id, hedef, ad)
+            return arsiv.flush()
+
+        ctx.progress(0.7, f"{len(hedefler)} dosya arşivleniyor")
+        basarili, hatalar = ctx.step("arsiv", arsiv_adimi)
+        for fid in basarili: rapor[fid]['Arşiv'] = "✅"
+        for fid, err in hatalar.items(): rapor[fid]['Arşiv'] = f"❌ {err}"
+
+    return list(rapor.values())
+
+@register("finans.toplu_analiz")
+def bulk_analyze_job(ctx, files, model_name):
+    """Arka plan işi: bekleyen dekontları tek tek okur; her dosya ayrı adım (yarıda kalırsa kaldığı dosyadan sürer)"""
+    service = get_drive_service()
+    sonuc = []
+    for i, meta in enumerate(files):
+        ctx.progress(i / len(files), f"{meta['name']} okunuyor")
+        res = ctx.step(f"analiz:{meta['id']}", lambda: analyze_receipt_with_gemini(download_file_from_drive(service, meta['id']), meta['mimeType'], model_name))
+        if res:
+            res['ogrenci_ad'] = tr_title_case(res.get('ogrenci_ad', ''))
+            sonuc.append({'Onay': True, 'file_id': meta['id'], 'Dosya': meta['name'], 'ogrenci_ad': res['ogrenci_ad'], 'ogrenci_tc': res.get('ogrenci_tc', ''), 'tarih': res.get('tarih', ''), 'tutar': float(res.get('tutar', 0) or 0), 'tur_tahmini': 'TAKSİT' if res.get('tur_tahmini') == 'TAKSİT' else 'YEMEK'})
+    return sonuc
+
+@register("finans.toplu_dekont")
+def bulk_commit_job(ctx, items, gelen_id, arsiv_yatili_id, arsiv_gunduzlu_id):
+    """Arka plan işi: onaylanan dekontları işler ve arşivler"""
+    return {'rapor': process_receipts_bulk(get_drive_service(), [tuple(it) for it in items], gelen_id, arsiv_yatili_id, arsiv_gunduzlu_id, ctx=ctx)}
+
+def render_bulk_section(service, files, selected_model, gelen_id, arsiv_yatili_id, arsiv_gunduzlu_id):
+    with st.expander(f"📦 Toplu İşlem ({len(files)} dekont)", expanded='bulk_job' in st.session_state):
+        st.caption("Tüm bekleyen dekontlar analiz edilir; tabloyu kontrol edip onayladığında tek seferde işlenir ve arşivlenir. İşler arka planda sürer, sayfayı yenilemek yarıda bırakmaz.")
+        busy = 'bulk_job' in st.session_state
+        if st.button("🚀 Tümünü Analiz Et", key="bulk_analyze", disabled=busy):
+            st.session_state['bulk_job'] = submit("finans.toplu_analiz", {'files': files, 'model_name': selected_model}, label=f"{len(files)} dekont analizi")
+
+        if busy:
+            job_id = st.session_state['bulk_job']
+
+            def on_done(result):
+                if isinstance(result, dict):
+                    st.session_state['bulk_report'] = result['rapor']
+                    st.session_state.pop('bulk_analysis', None)
+                else:
+                    st.session_state['bulk_analysis'] = pd.DataFrame(result or [])
+            render_job(job_id, on_done)
+            if st.session_state.get(f"job_done_{job_id}"):
+                del st.session_state['bulk_job']
+
+        if 'bulk_analysis' in st.session_state and not st.session_state['bulk_analysis'].empty:
+            edited = st.data_editor(
+                st.session_state['bulk_analysis'], hide_index=True, use_container_width=True,
+                disabled=['file_id', 'Dosya'],
+                column_config={'tur_tahmini': st.column_config.SelectboxColumn("Tür", options=["YEMEK", "TAKSİT"]), 'file_id': None}
+            )
+            if st.button("✅ Seçilenleri İşle ve Arşivle", key="bulk_commit", disabled=busy):
+                meta_by_id = {f['id']: f for f in files}
+                items = []
+                for row in edited[edited['Onay']].to_dict('records'):
+                    if row['file_id'] not in meta_by_id: continue
+                    analiz = {k: row[k] for k in ['ogrenci_ad', 'ogrenci_tc', 'tarih', 'tutar', 'tur_tahmini']}
+                    analiz['ogrenci_ad'] = tr_title_case(analiz['ogrenci_ad'])
+                    items.append((meta_by_id[row['file_id']], analiz))
+                st.session_state['bulk_job'] = submit("finans.toplu_dekont", {
+                    'items': items, 'gelen_id': gelen_id, 'arsiv_yatili_id': arsiv_yatili_id, 'arsiv_gunduzlu_id': arsiv_gunduzlu_id
+                }, label=f"{len(items)} dekont işleme")
+                st.rerun()
+
+        if 'bulk_report' in st.session_state:
+            st.dataframe(pd.DataFrame(st.session_state.pop('bulk_report')), hide_index=True, use_container_width=True)
 
 # --- ARAYÜZ ---
 def render_page(selected_model):
     st.header("💰 Finans Yönetimi")
-    tab1, tab2, tab3, tab4 = st.tabs(["🏫 Yatılı", "🍽️ Gündüzlü", "🤖 Dekont İşle (Drive)", "⚙️ Ayarlar"])
+    # st.tabs tüm sekmeleri her rerun'da çalıştırır; radio ile sadece seçili bölüm yüklenir
+    tabs = ["🏫 Yatılı", "🍽️ Gündüzlü", "🤖 Dekont İşle (Drive)", "⚙️ Ayarlar"]
+    sel_tab = st.radio("Bölüm", tabs, horizontal=True, label_visibility="collapsed", key="finans_tab")
 
-    with tab1:
-        df = get_data(SHEET_YATILI)
+    if sel_tab in tabs[:2]:
+        sheet = SHEET_YATILI if sel_tab == tabs[0] else SHEET_GUNDUZLU
+        if st.button("🔄 Yenile", key="finans_refresh"):
+            invalidate_snapshot(FILE_FINANS, sheet)
+        df = get_data(sheet)
         if not df.empty: st.dataframe(df, use_container_width=True)
         else: st.warning("Veri yok.")
 
-    with tab2:
-        df = get_data(SHEET_GUNDUZLU)
-        if not df.empty: st.dataframe(df, use_container_width=True)
-        else: st.warning("Veri yok.")
-
-    with tab3:
+    elif sel_tab == tabs[2]:
         st.subheader("🤖 Drive Dekont Analizi")
         service = get_drive_service()
         
@@ -238,12 +848,12 @@ def render_page(selected_model):
         if not gelen_id:
             st.warning("⚠️ 'Gelen_Dekontlar' klasörü bulunamadı.")
         else:
-            results = service.files().list(q=f"'{gelen_id}' in parents and trashed=false", fields="files(id, name, mimeType)").execute()
-            files = results.get('files', [])
+            files = list_files_in_folder(service, gelen_id)
             
             st.info(f"📂 İşlenmeyi Bekleyen: **{len(files)}** Dekont")
             
             if files:
+                render_bulk_section(service, files, selected_model, gelen_id, arsiv_yatili_id, arsiv_gunduzlu_id)
                 file_map = {f['id']: f['name'] for f in files}
                 sel_id = st.selectbox("İşlenecek Dekontu Seç:", list(file_map.keys()), format_func=lambda x: file_map[x])
                 sel_meta = next(f for f in files if f['id'] == sel_id)
@@ -298,12 +908,11 @@ def render_page(selected_model):
                             ext = os.path.splitext(sel_meta['name'])[1]
                             
                             if y_tur == 'YEMEK':
-                                if write_to_gunduzlu_sheet(analiz, link):
+                                ok, msg = write_to_gunduzlu_sheet(analiz, link, sel_id)
+                                if ok:
                                     basari = True
-                                    msg = "Gündüzlü listesine işlendi."
                                     hedef_klasor = arsiv_gunduzlu_id
                                     yeni_isim = f"{yeni_isim_kok}_Yemek_{tarih}{ext}"
-                                else: msg = "Veritabanı hatası."
                             else:
                                 ok, txt, taksit_no = process_yatili_payment(analiz, link)
                                 if ok:
@@ -323,7 +932,7 @@ def render_page(selected_model):
                                 else: st.error("Veri işlendi ama dosya taşınamadı.")
                             elif not basari: st.error(f"Başarısız: {msg}")
 
-    with tab4:
+    elif sel_tab == tabs[3]:
         st.subheader("Ayarlar")
         curr = get_current_unit_price()
         st.write(f"Birim Fiyat: {curr} TL")
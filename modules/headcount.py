@@ -0,0 +1,123 @@
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import pandas as pd
+
+from modules.tracing import span
+from modules.utils import (
+    get_setting,
+    get_sheet_snapshot,
+    FILE_FINANS,
+    SHEET_YATILI,
+    SHEET_GUNDUZLU,
+)
+
+# =========================================================
+# 👥 ÖĞÜN BAŞINA YEMEK YİYEN SAYISI
+# =========================================================
+# Yatılılar (OGRENCI_YATILI) her gün dört öğünde, gündüzlüler (OGRENCI_GUNDUZLU)
+# sadece hafta içi öğle yemeğinde sayılır; tatil aralıklarında porsiyon yoktur.
+# Gündüzlü sayfası bir ödeme kaydıdır: planlanan ay ve önceki ayda ödemesi olan
+# farklı öğrenciler (TC, yoksa ad) o ayın gündüzlüleri sayılır.
+# Listeler uzun ömürlü sayfa görüntülerinden okunur (finans yazınca görüntüyü zaten
+# düşürür); ay tablosu liste görüntüsü değişmedikçe yeniden hesaplanmaz.
+
+MEALS = ["KAHVALTI", "ÖĞLE", "AKŞAM", "GECE"]
+HEADCOUNT_CACHE_MAX = 12
+
+def _roster_ttl():
+    return int(get_setting("HEADCOUNT_ROSTER_TTL", 3600) or 3600)
+
+def boarder_count(df):
+    """Yatılı listesinde adı dolu satır sayısı"""
+    if df.empty:
+        return 0
+    names = df["Ad_Soyad"] if "Ad_Soyad" in df.columns else df.iloc[:, 0]
+    return int((names.astype(str).str.strip() != "").sum())
+
+def _payment_months(dates):
+    """'2025-03-14' / '14.03.2025' -> '2025-03'; okunamayan tarih boş"""
+    s = dates.astype(str).str.strip()
+    iso = s.str.extract(r"^(\d{4})-(\d{1,2})")
+    tr = s.str.extract(r"^\d{1,2}[./](\d{1,2})[./](\d{4})")
+    year = iso[0].fillna(tr[1])
+    month = iso[1].fillna(tr[0])
+    return (year + "-" + month.str.zfill(2)).fillna("")
+
+def day_student_count(df, year, month, window=2):
+    """year/month ve önceki window-1 ayda ödemesi olan farklı gündüzlü öğrenci sayısı"""
+    if df.empty or df.shape[1] < 4:
+        return 0
+    idx = year * 12 + month - 1
+    months = {f"{(idx - k) // 12}-{(idx - k) % 12 + 1:02d}" for k in range(window)}
+    recent = df[_payment_months(df.iloc[:, 3]).isin(months)]
+    tc = recent.iloc[:, 0].astype(str).str.strip()
+    ident = tc.where(tc != "", recent.iloc[:, 1].astype(str).str.strip().str.upper())
+    return int(ident[ident != ""].nunique())
+
+def headcount_frame(year, month, boarders, day_students, holidays=()):
+    """
+    Ayın her günü x öğün için beklenen kişi sayısı.
+    Sütunlar: TARİH (gg.aa.yyyy), ÖĞÜN, YATILI, GÜNDÜZLÜ, PORSİYON.
+    holidays: menü planlayıcıdaki gibi (başlangıç, bitiş) tarih çiftleri.
+    """
+    days = [date(year, month, d) for d in range(1, calendar.monthrange(year, month)[1] + 1)]
+    off = {d for d in days if any(a <= d <= b for a, b in holidays)}
+    rows = []
+    for d in days:
+        weekday = d.weekday() < 5
+        for meal in MEALS:
+            y = 0 if d in off else boarders
+            g = day_students if (d not in off and weekday and meal == "ÖĞLE") else 0
+            rows.append((d.strftime("%d.%m.%Y"), meal, y, g))
+    frame = pd.DataFrame(rows, columns=["TARİH", "ÖĞÜN", "YATILI", "GÜNDÜZLÜ"])
+    frame["PORSİYON"] = frame["YATILI"] + frame["GÜNDÜZLÜ"]
+    return frame
+
+_CACHE = OrderedDict()
+_LOCK = threading.Lock()
+
+def get_month_headcount(year, month, holidays=()):
+    """Ayın kişi sayısı tablosu; liste görüntüleri değişmedikçe saklanan tablo döner"""
+    holidays = tuple(sorted((a, b) for a, b in holidays))
+    ttl = _roster_ttl()
+    yatili = get_sheet_snapshot(FILE_FINANS, SHEET_YATILI, ttl)
+    gunduzlu = get_sheet_snapshot(FILE_FINANS, SHEET_GUNDUZLU, ttl)
+    key = (year, month, holidays, id(yatili), id(gunduzlu))
+    with _LOCK:
+        entry = _CACHE.get(key)
+        if entry is not None:
+            _CACHE.move_to_end(key)
+            return entry[2]
+    window = int(get_setting("GUNDUZLU_WINDOW_MONTHS", 2) or 2)
+    with span("headcount.month", month=f"{year}-{month:02d}"):
+        frame = headcount_frame(
+            year, month,
+            yatili.derived("boarder_count", boarder_count),
+            day_student_count(gunduzlu.df, year, month, window),
+            holidays,
+        )
+    with _LOCK:
+        # Görüntüler de saklanır: id() başka nesneye geçemez
+        _CACHE[key] = (yatili, gunduzlu, frame)
+        while len(_CACHE) > HEADCOUNT_CACHE_MAX:
+            _CACHE.popitem(last=False)
+    return frame
+
+def menu_headcount(long, holidays=()):
+    """melt_menu çıktısındaki ay(lar) için kişi sayısı tablosu; recete.portions_frame'e verilir"""
+    days = pd.to_datetime(long["TARİH"], format="%d.%m.%Y", errors="coerce").dropna()
+    months = sorted({(d.year, d.month) for d in days})
+    if not months:
+        return pd.DataFrame(columns=["TARİH", "ÖĞÜN", "YATILI", "GÜNDÜZLÜ", "PORSİYON"])
+    return pd.concat([get_month_headcount(y, m, holidays) for y, m in months], ignore_index=True)
+
+def holidays_from_menu(df):
+    """Kaydedilmiş menüdeki TATİL günleri -> [(gün, gün)]"""
+    if df.empty or "GÜN" not in df.columns:
+        return []
+    off = df[df["GÜN"].astype(str).str.contains("TATİL", regex=False)]
+    days = pd.to_datetime(off["TARİH"].astype(str), format="%d.%m.%Y", errors="coerce").dropna()
+    return [(d.date(), d.date()) for d in days]
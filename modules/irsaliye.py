@@ -1,9 +1,6 @@
 import streamlit as st
 from PIL import Image
-import requests
-import json
 import io
-import base64
 import pandas as pd
 from datetime import datetime
 
@@ -11,39 +8,56 @@ from modules.utils import (
     get_gspread_client, 
     get_company_list,
     resolve_product_name,
+    record_corrections,
     get_or_create_worksheet, 
     clean_number, 
     find_best_match,
     FILE_STOK,
     PRICE_SHEET_NAME
 )
+from modules.tracing import span, traced
+from modules.extraction import ExtractionSpec, extract_safe
+from modules.stock_ledger import get_stock_ledger, render_ledger_panel, batch_id, product_key, KIND_WAYBILL
 
-def analyze_receipt_image(image, model_name):
-    api_key = st.secrets["GOOGLE_API_KEY"]
-    clean_model = model_name if "models/" not in model_name else model_name.replace("models/", "")
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='JPEG')
-    base64_image = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{clean_model}:generateContent?key={api_key}"
-    headers = {'Content-Type': 'application/json'}
-    
-    prompt = """
+WAYBILL_PROMPT = """
     Bu İRSALİYEYİ analiz et.
     Sadece kalemleri çıkar. Firma ismine veya tarihe bakma.
-    MİKTARLARI yazarken Binlik Ayracı kullanma (1500 yaz).
+    MİKTARLARI sayı olarak ver; binlik ayracı kullanma (1500 yaz).
     
-    ÇIKTI FORMATI:
-    ÜRÜN ADI | MİKTAR | BİRİM
+    Her kalem için: urun_adi, miktar, birim
     """
-    
-    payload = {"contents": [{"parts": [{"text": prompt}, {"inline_data": {"mime_type": "image/jpeg", "data": base64_image}}]}], "safetySettings": [{"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}]}
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        if response.status_code != 200: return False, f"API Hatası: {response.text}"
-        return True, response.json()['candidates'][0]['content']['parts'][0]['text']
-    except Exception as e: return False, str(e)
+
+WAYBILL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "kalemler": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "urun_adi": {"type": "STRING"},
+                    "miktar": {"type": "NUMBER"},
+                    "birim": {"type": "STRING"},
+                },
+                "required": ["urun_adi", "miktar"],
+                "propertyOrdering": ["urun_adi", "miktar", "birim"],
+            },
+        }
+    },
+    "required": ["kalemler"],
+}
+
+def analyze_receipt_image(image, model_name, on_rows=None):
+    """
+    (True, kalem DataFrame'i) ya da (False, hata). Uyarılar df.attrs['uyarilar'] içinde.
+    on_rows verilirse cevap akışla okunur ve satırlar geldikçe on_rows(df) çağrılır.
+    """
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG')
+    ok, res = extract_safe(WAYBILL_SPEC, model_name, img_byte_arr.getvalue(), "image/jpeg", on_rows=on_rows)
+    if not ok: return False, res
+    res.data.attrs['uyarilar'] = res.warnings
+    return True, res.data
 
 def text_to_dataframe(raw_text):
     data = []
@@ -58,6 +72,13 @@ def text_to_dataframe(raw_text):
             data.append({"ÜRÜN ADI": parts[0], "MİKTAR": parts[1], "BİRİM": parts[2]})
     return pd.DataFrame(data)
 
+WAYBILL_SPEC = ExtractionSpec(
+    "irsaliye", WAYBILL_PROMPT, WAYBILL_SCHEMA, array_key="kalemler",
+    columns={"urun_adi": "ÜRÜN ADI", "miktar": "MİKTAR", "birim": "BİRİM"},
+    fallback=text_to_dataframe
+)
+
+@traced("irsaliye.save_receipt_dataframe")
 def save_receipt_dataframe(df, company, date_obj):
     client = get_gspread_client()
     if not client: return False, "Google Sheets Bağlantı Hatası"
@@ -65,35 +86,42 @@ def save_receipt_dataframe(df, company, date_obj):
     date_str = date_obj.strftime("%d.%m.%Y")
     
     try:
-        sh = client.open(FILE_STOK) 
-        price_ws = get_or_create_worksheet(sh, PRICE_SHEET_NAME, 7, [])
-        price_data = price_ws.get_all_values()
-        
-        # Firma Sayfası
-        ws_company = get_or_create_worksheet(sh, company, 10, ["TARİH", "ÜRÜN ADI", "MİKTAR", "BİRİM", "BİRİM FİYAT", "TUTAR", "İŞLEM TÜRÜ"])
+        with span("irsaliye.load_stock"):
+            sh = client.open(FILE_STOK) 
+            price_ws = get_or_create_worksheet(sh, PRICE_SHEET_NAME, 7, [])
+            # Defter durumu sayfadan önce okunur: aradaki kayıtlar düzeltme sayılmasın
+            ledger = get_stock_ledger()
+            seen = ledger.sheet_state(company)
+            price_data = price_ws.get_all_values()
+            
+            # Firma Sayfası
+            ws_company = get_or_create_worksheet(sh, company, 10, ["TARİH", "ÜRÜN ADI", "MİKTAR", "BİRİM", "BİRİM FİYAT", "TUTAR", "İŞLEM TÜRÜ"])
+            
+            # Stok Haritası
+            product_map = {}
+            for idx, row in enumerate(price_data):
+                if idx == 0: continue
+                if len(row) >= 2:
+                    db_comp = row[0].strip()
+                    db_prod = row[1].strip()
+                    if db_comp == company:
+                        # Kota ve Fiyatı al
+                        product_map[db_prod.lower()] = {
+                            "row": idx + 1, 
+                            "quota": clean_number(row[5]) if len(row) >= 6 else 0.0,
+                            "price": clean_number(row[2]) # Fiyatı DB'den alacağız
+                        }
         
-        # Stok Haritası
-        product_map = {}
-        for idx, row in enumerate(price_data):
-            if idx == 0: continue
-            if len(row) >= 2:
-                db_comp = row[0].strip()
-                db_prod = row[1].strip()
-                if db_comp == company:
-                    # Kota ve Fiyatı al
-                    product_map[db_prod.lower()] = {
-                        "row": idx + 1, 
-                        "quota": clean_number(row[5]) if len(row) >= 6 else 0.0,
-                        "price": clean_number(row[2]) # Fiyatı DB'den alacağız
-                    }
+        with span("irsaliye.resolve_names", lines=len(df)):
+            final_names = [resolve_product_name(str(p), client, company) for p in df["ÜRÜN ADI"]]
         
-        quota_updates = []
+        movements = []      # stok defteri: (ürün, -miktar, birim, fiyat)
+        sheet_quotas = {}   # defterle mutabakat: [sayfadaki KALAN KOTA, okunan bakiye, son yazılan]
+        quota_rows = {}
         company_log_rows = []
         msg = []
         
-        for index, row in df.iterrows():
-            raw_prod = str(row["ÜRÜN ADI"])
-            final_prod = resolve_product_name(raw_prod, client, company)
+        for (index, row), final_prod in zip(df.iterrows(), final_names):
             
             miktar = clean_number(row["MİKTAR"])
             birim = str(row["BİRİM"]).upper()
@@ -108,10 +136,11 @@ def save_receipt_dataframe(df, company, date_obj):
                 
                 # İRSALİYE GİRİŞİ -> MAL GELDİ -> STOK DÜŞER (-)
                 # (Çünkü Fatura ile +100 hak vermiştik, şimdi 40'ını aldık, 60 kaldı)
-                new_quota = item['quota'] - miktar
-                
-                quota_updates.append({'range': f'F{item["row"]}', 'values': [[new_quota]]})
-                msg.append(f"📉 DÜŞÜLDÜ: {final_prod} -> -{miktar} {birim} (Kalan Hak: {new_quota})")
+                # Düşüm deftere hareket olarak eklenir; kalan hak defter bakiyesidir
+                movements.append((final_prod, -miktar, birim, fiyat))
+                sheet_quotas[final_prod] = [item['quota'], *seen.get(product_key(final_prod), [None, None])]
+                quota_rows[final_prod] = item['row']
+                msg.append((final_prod, miktar, birim))
             else:
                 # Ürün faturada hiç girilmemiş ama irsaliyede geldi (Borçlanma)
                 # Bu durumda kotayı eksiye düşürecek bir satırımız yok, kullanıcıya uyarı vermek lazım.
@@ -132,8 +161,23 @@ def save_receipt_dataframe(df, company, date_obj):
                 "Mal Kabul Edildi" # İrsaliye İşareti
             ])
         
-        if quota_updates: price_ws.batch_update(quota_updates)
-        if company_log_rows: ws_company.append_rows(company_log_rows)
+        if movements:
+            # Aynı irsaliye tekrar kaydedilirse (çift tıklama, yazma hatası sonrası yeniden deneme) stok ikinci kez düşmez
+            if not ledger.record(company, date_str, movements, KIND_WAYBILL, batch=batch_id(KIND_WAYBILL, company, date_str, movements), sheet_quotas=sheet_quotas):
+                msg.append("⚠️ Bu irsaliyenin hareketleri stok defterinde zaten var, tekrar düşülmedi.")
+        balances = ledger.balance_of(company, quota_rows)
+        msg = [
+            m if isinstance(m, str) else f"📉 DÜŞÜLDÜ: {m[0]} -> -{m[1]} {m[2]} (Kalan Hak: {balances[m[0]]})"
+            for m in msg
+        ]
+        quota_updates = [{'range': f'F{r}', 'values': [[balances[p]]]} for p, r in quota_rows.items()]
+
+        with span("irsaliye.stock_update", updates=len(quota_updates)):
+            if quota_updates:
+                price_ws.batch_update(quota_updates)
+                ledger.mark_synced(company, balances)
+        with span("irsaliye.ledger_append", rows=len(company_log_rows)):
+            if company_log_rows: ws_company.append_rows(company_log_rows)
     
         return True, " | ".join(msg)
     except Exception as e: return False, f"Genel Hata: {str(e)}"
@@ -153,6 +197,7 @@ def render_page(sel_model):
     c1, c2 = st.columns(2)
     selected_company = c1.selectbox("Firma Seç", companies)
     selected_date = c2.date_input("İrsaliye Tarihi", datetime.now())
+    render_ledger_panel(selected_company)
     
     f = st.file_uploader("İrsaliye Fişi Yükle", type=['jpg', 'png', 'jpeg'])
     
@@ -161,10 +206,14 @@ def render_page(sel_model):
         st.image(img, caption="Belge", width=300)
         if st.button("🔍 İrsaliyeyi Analiz Et", type="primary"):
             with st.spinner("Okunuyor..."):
-                s, raw_text = analyze_receipt_image(img, sel_model)
+                # Satırlar model yazdıkça tabloya düşer
+                canli = st.empty()
+                s, res = analyze_receipt_image(img, sel_model, on_rows=lambda df: canli.dataframe(df, use_container_width=True))
+                canli.empty()
                 if s:
-                    st.session_state['irsaliye_df'] = text_to_dataframe(raw_text)
-                else: st.error(f"Okuma Hatası: {raw_text}")
+                    for w in res.attrs.get('uyarilar', []): st.warning(w)
+                    st.session_state['irsaliye_df'] = res
+                else: st.error(f"Okuma Hatası: {res}")
 
     if 'irsaliye_df' in st.session_state:
         edited_df = st.data_editor(st.session_state['irsaliye_df'], num_rows="dynamic", use_container_width=True)
@@ -172,6 +221,9 @@ def render_page(sel_model):
             with st.spinner("İşleniyor..."):
                 success, msg = save_receipt_dataframe(edited_df, selected_company, selected_date)
                 if success:
+                    # Elle düzeltilen ürün adları kayıt başarılı olunca sözlüğe
+                    learned = record_corrections(client, selected_company, st.session_state['irsaliye_df'], edited_df)
+                    if learned: st.toast(f"📚 {learned} yeni eşleşme öğrenildi")
                     st.balloons(); st.success("✅ İrsaliye İşlendi!")
                     st.write(msg)
                     del st.session_state['irsaliye_df']
@@ -0,0 +1,285 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.tracing import span
+
+# =========================================================
+# ⏳ ARKA PLAN İŞLERİ
+# =========================================================
+# Uzun kayıt/analizler Streamlit oturumunu bloklamasın diye iş havuzunda koşar.
+# İş durumu data/jobs.sqlite'ta tutulur: sayfa yenilense de iş sürer, arayüz
+# job_id ile ilerlemeyi sorgular. Süreç ölürse yarım kalan işler bir sonraki
+# açılışta kaldığı adımdan devam eder.
+#
+# İş fonksiyonu:
+#   @register("fatura.kaydet")
+#   def job(ctx, **params):
+#       plan = ctx.step("plan", lambda: ...)      # sonucu kaydedilir, tekrar koşmaz
+#       ctx.progress(0.5, "Stok yazılıyor")        # iptal istendiyse JobCancelled
+#       return {...}                                # JSON'a çevrilebilir sonuç
+#
+# İş türü "<modül>.<ad>" biçimindedir; işleyici kayıtlı değilse modules.<modül>
+# import edilerek kaydı sağlanır (sayfa modülleri isteğe bağlı yüklendiği için).
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class JobError(Exception):
+    """İşleyicinin kullanıcıya gösterilecek hata mesajıyla işi düşürmesi için"""
+
+_HANDLERS = {}
+
+def register(kind):
+    def deco(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return deco
+
+def _handler(kind):
+    if kind not in _HANDLERS:
+        importlib.import_module(f"modules.{kind.split('.')[0]}")
+    return _HANDLERS[kind]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    label TEXT,
+    status TEXT NOT NULL,
+    progress REAL DEFAULT 0,
+    message TEXT DEFAULT '',
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER DEFAULT 0,
+    attempts INTEGER DEFAULT 0,
+    created REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS job_steps (
+    job_id TEXT NOT NULL,
+    step TEXT NOT NULL,
+    result TEXT,
+    finished REAL,
+    PRIMARY KEY (job_id, step)
+);
+"""
+
+class JobContext:
+    """İşleyiciye verilen tutamak: ilerleme, iptal kontrolü ve devam ettirilebilir adımlar"""
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+
+    def check(self):
+        if self.runner._cancel_requested(self.job_id):
+            raise JobCancelled()
+
+    def progress(self, fraction, message=""):
+        self.runner._update(self.job_id, progress=max(0.0, min(1.0, float(fraction))), message=message)
+        self.check()
+
+    def step(self, name, fn):
+        """
+        Adım daha önce tamamlandıysa kayıtlı sonucunu döndürür, yoksa çalıştırıp kaydeder.
+        Adım içindeki yazma yarıda kesilirse adım tümüyle tekrar koşar (adım başına en az bir kez).
+        """
+        done, result = self.runner._step_result(self.job_id, name)
+        if done:
+            return result
+        self.check()
+        with span(f"job.step: {name}", job=self.job_id):
+            result = fn()
+        self.runner._save_step(self.job_id, name, result)
+        return result
+
+class InlineContext:
+    """İş havuzu olmadan doğrudan çağrılar için boş bağlam"""
+
+    job_id = None
+
+    def check(self):
+        pass
+
+    def progress(self, fraction, message=""):
+        pass
+
+    def step(self, name, fn):
+        return fn()
+
+INLINE = InlineContext()
+
+class JobRunner:
+    def __init__(self, db_path, max_workers=2):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mutfak-job")
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # --- Dış API ---
+    def submit(self, kind, params=None, label=""):
+        """İşi kuyruğa ekler ve job_id döndürür; params JSON'a çevrilebilir olmalı"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, label, status, params, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, label or kind, QUEUED, json.dumps(params or {}, ensure_ascii=False, default=str), now, now)
+            )
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, limit=20, kinds=None):
+        q, args = "SELECT * FROM jobs", []
+        if kinds:
+            q += f" WHERE kind IN ({','.join('?' * len(kinds))})"
+            args = list(kinds)
+        q += " ORDER BY created DESC LIMIT ?"
+        with self._conn() as conn:
+            return [_row_to_job(r) for r in conn.execute(q, args + [limit])]
+
+    def cancel(self, job_id):
+        """İptal isteği bırakır; iş bir sonraki progress/check/step çağrısında durur"""
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ? AND status IN (?, ?)", (time.time(), job_id, QUEUED, RUNNING))
+
+    def resume_pending(self):
+        """Önceki süreçte bitmemiş (queued/running) işleri yeniden kuyruğa alır"""
+        with self._conn() as conn:
+            ids = [r["id"] for r in conn.execute("SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING))]
+            conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+        for job_id in ids:
+            self._pool.submit(self._run, job_id)
+        return ids
+
+    # --- İç ---
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._conn() as conn:
+            conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def _cancel_requested(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _step_result(self, job_id, name):
+        with self._conn() as conn:
+            row = conn.execute("SELECT result FROM job_steps WHERE job_id = ? AND step = ?", (job_id, name)).fetchone()
+        return (True, json.loads(row[0])) if row else (False, None)
+
+    def _save_step(self, job_id, name, result):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_steps (job_id, step, result, finished) VALUES (?, ?, ?, ?)",
+                (job_id, name, json.dumps(result, ensure_ascii=False, default=str), time.time())
+            )
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if not job or job["status"] in FINISHED:
+            return
+        if job["cancel_requested"]:
+            self._update(job_id, status=CANCELLED, message="İptal edildi")
+            return
+        self._update(job_id, status=RUNNING, attempts=job["attempts"] + 1)
+        ctx = JobContext(self, job_id)
+        try:
+            with span(f"job: {job['kind']}", job=job_id):
+                result = _handler(job["kind"])(ctx, **job["params"])
+            self._update(job_id, status=DONE, progress=1.0, message="Tamamlandı", result=json.dumps(result, ensure_ascii=False, default=str))
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, message="İptal edildi")
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}" if not isinstance(e, JobError) else str(e))
+
+def _row_to_job(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+# =========================================================
+# ⚙️ PAYLAŞIMLI ÇALIŞTIRICI
+# =========================================================
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """Süreç başına tek çalıştırıcı; ilk kurulumda yarım kalan işleri devam ettirir"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            from modules.utils import get_setting, LOCAL_DATA_DIR
+            _runner = JobRunner(
+                get_setting("JOB_DB_PATH", os.path.join(LOCAL_DATA_DIR, "jobs.sqlite")),
+                max_workers=int(get_setting("JOB_WORKERS", 2) or 2),
+            )
+            _runner.resume_pending()
+        return _runner
+
+def submit(kind, params=None, label=""):
+    return get_job_runner().submit(kind, params, label)
+
+# =========================================================
+# 🖥️ ARAYÜZ YARDIMCISI
+# =========================================================
+
+def render_job(job_id, on_done=None, poll_seconds=1.0):
+    """
+    İşin ilerleme çubuğu ve iptal düğmesi. Sadece bu parça (fragment) periyodik
+    yenilenir; iş bitince on_done(result) bir kez çağrılır ve sayfa yeniden koşar.
+    """
+    import streamlit as st
+
+    @st.fragment(run_every=poll_seconds)
+    def _poll():
+        job = get_job_runner().get(job_id)
+        if not job:
+            st.warning("İş kaydı bulunamadı.")
+            return
+        if job["status"] in (QUEUED, RUNNING):
+            c1, c2 = st.columns([5, 1])
+            c1.progress(job["progress"], text=f"⏳ {job['label']}: {job['message'] or job['status']}")
+            if c2.button("✖️ İptal", key=f"job_cancel_{job_id}"):
+                get_job_runner().cancel(job_id)
+            return
+        done_key = f"job_done_{job_id}"
+        if job["status"] == DONE:
+            st.success(f"✅ {job['label']} tamamlandı.")
+        elif job["status"] == CANCELLED:
+            st.warning(f"✖️ {job['label']} iptal edildi.")
+        else:
+            st.error(f"❌ {job['label']} başarısız: {job['error']}")
+        if not st.session_state.get(done_key):
+            st.session_state[done_key] = True
+            if on_done and job["status"] == DONE:
+                on_done(job["result"])
+            st.rerun()
+
+    _poll()
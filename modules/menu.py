@@ -1,18 +1,32 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date
 import random
 import calendar
-import io
-from collections import defaultdict
+import os
+import hashlib
+import itertools
+import multiprocessing
+import threading
+import time
+import numpy as np
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Tuple, Optional
 
 # --- MODÜL IMPORTLARI ---
 from modules.utils import (
     get_gspread_client,
+    get_setting,
     FILE_MENU,
     MENU_POOL_SHEET_NAME
 )
+from modules.tracing import span, traced
+from modules.menu_archive import get_menu_archive, months_back
+from modules.jobs import JobError, register, submit, render_job
+from modules.menu_export import build_menu_workbook, cached_workbook
+from modules import recete
+from modules.headcount import holidays_from_menu
 
 # --- AYARLAR ---
 ACTIVE_MENU_SHEET_NAME = "AKTIF_MENU"
@@ -39,6 +53,16 @@ def get_unique_key(dish: Dict) -> str:
     name = clean_dish_name(safe_str(dish.get('YEMEK ADI')))
     return f"{cat}_{name}"
 
+def assign_dish_ids(pool: List[Dict]) -> Dict[str, int]:
+    """
+    Havuzdaki yemeklere tamsayı ID verir (dish['_ID']); aynı anahtarlı satırlar aynı ID'yi paylaşır.
+    Anahtar -> ID sözlüğünü döndürür.
+    """
+    ids = {}
+    for dish in pool:
+        dish['_ID'] = ids.setdefault(get_unique_key(dish), len(ids))
+    return ids
+
 def get_dish_meta(dish: Dict) -> Dict:
     """Yemeğin tüm meta bilgilerini çıkar"""
     if not dish:
@@ -68,21 +92,47 @@ def get_dish_meta(dish: Dict) -> Dict:
 # 💾 VERİTABANI İŞLEMLERİ
 # =========================================================
 
+@traced("menu.save_menu_to_sheet")
 def save_menu_to_sheet(client, df):
     """Menüyü Google Sheets'e kaydet"""
     try:
         sh = client.open(FILE_MENU)
+        before = _pool_version(sh) if _POOL_CACHE.get(FILE_MENU) else None
         try:
             ws = sh.worksheet(ACTIVE_MENU_SHEET_NAME)
         except:
             ws = sh.add_worksheet(ACTIVE_MENU_SHEET_NAME, 100, 20)
         ws.clear()
         ws.update([df.columns.values.tolist()] + df.astype(str).values.tolist())
+        _keep_pool_version(sh, before)
+        archive_menu(df)
         return True
     except Exception as e:
         st.error(f"Kaydetme Hatası: {e}")
         return False
 
+def archive_menu(df, replace=True):
+    """Menüyü yerel arşive yazar; arşiv hatası Sheets kaydını bozmaz"""
+    try:
+        return get_menu_archive().store(get_menu_analytics(df).long, menu_hash(df), replace=replace)
+    except Exception:
+        return []
+
+def archive_priors(first_day):
+    """Planlayıcı için geçmiş kullanım; arşiv açılamazsa boş (menü üretimi arşive bağlı değil)"""
+    try:
+        return get_menu_archive().usage_priors(first_day)
+    except Exception:
+        return {}
+
+def archive_counts(since, until):
+    """[since, until) arasında yemek -> kaç kez çıktı; arşiv açılamazsa boş"""
+    try:
+        return get_menu_archive().dish_counts(since, until)
+    except Exception:
+        return {}
+
+@traced("menu.load_last_menu")
 def load_last_menu(client):
     """Son kaydedilen menüyü yükle"""
     try:
@@ -95,34 +145,147 @@ def load_last_menu(client):
     except:
         return None
 
-def get_full_menu_pool(client):
-    """Yemek havuzunu Google Sheets'ten oku"""
-    try:
-        sh = client.open(FILE_MENU)
-        ws = sh.worksheet(MENU_POOL_SHEET_NAME)
-        data = ws.get_all_values()
-        if not data:
-            return []
+def parse_pool_rows(data: List[List[str]]) -> List[Dict]:
+    """get_all_values çıktısını yemek sözlüklerine çevirir; LIMIT <= 0 olanlar havuza girmez"""
+    if not data:
+        return []
 
-        header = [h.strip().upper() for h in data[0]]
-        pool = []
+    header = [h.strip().upper() for h in data[0]]
+    pool = []
 
-        for row in data[1:]:
-            item = {}
-            while len(row) < len(header):
-                row.append("")
+    for row in data[1:]:
+        item = {}
+        while len(row) < len(header):
+            row.append("")
 
-            for i, col_name in enumerate(header):
-                item[col_name] = row[i].strip()
+        for i, col_name in enumerate(header):
+            item[col_name] = row[i].strip()
 
-            try:
-                l_val = float(item.get('LIMIT', 99) or 99)
-                if l_val > 0:
-                    pool.append(item)
-            except:
+        try:
+            l_val = float(item.get('LIMIT', 99) or 99)
+            if l_val > 0:
                 pool.append(item)
+        except:
+            pool.append(item)
+
+    assign_dish_ids(pool)
+    return pool
+
+# --- Havuz doğrulama ---
+POOL_CATEGORIES = ["KAHVALTI EKSTRA", "ÇORBA", "ANA YEMEK", "YAN YEMEK", "TAMAMLAYICI", "GECE ATIŞTIRMALIK"]
+# Seçim/skorlamada kullanılan, boş kalınca yemeğin kurallardan kaçtığı sütunlar
+POOL_REQUIRED = {
+    "ANA YEMEK": ["PROTEIN_TURU", "PISIRME_EKIPMAN", "DOKU", "TAT_PROFILI", "RENK"],
+    "ÇORBA": ["PISIRME_EKIPMAN", "DOKU", "TAT_PROFILI", "RENK"],
+    "YAN YEMEK": ["PISIRME_EKIPMAN", "DOKU", "TAT_PROFILI", "RENK"],
+    "KAHVALTI EKSTRA": ["PISIRME_EKIPMAN"],
+    "GECE ATIŞTIRMALIK": ["PISIRME_EKIPMAN"],
+}
+
+def validate_pool_rows(data: List[List[str]]) -> pd.DataFrame:
+    """Havuz satırlarındaki sorunlar: SATIR (sayfadaki satır no), YEMEK ADI, SORUN"""
+    issues = []
+    if not data:
+        return pd.DataFrame(columns=["SATIR", "YEMEK ADI", "SORUN"])
+    header = [h.strip().upper() for h in data[0]]
+    for row_no, row in enumerate(data[1:], start=2):
+        item = {col: (row[i].strip() if i < len(row) else "") for i, col in enumerate(header)}
+        name = item.get("YEMEK ADI", "")
+        if not name and not any(item.values()):
+            continue
+
+        def add(msg):
+            issues.append({"SATIR": row_no, "YEMEK ADI": name, "SORUN": msg})
+
+        if not name:
+            add("YEMEK ADI boş")
+        cat = item.get("KATEGORİ", "")
+        if cat not in POOL_CATEGORIES:
+            add(f"Bilinmeyen kategori: '{cat}'")
+        for col in ("LIMIT", "ARA"):
+            val = item.get(col, "")
+            if not val:
+                continue
+            try:
+                if float(val) < 0:
+                    add(f"{col} negatif: {val}")
+            except ValueError:
+                add(f"{col} sayı değil: '{val}'")
+        missing = [col for col in POOL_REQUIRED.get(cat, []) if not item.get(col)]
+        if missing:
+            add(f"Eksik özellik: {', '.join(missing)}")
+        bans = [b.strip() for b in item.get("YASAKLI_GUNLER", "").replace(";", ",").split(",") if b.strip()]
+        unknown = [b for b in bans if b.upper() not in [g.upper() for g in GUNLER_TR]]
+        if unknown:
+            add(f"Bilinmeyen gün: {', '.join(unknown)}")
+    return pd.DataFrame(issues, columns=["SATIR", "YEMEK ADI", "SORUN"])
+
+# --- Sürümlü havuz önbelleği ---
+# Havuz nadiren değişir: dosyanın Drive modifiedTime'ı aynıysa indirilmiş ve
+# derlenmiş havuz (ID'li yemekler, meta tablosu, doğrulama raporu) tekrar kullanılır.
+# Kontrol de POOL_CHECK_SECONDS içinde tekrarlanmaz (istatistik sekmesi her tuşta koşar).
+
+class PoolVersion:
+    """Havuzun belirli bir sürümü ve ondan bir kez türetilenler"""
+
+    def __init__(self, version, data):
+        self.version = version
+        self.checked_at = time.time()
+        self.pool = parse_pool_rows([list(r) for r in data])
+        self.report = validate_pool_rows(data)
+        self.meta = pool_meta_frame(pd.DataFrame(self.pool))
+
+_POOL_CACHE = {}
+_POOL_LOCK = threading.Lock()
+
+def _pool_version(sh):
+    """Drive modifiedTime; okunamazsa None (önbellek kullanılmaz)"""
+    try:
+        with span("menu.pool_version"):
+            return sh.get_lastUpdateTime()
+    except Exception:
+        return None
 
-        return pool
+def load_menu_pool(client, force=False) -> PoolVersion:
+    """Havuzun güncel sürümünü döndürür; dosya değişmediyse indirip ayrıştırmaz"""
+    with _POOL_LOCK:
+        cached = _POOL_CACHE.get(FILE_MENU)
+    interval = float(get_setting("POOL_CHECK_SECONDS", 30) or 0)
+    if cached and not force and time.time() - cached.checked_at < interval:
+        return cached
+
+    sh = client.open(FILE_MENU)
+    version = _pool_version(sh)
+    if cached and not force and version and version == cached.version:
+        cached.checked_at = time.time()
+        return cached
+
+    with span("menu.pool_download") as s:
+        data = sh.worksheet(MENU_POOL_SHEET_NAME).get_all_values()
+        s.set(rows=len(data))
+    entry = PoolVersion(version, data)
+    if version:
+        with _POOL_LOCK:
+            _POOL_CACHE[FILE_MENU] = entry
+    return entry
+
+def _keep_pool_version(sh, before):
+    """
+    Aynı dosyadaki AKTIF_MENU'ye yazmak modifiedTime'ı değiştirir ama havuzu değiştirmez.
+    Yazmadan önce önbellek güncelse (before), yeni zaman damgası önbelleğe işlenir.
+    """
+    with _POOL_LOCK:
+        cached = _POOL_CACHE.get(FILE_MENU)
+    if cached and before and cached.version == before:
+        after = _pool_version(sh)
+        if after:
+            cached.version = after
+
+@traced("menu.get_full_menu_pool")
+def get_full_menu_pool(client):
+    """Yemek havuzunu Google Sheets'ten oku (değişmediyse önbellekten)"""
+    try:
+        return load_menu_pool(client).pool
     except Exception as e:
         st.error(f"Havuz Okuma Hatası: {e}")
         return []
@@ -232,6 +395,8 @@ class GourmetScorer:
         self.FLAVOR_CLASH_PENALTY = 15
         self.COLOR_OVERLOAD_PENALTY = 8
         self.OVERUSED_PENALTY = 35  # 20'den artırıldı: tekrar cezası daha belirleyici
+        self.HISTORY_PENALTY = 4    # geçmiş aylarda aylık ortalama kullanım başına
+        self.COST_PENALTY = 20      # kategori ortancasının üstündeki maliyet oranı başına
 
     def score_dish(self, dish: Dict, meta: Dict, context: Dict) -> float:
         base_score = meta.get('puan', 5)
@@ -268,13 +433,107 @@ class GourmetScorer:
         if total_usage >= 3:
             score -= self.OVERUSED_PENALTY * (total_usage - 2)
 
-        usage_days = context.get('usage_days', [])
-        if usage_days:
-            days_since = context.get('current_day', 1) - usage_days[-1]
+        # Son aylarda sık çıkan yemekler bu ay biraz geri planda kalsın
+        score -= self.HISTORY_PENALTY * context.get('history_uses', 0)
+
+        # Pahalı yemek cezası: bütçe gerisinde kalındıkça (cost_pressure > 1) artar
+        cost_ratio = context.get('cost_ratio', 0)
+        if cost_ratio > 1:
+            score -= self.COST_PENALTY * context.get('cost_pressure', 1.0) * (cost_ratio - 1)
+
+        last_used = context.get('last_used')
+        if last_used is not None:
+            days_since = context.get('current_day', 1) - last_used
             score += min(days_since * self.FRESHNESS_BONUS, 30)
 
         return max(score, 0)
 
+# =========================================================
+# 📝 KULLANIM KAYDI
+# =========================================================
+
+class UsageTracker:
+    """
+    Yemek kullanım geçmişi. Her yemeğin ID'si dizilerde bir satırdır:
+      count    -> toplam kullanım
+      last_day -> son kullanıldığı gün (ordinal), hiç kullanılmadıysa NEVER
+      recent   -> son RECENT kullanımın halka tamponu
+      prior    -> arşivden gelen geçmiş aylardaki aylık ortalama kullanım
+    Durum snapshot()/restore() ile ucuzca kopyalanıp geri alınabilir.
+    """
+
+    NEVER = -1
+    RECENT = 8
+
+    def __init__(self, pool: List[Dict], recent: int = RECENT):
+        if any('_ID' not in d for d in pool):
+            self.ids = assign_dish_ids(pool)
+        else:
+            self.ids = {get_unique_key(d): d['_ID'] for d in pool}
+        n = max(self.ids.values(), default=-1) + 1
+        self.count = np.zeros(n, dtype=np.int32)
+        self.last_day = np.full(n, self.NEVER, dtype=np.int64)
+        self.recent = np.full((n, recent), self.NEVER, dtype=np.int64)
+        self.prior = np.zeros(n, dtype=np.float64)
+        self.names = [""] * n
+        for d in pool:
+            self.names[self.dish_id(d)] = clean_dish_name(safe_str(d.get('YEMEK ADI')))
+
+    def set_priors(self, priors: Dict[str, float]):
+        """Yemek adı -> aylık ortalama geçmiş kullanım (arşivde olmayanlar 0)"""
+        self.prior[:] = [priors.get(name, 0.0) for name in self.names]
+
+    def dish_id(self, dish: Dict) -> Optional[int]:
+        """Havuz dışı yemekler ("---" gibi) için None"""
+        dish_id = dish.get('_ID')
+        return dish_id if dish_id is not None else self.ids.get(get_unique_key(dish))
+
+    def record(self, dish_id: int, day: int):
+        slot = self.count[dish_id] % self.recent.shape[1]
+        self.recent[dish_id, slot] = day
+        self.count[dish_id] += 1
+        self.last_day[dish_id] = day
+
+    def uses(self, dish_id: int) -> int:
+        return int(self.count[dish_id])
+
+    def last_used(self, dish_id: int) -> Optional[int]:
+        day = int(self.last_day[dish_id])
+        return None if day == self.NEVER else day
+
+    def recent_days(self, dish_id: int) -> List[int]:
+        """Son kullanım günleri, eskiden yeniye"""
+        n, size = int(self.count[dish_id]), self.recent.shape[1]
+        if n <= size:
+            return self.recent[dish_id, :n].tolist()
+        start = n % size
+        return np.roll(self.recent[dish_id], -start).tolist()
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.count.copy(), self.last_day.copy(), self.recent.copy()
+
+    def restore(self, snap: Tuple[np.ndarray, np.ndarray, np.ndarray]):
+        count, last_day, recent = snap
+        self.count[:] = count
+        self.last_day[:] = last_day
+        self.recent[:] = recent
+
+def record_usage(dish: Dict, usage_history: UsageTracker, day, global_history: Dict):
+    """Yemeğin kullanımını kaydet — day: datetime veya int (ordinal) kabul eder"""
+    if not dish or dish.get('YEMEK ADI') in ["---", "--- (GÜN YASAĞI)"]:
+        return
+
+    # Ordinal gün sayısına çevir (ay sınırı sorunu çözümü)
+    ordinal_day = day.toordinal() if hasattr(day, 'toordinal') else int(day)
+
+    dish_id = usage_history.dish_id(dish)
+    if dish_id is not None:
+        usage_history.record(dish_id, ordinal_day)
+
+    meta = get_dish_meta(dish)
+    if meta['alt_tur'] == 'BAKLIYAT':
+        global_history['last_legume'] = ordinal_day
+
 # =========================================================
 # 🎯 ANA SEÇİM MOTORU
 # =========================================================
@@ -287,11 +546,26 @@ class DishSelector:
         self.analyzer = analyzer
         self.constraint_mgr = ConstraintManager()
         self.scorer = GourmetScorer()
+        self.cost_ratio: Dict[int, float] = {}  # dish ID -> porsiyon maliyeti / kategori ortancası
+        self.cost_pressure = 1.0
+
+    def set_costs(self, costs: Dict[str, float]):
+        """Yemek adı -> porsiyon maliyeti; oran kategori ortancasına göre tutulur"""
+        by_cat = defaultdict(list)
+        for dish in self.pool:
+            cost = costs.get(clean_dish_name(safe_str(dish.get('YEMEK ADI'))))
+            if cost:
+                by_cat[safe_str(dish.get('KATEGORİ'))].append((dish['_ID'], cost))
+        self.cost_ratio = {}
+        for items in by_cat.values():
+            median = float(np.median([c for _, c in items]))
+            if median > 0:
+                self.cost_ratio.update({dish_id: c / median for dish_id, c in items})
 
     def select_dish(
         self,
         category: str,
-        usage_history: Dict,
+        usage_history: UsageTracker,
         current_day_obj: datetime,
         base_constraints: Dict,
         score_context: Dict = None
@@ -337,10 +611,13 @@ class DishSelector:
         scored = []
         for dish in best_candidates:
             meta = get_dish_meta(dish)
-            u_key = get_unique_key(dish)
+            dish_id = usage_history.dish_id(dish)
             context = score_context.copy()
-            context['usage_days'] = usage_history.get(u_key, [])
-            context['total_usage'] = len(usage_history.get(u_key, []))
+            context['last_used'] = usage_history.last_used(dish_id)
+            context['total_usage'] = usage_history.uses(dish_id)
+            context['history_uses'] = float(usage_history.prior[dish_id])
+            context['cost_ratio'] = self.cost_ratio.get(dish_id, 0)
+            context['cost_pressure'] = self.cost_pressure
             context['current_day'] = current_day
             score = self.scorer.score_dish(dish, meta, context)
             scored.append((dish, score, used_level))
@@ -365,32 +642,32 @@ class DishSelector:
         self,
         candidates: List[Dict],
         constraints: Dict,
-        usage_history: Dict,
+        usage_history: UsageTracker,
         current_day: int
     ) -> List[Dict]:
         filtered = []
 
         for dish in candidates:
             meta = get_dish_meta(dish)
-            u_key = get_unique_key(dish)
+            dish_id = usage_history.dish_id(dish)
             name = clean_dish_name(safe_str(dish.get('YEMEK ADI')))
 
             if constraints.get('oven_banned') and meta['equip'] == 'FIRIN':
                 continue
 
-            used_days = usage_history.get(u_key, [])
             try:
                 limit_val = int(float(dish.get('LIMIT') or 99))
             except:
                 limit_val = 99
-            if len(used_days) >= limit_val:
+            if usage_history.uses(dish_id) >= limit_val:
                 continue
 
             try:
                 ara_val = int(float(dish.get('ARA') or 0))
             except:
                 ara_val = 0
-            if used_days and (current_day - used_days[-1]) < ara_val:
+            last_used = usage_history.last_used(dish_id)
+            if last_used is not None and (current_day - last_used) < ara_val:
                 continue
 
             if constraints.get('exclude_names') and name in constraints['exclude_names']:
@@ -431,7 +708,7 @@ class DishSelector:
 
         return filtered
 
-    def _emergency_selection(self, candidates: List[Dict], constraints: Dict, usage_history: Dict, current_day: int) -> Optional[Dict]:
+    def _emergency_selection(self, candidates: List[Dict], constraints: Dict, usage_history: UsageTracker, current_day: int) -> Optional[Dict]:
         """
         Tüm normal filtreler boş sonuç verince çağrılır.
         Sırasıyla daha gevşek havuzlar dener ama hard constraint'leri her zaman korur:
@@ -476,7 +753,7 @@ class DishSelector:
 
         # LIMIT ve ARA gevşetilmiş — en az kullanılanı seç
         def usage_count(dish):
-            return len(usage_history.get(get_unique_key(dish), []))
+            return usage_history.uses(usage_history.dish_id(dish))
 
         pool.sort(key=usage_count)
         # En az kullanılanlar arasından rastgele seç (eşit kullanım varsa çeşitlilik için)
@@ -484,85 +761,211 @@ class DishSelector:
         least_used = [d for d in pool if usage_count(d) <= min_usage + 1]
         return random.choice(least_used)
 
-# =========================================================
-# 📝 KULLANIM KAYDI
-# =========================================================
-
-def record_usage(dish: Dict, usage_history: Dict, day, global_history: Dict):
-    """Yemeğin kullanımını kaydet — day: datetime veya int (ordinal) kabul eder"""
-    if not dish or dish.get('YEMEK ADI') in ["---", "--- (GÜN YASAĞI)"]:
-        return
-
-    # Ordinal gün sayısına çevir (ay sınırı sorunu çözümü)
-    ordinal_day = day.toordinal() if hasattr(day, 'toordinal') else int(day)
-
-    u_key = get_unique_key(dish)
-    if u_key not in usage_history:
-        usage_history[u_key] = []
-    usage_history[u_key].append(ordinal_day)
-
-    meta = get_dish_meta(dish)
-    if meta['alt_tur'] == 'BAKLIYAT':
-        global_history['last_legume'] = ordinal_day
-
 # =========================================================
 # 📊 YEMEK İSTATİSTİKLERİ
 # =========================================================
 
+# Menü sütunu -> öğün
+MENU_SLOTS = {
+    "KAHVALTI": "KAHVALTI",
+    "ÖĞLE ÇORBA": "ÖĞLE", "ÖĞLE ANA": "ÖĞLE", "ÖĞLE YAN": "ÖĞLE", "ÖĞLE TAMM": "ÖĞLE",
+    "AKŞAM ÇORBA": "AKŞAM", "AKŞAM ANA": "AKŞAM", "AKŞAM YAN": "AKŞAM", "AKŞAM TAMM": "AKŞAM",
+    "GECE": "GECE",
+}
+EMPTY_DISHES = ["", "-", "---", "--- (GÜN YASAĞI)"]
+MENU_ANALYTICS_MAX = 8
+
+def menu_hash(df: pd.DataFrame) -> str:
+    """Menü içeriğinin özeti; aynı menü için yeniden hesaplama yapılmaz"""
+    h = hashlib.sha256("|".join(map(str, df.columns)).encode("utf-8"))
+    h.update("\x1f".join(map(str, df.to_numpy().ravel())).encode("utf-8"))
+    return h.hexdigest()
+
+def melt_menu(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Menüyü uzun biçime çevirir: gün x kap başına bir satır.
+    Sütunlar: TARİH, GÜN, HAFTA, SLOT, ÖĞÜN, YEMEK ADI (temiz), ZORUNLU. Tatil günleri ve boş kaplar atılır.
+    """
+    cols = [c for c in MENU_SLOTS if c in df.columns]
+    if not cols or df.empty:
+        return pd.DataFrame(columns=["TARİH", "GÜN", "HAFTA", "SLOT", "ÖĞÜN", "YEMEK ADI", "ZORUNLU"])
+
+    work = df[["TARİH", "GÜN"] + cols].astype(str)
+    work = work[~work["GÜN"].str.contains("TATİL", regex=False)]
+    # Hafta etiketi günde bir kez (erimeden önce) hesaplanır; kategoriler tarih sırasında
+    day = pd.to_datetime(work["TARİH"], format="%d.%m.%Y", errors="coerce")
+    monday = day - pd.to_timedelta(day.dt.weekday, unit="D")
+    weeks = sorted(monday.dropna().unique())
+    labels = [f"{pd.Timestamp(w):%d.%m} haftası" for w in weeks]
+    work["HAFTA"] = pd.Categorical.from_codes(
+        monday.map({w: i for i, w in enumerate(weeks)}).fillna(-1).astype(int), categories=labels
+    )
+    # Gün x kap düzleştirme (melt'in dizi karşılığı; gün sırası korunur)
+    rows = np.repeat(np.arange(len(work)), len(cols))
+    long = pd.DataFrame({
+        "TARİH": work["TARİH"].to_numpy()[rows],
+        "GÜN": work["GÜN"].to_numpy()[rows],
+        "HAFTA": work["HAFTA"].array.take(rows),
+        "SLOT": np.tile(cols, len(work)),
+        "HAM": work[cols].to_numpy().ravel(),
+    })
+
+    raw = long["HAM"].str.strip()
+    raw = raw.mask(raw.str.lower() == "nan", "")
+    # Gece: "Çay/Kahve + X" -> X
+    gece = long["SLOT"] == "GECE"
+    raw[gece] = raw[gece].str.replace(r"^[^+]*\+\s*", "", regex=True)
+
+    long["ÖĞÜN"] = long["SLOT"].map(MENU_SLOTS)
+    long["ZORUNLU"] = raw.str.contains("(ZORUNLU)", regex=False)
+    long["YEMEK ADI"] = raw.str.replace(" (ZORUNLU)", "", regex=False).str.strip()
+    long = long[~long["YEMEK ADI"].isin(EMPTY_DISHES)]
+    return long[["TARİH", "GÜN", "HAFTA", "SLOT", "ÖĞÜN", "YEMEK ADI", "ZORUNLU"]].reset_index(drop=True)
+
+def pool_meta_frame(pool_df: pd.DataFrame) -> pd.DataFrame:
+    """Havuz tablosundan yemek adı -> protein/ekipman/renk/doku tablosu (aynı isimde ilk satır geçerli)"""
+    cols = ["YEMEK ADI", "KATEGORİ", "PROTEIN_TURU", "PISIRME_EKIPMAN", "RENK", "DOKU"]
+    if pool_df.empty:
+        return pd.DataFrame(columns=cols)
+    meta = pool_df.rename(columns=lambda c: str(c).strip().upper()).reindex(columns=cols).fillna("").astype(str)
+    meta = meta.apply(lambda col: col.str.strip())
+    meta["YEMEK ADI"] = meta["YEMEK ADI"].str.replace(" (ZORUNLU)", "", regex=False).str.strip()
+    return meta[meta["YEMEK ADI"] != ""].drop_duplicates("YEMEK ADI").reset_index(drop=True)
+
+def get_pool_meta() -> pd.DataFrame:
+    """Yemek havuzunun meta tablosu (havuz sürümü başına bir kez türetilir)"""
+    try:
+        return load_menu_pool(get_gspread_client()).meta
+    except Exception:
+        return pool_meta_frame(pd.DataFrame())
+
+class MenuAnalytics:
+    """Bir menünün uzun biçimi ve ondan türetilen tablolar; sonuçlar menü özetine göre saklanır"""
+
+    def __init__(self, df: pd.DataFrame, meta: Optional[pd.DataFrame] = None):
+        self.df = df
+        self.long = melt_menu(df)
+        self.meta = meta
+        self._derived = {}
+
+    def _get(self, name, builder):
+        if name not in self._derived:
+            self._derived[name] = builder()
+        return self._derived[name]
+
+    def zorunlu_count(self) -> int:
+        """'ZORUNLU' geçen hücre sayısı: TARİH/GÜN dışındaki bütün sütunlar, tatil satırları dahil"""
+        def build():
+            cells = self.df.drop(columns=["TARİH", "GÜN"], errors="ignore")
+            return int(sum(cells[c].astype(str).str.contains("ZORUNLU", regex=False, na=False).sum() for c in cells.columns))
+        return self._get("zorunlu", build)
+
+    def meal_stats(self) -> pd.DataFrame:
+        """Kahvaltı hariç yemek başına öğle/akşam/gece sayıları"""
+        def build():
+            meals = self.long[self.long["ÖĞÜN"] != "KAHVALTI"]
+            if meals.empty:
+                return pd.DataFrame()
+            stats = meals.groupby(["YEMEK ADI", "ÖĞÜN"]).size().unstack(fill_value=0).reindex(columns=["ÖĞLE", "AKŞAM", "GECE"], fill_value=0)
+            stats["TOPLAM"] = stats.sum(axis=1)
+            stats = stats.rename_axis(None, axis=1).reset_index()
+            return stats.sort_values(["TOPLAM", "YEMEK ADI"], ascending=[False, True]).reset_index(drop=True)
+        return self._get("meal_stats", build)
+
+    def with_meta(self) -> pd.DataFrame:
+        def build():
+            meta = self.meta if self.meta is not None else pool_meta_frame(pd.DataFrame())
+            out = self.long.merge(meta.drop(columns="KATEGORİ"), on="YEMEK ADI", how="left")
+            return out.fillna({"PROTEIN_TURU": "", "PISIRME_EKIPMAN": "", "RENK": "", "DOKU": ""})
+        return self._get("with_meta", build)
+
+    def weekly_protein_mix(self) -> pd.DataFrame:
+        """Hafta x protein türü: öğle ve akşam ana yemeklerinin dağılımı"""
+        def build():
+            mains = self.with_meta()
+            mains = mains[mains["SLOT"].isin(["ÖĞLE ANA", "AKŞAM ANA"])]
+            if mains.empty:
+                return pd.DataFrame()
+            return mains.groupby(["HAFTA", mains["PROTEIN_TURU"].replace("", "?")]).size().unstack(fill_value=0)
+        return self._get("protein", build)
+
+    def oven_load(self) -> pd.DataFrame:
+        """Gün başına fırın kullanan farklı yemek sayısı (hafta sonu öğle=akşam tek sayılır)"""
+        def build():
+            dishes = self.with_meta().drop_duplicates(["TARİH", "YEMEK ADI"])
+            if dishes.empty:
+                return pd.DataFrame(columns=["TARİH", "GÜN", "FIRIN"])
+            oven = dishes.assign(FIRIN=(dishes["PISIRME_EKIPMAN"] == "FIRIN").astype(int))
+            return oven.groupby(["TARİH", "GÜN"], sort=False)["FIRIN"].sum().reset_index()
+        return self._get("oven", build)
+
+    def distribution(self, column: str) -> pd.DataFrame:
+        """Öğle/akşam kaplarında RENK ya da DOKU dağılımı (öğün x değer)"""
+        def build():
+            meals = self.with_meta()
+            meals = meals[meals["ÖĞÜN"].isin(["ÖĞLE", "AKŞAM"])]
+            if meals.empty:
+                return pd.DataFrame()
+            return meals.groupby(["ÖĞÜN", meals[column].replace("", "?")]).size().unstack(fill_value=0)
+        return self._get(f"dist_{column}", build)
+
+_MENU_ANALYTICS = OrderedDict()
+_MENU_ANALYTICS_LOCK = threading.Lock()
+
+def get_menu_analytics(df: pd.DataFrame, meta: Optional[pd.DataFrame] = None) -> MenuAnalytics:
+    """Aynı menü (ve aynı havuz meta tablosu) için önbellekteki analizi döndürür"""
+    key = (menu_hash(df), id(meta))
+    with _MENU_ANALYTICS_LOCK:
+        entry = _MENU_ANALYTICS.get(key)
+        if entry is not None:
+            _MENU_ANALYTICS.move_to_end(key)
+            return entry
+    with span("menu.analytics", rows=len(df)):
+        entry = MenuAnalytics(df, meta)
+    with _MENU_ANALYTICS_LOCK:
+        # meta nesnesi girdide tutulur: id() yeniden kullanılamaz
+        _MENU_ANALYTICS[key] = entry
+        while len(_MENU_ANALYTICS) > MENU_ANALYTICS_MAX:
+            _MENU_ANALYTICS.popitem(last=False)
+    return entry
+
+def weekly_needs(analytics: MenuAnalytics) -> pd.DataFrame:
+    """Yemek x hafta kaç kez pişirileceği (hafta sonu öğle=akşam tek sayılır)"""
+    long = analytics.long.drop_duplicates(["TARİH", "YEMEK ADI"])
+    if long.empty:
+        return pd.DataFrame()
+    needs = long.groupby(["YEMEK ADI", "HAFTA"], observed=True).size().unstack(fill_value=0)
+    needs["TOPLAM"] = needs.sum(axis=1)
+    return needs.rename_axis(None, axis=1).reset_index().sort_values(["TOPLAM", "YEMEK ADI"], ascending=[False, True])
+
+def export_menu_workbook(df: pd.DataFrame, portions=100) -> bytes:
+    """
+    İndirme anında çağrılır; aynı menü (ve aynı reçete/fiyat görüntüsü) için üretilmiş kitabı
+    yeniden kullanır. portions: sabit sayı ya da (TARİH, ÖĞÜN, PORSİYON) tablosu.
+    Reçeteler okunamazsa malzeme sayfası eklenmez.
+    """
+    def build():
+        analytics = get_menu_analytics(df)
+        try:
+            demand, _ = recete.menu_demand(analytics.long, portions)
+        except Exception:
+            demand = None
+        sheets = [("İstatistik", analytics.meal_stats()), ("İhtiyaç", weekly_needs(analytics))]
+        if demand is not None and not demand.empty:
+            sheets.append(("Malzeme İhtiyacı", demand))
+        return build_menu_workbook(df, sheets)
+
+    portions_key = menu_hash(portions) if isinstance(portions, pd.DataFrame) else portions
+    key = (menu_hash(df), portions_key, recete.source_version())
+    return cached_workbook(key, build)
+
+@traced("menu.compute_meal_stats")
 def compute_meal_stats(df: pd.DataFrame) -> pd.DataFrame:
     """
     Menü DataFrame'inden öğün bazlı yemek sayımı yapar.
     Kahvaltı hariç: Öğle, Akşam, Gece.
     """
-    ogle_cols  = ["ÖĞLE ÇORBA", "ÖĞLE ANA", "ÖĞLE YAN", "ÖĞLE TAMM"]
-    aksam_cols = ["AKŞAM ÇORBA", "AKŞAM ANA", "AKŞAM YAN", "AKŞAM TAMM"]
-    gece_cols  = ["GECE"]
-
-    counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"ÖĞLE": 0, "AKŞAM": 0, "GECE": 0})
-
-    for _, row in df.iterrows():
-        gun = str(row.get("GÜN", ""))
-        if "TATİL" in gun:
-            continue
-
-        for col in ogle_cols:
-            if col in df.columns:
-                val = clean_dish_name(safe_str(row.get(col, "")))
-                if val and val not in ["-", "---", "--- (GÜN YASAĞI)"]:
-                    counts[val]["ÖĞLE"] += 1
-
-        for col in aksam_cols:
-            if col in df.columns:
-                val = clean_dish_name(safe_str(row.get(col, "")))
-                if val and val not in ["-", "---", "--- (GÜN YASAĞI)"]:
-                    counts[val]["AKŞAM"] += 1
-
-        for col in gece_cols:
-            if col in df.columns:
-                raw = safe_str(row.get(col, ""))
-                if "+" in raw:
-                    val = clean_dish_name(raw.split("+", 1)[1].strip())
-                else:
-                    val = clean_dish_name(raw)
-                if val and val not in ["-", "---"]:
-                    counts[val]["GECE"] += 1
-
-    if not counts:
-        return pd.DataFrame()
-
-    rows = []
-    for yemek, oguns in counts.items():
-        toplam = oguns["ÖĞLE"] + oguns["AKŞAM"] + oguns["GECE"]
-        rows.append({
-            "YEMEK ADI": yemek,
-            "ÖĞLE": oguns["ÖĞLE"],
-            "AKŞAM": oguns["AKŞAM"],
-            "GECE": oguns["GECE"],
-            "TOPLAM": toplam
-        })
-
-    stats_df = pd.DataFrame(rows).sort_values("TOPLAM", ascending=False).reset_index(drop=True)
-    return stats_df
+    return get_menu_analytics(df).meal_stats()
 
 
 def render_stats_tab(df: pd.DataFrame):
@@ -570,7 +973,8 @@ def render_stats_tab(df: pd.DataFrame):
     st.subheader("📊 Aylık Yemek Kullanım İstatistikleri")
     st.caption("Kahvaltı hariç; Öğle, Akşam ve Gece atıştırmalıkları bazında kaç kez çıktığı gösterilmektedir.")
 
-    stats_df = compute_meal_stats(df)
+    analytics = get_menu_analytics(df)
+    stats_df = analytics.meal_stats()
 
     if stats_df.empty:
         st.info("İstatistik oluşturmak için önce bir menü üretin.")
@@ -582,6 +986,13 @@ def render_stats_tab(df: pd.DataFrame):
     with col_f2:
         min_count = st.number_input("Min. tekrar sayısı", min_value=1, value=1, step=1)
 
+    # Menünün ayından önceki 6 ayda kaç kez çıktığı (arşivden)
+    first = pd.to_datetime(df["TARİH"], format="%d.%m.%Y", errors="coerce").min()
+    if pd.notna(first):
+        first_day = first.date().replace(day=1)
+        history = archive_counts(months_back(first_day, 6), first_day)
+        stats_df = stats_df.assign(**{"SON 6 AY": stats_df["YEMEK ADI"].map(history).fillna(0).astype(int)})
+
     filtered = stats_df[stats_df["TOPLAM"] >= min_count]
     if search:
         filtered = filtered[filtered["YEMEK ADI"].str.contains(search, case=False, na=False)]
@@ -631,21 +1042,60 @@ def render_stats_tab(df: pd.DataFrame):
         top_gece = stats_df.nlargest(5, "GECE")[["YEMEK ADI", "GECE"]]
         st.dataframe(top_gece, hide_index=True, use_container_width=True)
 
+    # ── Havuz bilgisiyle analiz (protein / fırın / renk-doku) ──
+    st.divider()
+    st.markdown("#### 🔬 Menü Analizi")
+    analytics = get_menu_analytics(df, get_pool_meta())
+
+    protein = analytics.weekly_protein_mix()
+    if not protein.empty:
+        st.markdown("🥩 **Haftalık protein dağılımı** (öğle + akşam ana yemek)")
+        st.bar_chart(protein)
+
+    oven = analytics.oven_load()
+    if not oven.empty:
+        o1, o2 = st.columns([3, 1])
+        with o1:
+            st.markdown("🔥 **Günlük fırın yükü** (fırın kullanan farklı yemek)")
+            st.bar_chart(oven.set_index("TARİH")["FIRIN"])
+        with o2:
+            st.metric("Fırınlı Gün", int((oven["FIRIN"] > 0).sum()))
+            st.metric("2+ Fırın Yemeği Olan Gün", int((oven["FIRIN"] >= 2).sum()))
+
+    col_r, col_d = st.columns(2)
+    with col_r:
+        st.markdown("🎨 **Renk dağılımı**")
+        st.dataframe(analytics.distribution("RENK"), use_container_width=True)
+    with col_d:
+        st.markdown("🥄 **Doku dağılımı**")
+        st.dataframe(analytics.distribution("DOKU"), use_container_width=True)
+
 # =========================================================
 # 📅 GURME PLANLAMA DÖNGÜSÜ
 # =========================================================
 
-def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish_pref, target_meatless):
-    """Ana menü oluşturma fonksiyonu"""
+@traced("menu.generate_gourmet_menu")
+def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish_pref, target_meatless, progress=None, priors=None, costs=None, budget=None):
+    """
+    Ana menü oluşturma fonksiyonu (progress: gün başına çağrılan (oran, mesaj) geri çağrısı,
+    priors: yemek adı -> geçmiş aylardaki aylık ortalama kullanım,
+    costs: yemek adı -> porsiyon maliyeti, budget: kişi başı aylık bütçe (TL);
+    bütçe verilmezse maliyet seçimi etkilemez)
+    """
 
     num_days = calendar.monthrange(year, month)[1]
     menu_log = []
-    usage_history = {}
+    usage_history = UsageTracker(pool)
+    if priors:
+        usage_history.set_priors(priors)
     # Başlangıç değeri olarak çok eski bir ordinal — ilk bakliyat seçimini engellemez
     global_history = {'last_legume': datetime(2000, 1, 1).toordinal()}
 
     analyzer = PoolAnalyzer(pool)
     selector = DishSelector(pool, analyzer)
+    if costs and budget:
+        selector.set_costs(costs)
+    spent, active_done = 0.0, 0
 
     fish_day = None
     if fish_pref == "Otomatik":
@@ -670,6 +1120,8 @@ def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish
         if not any(h[0] <= datetime(year, month, d).date() <= h[1] for h in holidays)
     )
     strict_alternating = (target_meatless == active_days)
+    # Bütçe: kişi başı harcama, geçen aktif günlere düşen paydan ne kadar saparsa pahalı yemek cezası o kadar ağırlaşır
+    daily_budget = (budget / active_days) if (costs and budget and active_days) else None
 
     # Dönüşümlü modda hangi öğünün etsiz olacağını önceden belirle:
     # Çift günler → öğle etsiz, tek günler → akşam etsiz (dönüşümlü dağılım)
@@ -690,6 +1142,8 @@ def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish
         d_str = curr_date.strftime("%d.%m.%Y")
         w_idx = curr_date.weekday()
         w_name = GUNLER_TR[w_idx]
+        if progress:
+            progress((day - 1) / num_days, f"{d_str} planlanıyor")
 
         if any(h[0] <= curr_date.date() <= h[1] for h in holidays):
             menu_log.append({
@@ -709,6 +1163,10 @@ def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish
             prev_dishes = []
             continue
 
+        if daily_budget and active_done:
+            pace = spent / (daily_budget * active_done)
+            selector.cost_pressure = min(max(pace, 0.5), 2.0) ** 2
+
         OVEN_LOCKED = False
         daily_exclude = prev_dishes.copy()
 
@@ -941,6 +1399,11 @@ def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish
             "GECE": f"Çay/Kahve + {safe_str(snack.get('YEMEK ADI'))}"
         })
 
+        if costs:
+            served = [k_str, o_corba, o_ana, o_yan, o_tamm, a_corba, a_ana, a_yan, a_tamm, snack]
+            spent += sum(costs.get(clean_dish_name(d if isinstance(d, str) else safe_str(d.get('YEMEK ADI'))), 0) for d in served)
+        active_done += 1
+
         prev_dishes = [
             safe_str(o_corba.get('YEMEK ADI')),
             safe_str(o_ana.get('YEMEK ADI')),
@@ -951,6 +1414,154 @@ def generate_gourmet_menu(month, year, pool, holidays, ready_snack_indices, fish
 
     return pd.DataFrame(menu_log)
 
+@register("menu.olustur")
+def menu_generation_job(ctx, month, year, holidays, ready_snack_indices, fish_pref, target_meatless, budget=0):
+    """Arka plan işi: havuzu okur, menüyü üretir ve AKTIF_MENU'ye kaydeder"""
+    client = get_gspread_client()
+    if not client:
+        raise JobError("Bağlantı hatası!")
+    pool = get_full_menu_pool(client)
+    if not pool:
+        raise JobError("Yemek havuzu boş!")
+
+    # Plan kaydedilir; kayıt adımında süreç ölürse aynı menü yeniden üretilmeden yazılır
+    def plan():
+        df = generate_gourmet_menu(
+            month=month,
+            year=year,
+            pool=pool,
+            holidays=[(date.fromisoformat(a), date.fromisoformat(b)) for a, b in holidays],
+            ready_snack_indices=ready_snack_indices,
+            fish_pref=fish_pref,
+            target_meatless=target_meatless,
+            progress=lambda frac, msg: ctx.progress(frac * 0.9, msg),
+            priors=archive_priors(date(year, month, 1)),
+            costs=recete.cost_map(recete.get_dish_costs()),
+            budget=budget or None
+        )
+        return df.to_dict('records')
+
+    records = ctx.step("plan", plan)
+    ctx.progress(0.95, "Kaydediliyor")
+    if not ctx.step("kaydet", lambda: save_menu_to_sheet(client, pd.DataFrame(records))):
+        raise JobError("Kayıt sırasında hata oluştu!")
+    return records
+
+# =========================================================
+# 🧪 PARAMETRE TARAMASI
+# =========================================================
+# Etsiz hedefi / balık günü / hazır atıştırmalık günleri / tatil seçeneklerinin her
+# kombinasyonu ayrı süreçlerde üretilir ve karşılaştırma tablosu döner. Menüler
+# kaydedilmez; tablo en iyi ayarı bulmak içindir. Havuz her işçiye bir kez gönderilir.
+
+_SWEEP_POOL = None
+_SWEEP_META = None
+_SWEEP_PRIORS = None
+_SWEEP_COSTS = None
+
+def sweep_grid(targets, fish_prefs, snack_sets, holiday_sets, budgets=(0,)):
+    """Seçeneklerin kartezyen çarpımı; her biri JSON'a çevrilebilir ayar sözlüğü (budget 0: bütçesiz)"""
+    return [
+        {"target_meatless": t, "fish_pref": f, "ready_snack_indices": list(sn), "holidays": [list(h) for h in hol], "budget": b}
+        for t, f, sn, hol, b in itertools.product(targets, fish_prefs, snack_sets, holiday_sets, budgets)
+    ]
+
+def _sweep_init(pool, priors, costs=None):
+    global _SWEEP_POOL, _SWEEP_META, _SWEEP_PRIORS, _SWEEP_COSTS
+    _SWEEP_POOL = pool
+    _SWEEP_META = pool_meta_frame(pd.DataFrame(pool))
+    _SWEEP_PRIORS = priors
+    _SWEEP_COSTS = costs
+
+def menu_metrics(df: pd.DataFrame, meta: pd.DataFrame, target_meatless: int, costs: Optional[Dict[str, float]] = None) -> Dict:
+    """Bir menünün karşılaştırma ölçüleri (costs verilirse kişi başı aylık MALİYET de)"""
+    analytics = MenuAnalytics(df, meta)
+    stats = analytics.meal_stats()
+    mains = analytics.with_meta()
+    # Hafta sonu öğle ve akşam aynı kap: gün başına bir kez sayılır
+    mains = mains[mains["SLOT"].isin(["ÖĞLE ANA", "AKŞAM ANA"])].drop_duplicates(["TARİH", "YEMEK ADI"])
+    meatless = int((mains["PROTEIN_TURU"] == "ETSİZ").sum())
+    oven = analytics.oven_load()
+    cost = {"MALİYET": round(float(analytics.long["YEMEK ADI"].map(costs).fillna(0).sum()), 2)} if costs else {}
+    return {
+        "ZORUNLU": analytics.zorunlu_count(),
+        "TEKRAR": int((stats["TOPLAM"] - 1).clip(lower=0).sum()) if not stats.empty else 0,
+        "ETSİZ": meatless,
+        "SAPMA": meatless - target_meatless,
+        "FIRINLI GÜN": int((oven["FIRIN"] > 0).sum()) if not oven.empty else 0,
+        **cost,
+    }
+
+def _sweep_run(month, year, config, seed):
+    random.seed(seed)
+    t0 = time.perf_counter()
+    df = generate_gourmet_menu(
+        month=month,
+        year=year,
+        pool=_SWEEP_POOL,
+        holidays=[(date.fromisoformat(a), date.fromisoformat(b)) for a, b in config["holidays"]],
+        ready_snack_indices=config["ready_snack_indices"],
+        fish_pref=config["fish_pref"],
+        target_meatless=config["target_meatless"],
+        priors=_SWEEP_PRIORS,
+        costs=_SWEEP_COSTS,
+        budget=config.get("budget") or None,
+    )
+    runtime = (time.perf_counter() - t0) * 1000
+    return {**menu_metrics(df, _SWEEP_META, config["target_meatless"], _SWEEP_COSTS), "SÜRE_MS": round(runtime, 1)}
+
+def run_parameter_sweep(pool, month, year, configs, seeds=(0,), priors=None, costs=None, max_workers=None, progress=None):
+    """
+    Her ayarı her tohumla ayrı süreçte üretir; ayar başına tohum ortalaması içeren tabloyu döndürür.
+    progress(oran, mesaj) her tamamlanan üretimde çağrılır.
+    """
+    max_workers = max_workers or int(get_setting("SWEEP_WORKERS", 0) or 0) or os.cpu_count() or 2
+    tasks = [(i, seed) for i in range(len(configs)) for seed in seeds]
+    results = defaultdict(list)
+    # spawn: Streamlit sunucusunun iş parçacıklı süreci fork edilmez
+    ctx = multiprocessing.get_context("spawn")
+    with span("menu.sweep", configs=len(configs), runs=len(tasks), workers=max_workers):
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), mp_context=ctx,
+                                 initializer=_sweep_init, initargs=(pool, priors, costs)) as ex:
+            futures = {ex.submit(_sweep_run, month, year, configs[i], seed): i for i, seed in tasks}
+            for done, fut in enumerate(as_completed(futures), start=1):
+                results[futures[fut]].append(fut.result())
+                if progress:
+                    progress(done / len(tasks), f"{done}/{len(tasks)} menü")
+
+    rows = []
+    for i, cfg in enumerate(configs):
+        runs = pd.DataFrame(results[i])
+        rows.append({
+            "ETSİZ HEDEF": cfg["target_meatless"],
+            "BALIK": cfg["fish_pref"],
+            "HAZIR GECE": ", ".join(GUNLER_TR[d] for d in cfg["ready_snack_indices"]) or "-",
+            "TATİL": ", ".join(f"{a}→{b}" for a, b in cfg["holidays"]) or "-",
+            "BÜTÇE": f"{cfg['budget']:g} TL" if cfg.get("budget") else "-",
+            **runs.mean().round(1).to_dict(),
+            "HEDEF TUTTU": f"{int((runs['SAPMA'] == 0).sum())}/{len(runs)}",
+        })
+    table = pd.DataFrame(rows)
+    table["_ABS"] = table["SAPMA"].abs()
+    return table.sort_values(["ZORUNLU", "_ABS", "TEKRAR"]).drop(columns="_ABS").reset_index(drop=True)
+
+@register("menu.tarama")
+def parameter_sweep_job(ctx, month, year, configs, seeds):
+    """Arka plan işi: parametre taraması (menüler kaydedilmez)"""
+    client = get_gspread_client()
+    if not client:
+        raise JobError("Bağlantı hatası!")
+    pool = get_full_menu_pool(client)
+    if not pool:
+        raise JobError("Yemek havuzu boş!")
+    table = run_parameter_sweep(
+        pool, month, year, configs, seeds=seeds,
+        priors=archive_priors(date(year, month, 1)),
+        costs=recete.cost_map(recete.get_dish_costs()),
+        progress=lambda frac, msg: ctx.progress(frac, msg)
+    )
+    return table.to_dict('records')
+
 # =========================================================
 # 🖥️ ARAYÜZ (GURME UI)
 # =========================================================
@@ -968,6 +1579,8 @@ def render_page(sel_model):
         saved_df = load_last_menu(client)
         if saved_df is not None:
             st.session_state['generated_menu'] = saved_df
+            # Arşiv öncesinden kalan aktif menü de geçmişe girsin
+            archive_menu(saved_df, replace=False)
 
     col1, col2 = st.columns(2)
 
@@ -996,7 +1609,7 @@ def render_page(sel_model):
 
     st.divider()
 
-    c1, c2 = st.columns(2)
+    c1, c2, c3 = st.columns(3)
     with c1:
         fish_pref = st.selectbox(
             "Balık Günü",
@@ -1009,52 +1622,113 @@ def render_page(sel_model):
             max_value=30,
             value=12
         )
+    with c3:
+        budget = st.number_input(
+            "Kişi Başı Aylık Bütçe (TL)",
+            min_value=0.0,
+            value=0.0,
+            step=100.0,
+            help="0: bütçe yok, maliyet yemek seçimini etkilemez. Bütçe girilirse (reçete ve fiyat varsa) pahalı yemekler bütçe temposuna göre cezalandırılır."
+        )
 
-    if st.button("🚀 Gurme Menü Oluştur", type="primary"):
-        with st.spinner("👨‍🍳 Şef mutfakta, akıllı algoritma çalışıyor..."):
-            pool = get_full_menu_pool(client)
-
-            if not pool:
-                st.error("Yemek havuzu boş!")
-                st.stop()
-
-            holidays = []
+    try:
+        pool_info = load_menu_pool(client)
+    except Exception as e:
+        pool_info = None
+        st.error(f"Havuz Okuma Hatası: {e}")
+    if pool_info is not None:
+        report = pool_info.report
+        with st.expander(f"🩺 Havuz Kontrolü — {len(pool_info.pool)} yemek, {len(report)} sorun", expanded=False):
+            if report.empty:
+                st.success("Havuzda sorun bulunamadı.")
+            else:
+                st.dataframe(report, hide_index=True, use_container_width=True)
+
+    if st.button("🚀 Gurme Menü Oluştur", type="primary", disabled='menu_job' in st.session_state):
+        holidays = []
+        if h_start and h_end:
+            holidays = [(h_start.isoformat(), h_end.isoformat())]
+
+        # Üretim + kayıt arka planda koşar; ilerleme aşağıda izlenir
+        st.session_state['menu_job'] = submit("menu.olustur", {
+            "month": sel_month,
+            "year": int(sel_year),
+            "holidays": holidays,
+            "ready_snack_indices": [GUNLER_TR.index(d) for d in ready_days],
+            "fish_pref": fish_pref,
+            "target_meatless": target_meatless,
+            "budget": budget,
+        }, label="👨‍🍳 Gurme menü")
+
+    if 'menu_job' in st.session_state:
+        def on_done(records):
+            st.session_state['generated_menu'] = pd.DataFrame(records)
+            st.session_state['menu_job_ok'] = True
+        render_job(st.session_state['menu_job'], on_done)
+        if st.session_state.get(f"job_done_{st.session_state['menu_job']}"):
+            del st.session_state['menu_job']
+
+    if st.session_state.pop('menu_job_ok', False):
+        st.balloons()
+
+    # ── Parametre Taraması ──────────────────────
+    with st.expander("🧪 Parametre Taraması (ne olurdu?)", expanded='sweep_job' in st.session_state):
+        st.caption("Seçilen ayarların her kombinasyonu paralel üretilir ve karşılaştırılır; menüler kaydedilmez.")
+        s1, s2 = st.columns(2)
+        with s1:
+            sweep_targets = st.multiselect("Etsiz hedefleri", list(range(0, 31)), default=sorted({max(target_meatless - 2, 0), target_meatless, min(target_meatless + 2, 30)}))
+            sweep_fish = st.multiselect("Balık günü seçenekleri", ["Otomatik", "Yok"] + GUNLER_TR, default=[fish_pref])
+        with s2:
+            snack_opts = {"Seçili günler": [GUNLER_TR.index(d) for d in ready_days], "Hiç": [], "Hafta sonu": [5, 6]}
+            sweep_snacks = st.multiselect("Hazır gece atıştırmalık", list(snack_opts), default=["Seçili günler"])
+            holiday_opts = {"Tatil yok": []}
             if h_start and h_end:
-                holidays = [(h_start, h_end)]
-
-            ready_snack_indices = [GUNLER_TR.index(d) for d in ready_days]
-
-            df_menu = generate_gourmet_menu(
-                month=sel_month,
-                year=sel_year,
-                pool=pool,
-                holidays=holidays,
-                ready_snack_indices=ready_snack_indices,
-                fish_pref=fish_pref,
-                target_meatless=target_meatless
+                holiday_opts["Seçili tatil"] = [(h_start.isoformat(), h_end.isoformat())]
+            sweep_holidays = st.multiselect("Tatil", list(holiday_opts), default=list(holiday_opts)[-1:])
+            budget_opts = {"Bütçesiz": 0}
+            if budget:
+                budget_opts[f"{budget:g} TL"] = budget
+            sweep_budgets = st.multiselect("Bütçe", list(budget_opts), default=list(budget_opts)[-1:])
+            sweep_seeds = st.number_input("Ayar başına deneme", min_value=1, max_value=10, value=3)
+
+        configs = sweep_grid(
+            sweep_targets, sweep_fish, [snack_opts[k] for k in sweep_snacks], [holiday_opts[k] for k in sweep_holidays],
+            [budget_opts[k] for k in sweep_budgets]
+        )
+        if st.button(f"🧪 {len(configs)} ayarı dene", disabled=not configs or 'sweep_job' in st.session_state):
+            st.session_state['sweep_job'] = submit("menu.tarama", {
+                "month": sel_month,
+                "year": int(sel_year),
+                "configs": configs,
+                "seeds": list(range(int(sweep_seeds))),
+            }, label="🧪 Parametre taraması")
+
+        if 'sweep_job' in st.session_state:
+            def on_sweep_done(rows):
+                st.session_state['sweep_result'] = pd.DataFrame(rows)
+            render_job(st.session_state['sweep_job'], on_sweep_done)
+            if st.session_state.get(f"job_done_{st.session_state['sweep_job']}"):
+                del st.session_state['sweep_job']
+
+        if 'sweep_result' in st.session_state:
+            sweep_df = st.session_state['sweep_result']
+            best = sweep_df.iloc[0]
+            st.success(
+                f"🏆 En iyi: etsiz hedefi {best['ETSİZ HEDEF']}, balık {best['BALIK']}, "
+                f"hazır gece {best['HAZIR GECE']} — ortalama {best['ZORUNLU']} ZORUNLU, {best['TEKRAR']} tekrar"
             )
-
-            if save_menu_to_sheet(client, df_menu):
-                st.session_state['generated_menu'] = df_menu
-                st.success("✅ Menü başarıyla oluşturuldu ve kaydedildi!")
-                st.balloons()
-                st.rerun()
-            else:
-                st.error("Kayıt sırasında hata oluştu!")
+            st.dataframe(sweep_df, hide_index=True, use_container_width=True)
 
     # ── Menü ve İstatistik Sekmeleri ──────────────────────
     if 'generated_menu' in st.session_state:
         st.divider()
-        tab1, tab2 = st.tabs(["📋 Menü", "📊 İstatistikler"])
+        tab1, tab2, tab3 = st.tabs(["📋 Menü", "📊 İstatistikler", "🛒 Malzeme İhtiyacı"])
 
         with tab1:
             st.subheader("📋 Oluşturulan Menü")
             df = st.session_state['generated_menu']
 
-            zorunlu_count = 0
-            for col in df.columns:
-                if col not in ['TARİH', 'GÜN']:
-                    zorunlu_count += df[col].astype(str).str.contains('ZORUNLU', na=False).sum()
+            zorunlu_count = get_menu_analytics(df).zorunlu_count()
 
             if zorunlu_count > 0:
                 st.warning(f"⚠️ Toplam {zorunlu_count} adet '(ZORUNLU)' etiketli yemek var.")
@@ -1077,27 +1751,12 @@ def render_page(sel_model):
                         st.error("❌ Kayıt başarısız!")
 
             with col_btn2:
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                    edited.to_excel(writer, index=False, sheet_name='Menü')
-                    workbook = writer.book
-                    worksheet = writer.sheets['Menü']
-                    header_format = workbook.add_format({
-                        'bold': True,
-                        'bg_color': '#4CAF50',
-                        'font_color': 'white',
-                        'border': 1
-                    })
-                    workbook.add_format({'border': 1, 'text_wrap': True, 'valign': 'vcenter'})
-                    worksheet.set_column('A:A', 12)
-                    worksheet.set_column('B:B', 15)
-                    worksheet.set_column('C:K', 25)
-                    for col_num, value in enumerate(edited.columns.values):
-                        worksheet.write(0, col_num, value, header_format)
-                buffer.seek(0)
+                # Kitap sayfa yenilenirken değil, düğmeye basılınca üretilir
+                menu_df = edited
+                portions = recete.selected_portions(get_menu_analytics(menu_df).long, holidays_from_menu(menu_df))
                 st.download_button(
                     label="📥 Excel Olarak İndir",
-                    data=buffer,
+                    data=lambda: export_menu_workbook(menu_df, portions),
                     file_name=f"menu_{sel_year}_{sel_month:02d}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     use_container_width=True
@@ -1105,3 +1764,7 @@ def render_page(sel_model):
 
         with tab2:
             render_stats_tab(st.session_state['generated_menu'])
+
+        with tab3:
+            df = st.session_state['generated_menu']
+            recete.render_demand_tab(get_menu_analytics(df).long, holidays_from_menu(df))
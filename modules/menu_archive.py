@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from modules.tracing import span
+
+# =========================================================
+# 🗄️ MENÜ ARŞİVİ
+# =========================================================
+# AKTIF_MENU her kayıtta silinip yeniden yazıldığı için geçmiş aylar kayboluyordu.
+# Kaydedilen her ay data/menu_archive.sqlite'a gün x kap satırları olarak eklenir
+# (aynı ay tekrar kaydedilirse o ayın satırları değiştirilir). Tarih, yemek ve kap
+# indeksleri sayesinde "X son 6 ayda kaç kez çıktı" sorguları milisaniyede döner;
+# planlayıcı bu sayıları geçmiş kullanım cezası olarak kullanır.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS menus (
+    month TEXT PRIMARY KEY,
+    menu_hash TEXT,
+    rows INTEGER,
+    saved REAL
+);
+CREATE TABLE IF NOT EXISTS menu_items (
+    month TEXT NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    meal TEXT NOT NULL,
+    dish TEXT NOT NULL,
+    forced INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_items_day ON menu_items(day);
+CREATE INDEX IF NOT EXISTS ix_items_dish_day ON menu_items(dish, day);
+CREATE INDEX IF NOT EXISTS ix_items_slot_day ON menu_items(slot, day);
+CREATE INDEX IF NOT EXISTS ix_items_month ON menu_items(month);
+"""
+
+def months_back(first_day, months):
+    """first_day'den months ay önceki ayın ilk günü"""
+    idx = first_day.year * 12 + first_day.month - 1 - months
+    return date(idx // 12, idx % 12 + 1, 1)
+
+class MenuArchive:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # --- Yazma ---
+    def store(self, long_df, menu_hash="", replace=True):
+        """
+        melt_menu çıktısını (TARİH gg.aa.yyyy, SLOT, ÖĞÜN, YEMEK ADI, ZORUNLU) aylara bölerek yazar.
+        replace=False ise arşivde zaten olan aylar atlanır. Yazılan ayları döndürür.
+        """
+        if long_df.empty:
+            return []
+        day = long_df["TARİH"].str.slice(6, 10) + "-" + long_df["TARİH"].str.slice(3, 5) + "-" + long_df["TARİH"].str.slice(0, 2)
+        month = day.str.slice(0, 7)
+        written = []
+        with span("menu_archive.store", rows=len(long_df)), self._conn() as conn:
+            known = {r[0] for r in conn.execute("SELECT month FROM menus")}
+            for m in sorted(month.unique()):
+                if not replace and m in known:
+                    continue
+                part = long_df[month == m]
+                conn.execute("DELETE FROM menu_items WHERE month = ?", (m,))
+                conn.executemany(
+                    "INSERT INTO menu_items (month, day, slot, meal, dish, forced) VALUES (?, ?, ?, ?, ?, ?)",
+                    zip([m] * len(part), day[month == m], part["SLOT"], part["ÖĞÜN"], part["YEMEK ADI"], part["ZORUNLU"].astype(int))
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO menus (month, menu_hash, rows, saved) VALUES (?, ?, ?, ?)",
+                    (m, menu_hash, len(part), time.time())
+                )
+                written.append(m)
+        return written
+
+    # --- Sorgular ---
+    def months(self):
+        with self._conn() as conn:
+            return [r[0] for r in conn.execute("SELECT month FROM menus ORDER BY month")]
+
+    def dish_counts(self, since, until=None, slots=None):
+        """[since, until) aralığında yemek -> kaç kez çıktı (tarihler date ya da ISO metin)"""
+        q, args = "SELECT dish, COUNT(*) FROM menu_items WHERE day >= ?", [str(since)]
+        if until:
+            q += " AND day < ?"
+            args.append(str(until))
+        if slots:
+            q += f" AND slot IN ({','.join('?' * len(slots))})"
+            args += list(slots)
+        with self._conn() as conn:
+            return dict(conn.execute(q + " GROUP BY dish", args).fetchall())
+
+    def dish_history(self, dish, months=6, today=None):
+        """Bir yemeğin son months aydaki kullanım sayısı ve son çıktığı gün"""
+        since = months_back((today or date.today()).replace(day=1), months)
+        with self._conn() as conn:
+            count, last = conn.execute(
+                "SELECT COUNT(*), MAX(day) FROM menu_items WHERE dish = ? AND day >= ?", (dish, since.isoformat())
+            ).fetchone()
+        return {"count": count, "last_day": last}
+
+    def usage_priors(self, first_day, months=6):
+        """
+        first_day ayından önceki months ayda yemek başına aylık ortalama kullanım.
+        Ortalama arşivde bulunan ay sayısına bölünür (arşiv yeni başladıysa düşük çıkmasın).
+        Planlanan ayın kendisi (yeniden üretiliyorsa) hesaba katılmaz.
+        """
+        since = months_back(first_day, months)
+        with self._conn() as conn:
+            archived = conn.execute(
+                "SELECT COUNT(*) FROM menus WHERE month >= ? AND month < ?",
+                (since.isoformat()[:7], first_day.isoformat()[:7])
+            ).fetchone()[0]
+        if not archived:
+            return {}
+        counts = self.dish_counts(since, first_day)
+        return {dish: n / archived for dish, n in counts.items()}
+
+# =========================================================
+# ⚙️ PAYLAŞIMLI ARŞİV
+# =========================================================
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_menu_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            from modules.utils import get_setting, LOCAL_DATA_DIR
+            _archive = MenuArchive(get_setting("MENU_ARCHIVE_PATH", os.path.join(LOCAL_DATA_DIR, "menu_archive.sqlite")))
+        return _archive
@@ -0,0 +1,117 @@
+import io
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from modules.tracing import span
+
+# =========================================================
+# 📥 MENÜ EXCEL ÇIKTISI
+# =========================================================
+# Çalışma kitabı sayfa her yenilendiğinde değil, sadece indirme istendiğinde üretilir
+# (st.download_button'a fonksiyon verilir). xlsxwriter constant_memory kipinde satır
+# satır yazılır: tüm hücreler bellekte tutulmaz, bu yüzden satırlar sırayla ve
+# her satır tek seferde yazılır (pandas.to_excel sütun sütun yazdığı için kullanılmaz).
+# Üretilen baytlar menü özetine göre saklanır; aynı menü ikinci kez üretilmez.
+
+EXPORT_CACHE_MAX = 4
+PRINT_SLOTS = [
+    "KAHVALTI", "ÖĞLE ÇORBA", "ÖĞLE ANA", "ÖĞLE YAN", "ÖĞLE TAMM",
+    "AKŞAM ÇORBA", "AKŞAM ANA", "AKŞAM YAN", "AKŞAM TAMM", "GECE",
+]
+WEEKDAYS_TR = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cumartesi", "Pazar"]
+
+_CACHE = OrderedDict()
+_LOCK = threading.Lock()
+
+def cached_workbook(key, build):
+    """key için üretilmiş baytları döndürür; yoksa build() ile üretip saklar"""
+    with _LOCK:
+        data = _CACHE.get(key)
+        if data is not None:
+            _CACHE.move_to_end(key)
+            return data
+    data = build()
+    with _LOCK:
+        _CACHE[key] = data
+        while len(_CACHE) > EXPORT_CACHE_MAX:
+            _CACHE.popitem(last=False)
+    return data
+
+def _cell(v):
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return ""
+    return v.item() if hasattr(v, "item") else v
+
+def _write_table(ws, frame, header_fmt, cell_fmt, start_row=0):
+    """DataFrame'i başlıkla birlikte satır satır yazar; sonraki boş satırın numarasını döndürür"""
+    ws.write_row(start_row, 0, [str(c) for c in frame.columns], header_fmt)
+    for i, row in enumerate(frame.itertuples(index=False, name=None), start=start_row + 1):
+        ws.write_row(i, 0, [_cell(v) for v in row], cell_fmt)
+    return start_row + len(frame) + 1
+
+def _weekly_blocks(df):
+    """Menüyü haftalara böler: [(başlık, [(gün başlığı, {slot: yemek})...])]"""
+    days = pd.to_datetime(df["TARİH"].astype(str), format="%d.%m.%Y", errors="coerce")
+    monday = days - pd.to_timedelta(days.dt.weekday, unit="D")
+    blocks = []
+    for week in sorted(monday.dropna().unique()):
+        rows = df[monday == week]
+        cols = []
+        for (_, r), d in zip(rows.iterrows(), days[monday == week]):
+            cols.append((f"{WEEKDAYS_TR[d.weekday()]}\n{d:%d.%m}", {s: str(r.get(s, "")) for s in PRINT_SLOTS}))
+        blocks.append((f"{pd.Timestamp(week):%d.%m.%Y} haftası", cols))
+    return blocks
+
+def build_menu_workbook(df, extra_sheets=()):
+    """
+    Menü kitabını üretir ve baytlarını döndürür.
+    Sayfalar: Menü, extra_sheets'teki (ad, DataFrame) çiftleri, Haftalık Baskı.
+    """
+    import xlsxwriter
+
+    buf = io.BytesIO()
+    with span("menu.export_xlsx", rows=len(df), sheets=len(extra_sheets) + 2):
+        wb = xlsxwriter.Workbook(buf, {"constant_memory": True})
+        header_fmt = wb.add_format({"bold": True, "bg_color": "#4CAF50", "font_color": "white", "border": 1})
+        cell_fmt = wb.add_format({"border": 1, "text_wrap": True, "valign": "vcenter"})
+        title_fmt = wb.add_format({"bold": True, "font_size": 14})
+        day_fmt = wb.add_format({"bold": True, "bg_color": "#E8F5E9", "border": 1, "text_wrap": True, "align": "center"})
+        slot_fmt = wb.add_format({"bold": True, "border": 1, "bg_color": "#F5F5F5"})
+
+        # Menü (eski indirmeyle aynı görünüm)
+        ws = wb.add_worksheet("Menü")
+        ws.set_column("A:A", 12)
+        ws.set_column("B:B", 15)
+        ws.set_column("C:K", 25)
+        ws.freeze_panes(1, 0)
+        _write_table(ws, df, header_fmt, cell_fmt)
+
+        for name, frame in extra_sheets:
+            ws = wb.add_worksheet(name[:31])
+            ws.set_column(0, 0, 30)
+            ws.set_column(1, max(len(frame.columns) - 1, 1), 14)
+            ws.freeze_panes(1, 0)
+            _write_table(ws, frame, header_fmt, cell_fmt)
+
+        # Haftalık baskı: her hafta bir sayfa (yatay, tek sayfa genişliğinde)
+        ws = wb.add_worksheet("Haftalık Baskı")
+        ws.set_landscape()
+        ws.set_paper(9)  # A4
+        ws.fit_to_pages(1, 0)
+        ws.set_column(0, 0, 14)
+        ws.set_column(1, 7, 22)
+        row, breaks = 0, []
+        for title, cols in _weekly_blocks(df):
+            if row:
+                breaks.append(row)
+            ws.write(row, 0, title, title_fmt)
+            ws.write_row(row + 1, 0, ["Öğün"] + [c[0] for c in cols], day_fmt)
+            for i, slot in enumerate(PRINT_SLOTS, start=row + 2):
+                ws.write(i, 0, slot, slot_fmt)
+                ws.write_row(i, 1, [c[1][slot] for c in cols], cell_fmt)
+            row += len(PRINT_SLOTS) + 3
+        ws.set_h_pagebreaks(breaks)
+        wb.close()
+    return buf.getvalue()
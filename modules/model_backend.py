@@ -0,0 +1,362 @@
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from modules.tracing import span, record
+
+# =========================================================
+# 🤖 MODEL ARKA UCU (generateContent)
+# =========================================================
+# Fatura / irsaliye / dekont analizleri modeli bu arayüz üzerinden çağırır.
+#   google  : canlı Generative Language REST API (MODEL_BASE_URL ile yerel sunucuya da yönlenebilir)
+#   fixture : kayıtlı cevapları belge hash'ine göre yerelden oynatır (ağsız)
+#   record  : canlı çağrı yapar, cevabı fixture olarak diske yazar
+
+GOOGLE_BASE_URL = "https://generativelanguage.googleapis.com"
+SAFETY_SETTINGS = [{"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}]
+
+class ModelError(Exception):
+    pass
+
+def clean_model_name(model_name):
+    return model_name.replace("models/", "") if model_name else model_name
+
+def build_payload(prompt, data=None, mime_type=None, generation_config=None):
+    """Tek istemli (prompt + isteğe bağlı belge) generateContent gövdesi"""
+    parts = [{"text": prompt}]
+    if data is not None:
+        parts.append({"inline_data": {"mime_type": mime_type, "data": base64.b64encode(data).decode("utf-8")}})
+    payload = {"contents": [{"parts": parts}], "safetySettings": SAFETY_SETTINGS}
+    if generation_config:
+        payload["generationConfig"] = generation_config
+    return payload
+
+def payload_key(payload):
+    """
+    Fixture anahtarı: belgedeki inline verinin sha256'sı; belge yoksa istem metninin.
+    Aynı belge hangi modelle okunursa okunsun aynı kaydı kullanır.
+    """
+    h = hashlib.sha256()
+    found = False
+    for content in payload.get("contents", []):
+        for part in content.get("parts", []):
+            inline = part.get("inline_data") or part.get("inlineData")
+            if inline:
+                h.update(base64.b64decode(inline.get("data", "")))
+                found = True
+    if not found:
+        for content in payload.get("contents", []):
+            for part in content.get("parts", []):
+                h.update(part.get("text", "").encode("utf-8"))
+    return h.hexdigest()
+
+def response_text(res_json):
+    try:
+        return "".join(p.get("text", "") for p in res_json["candidates"][0]["content"]["parts"])
+    except (KeyError, IndexError, TypeError):
+        raise ModelError("Model cevabında metin yok")
+
+def chunk_text(res_json):
+    """Akış parçasındaki metin; metinsiz parçalar (ör. son kullanım bilgisi) için boş"""
+    try:
+        return response_text(res_json)
+    except ModelError:
+        return ""
+
+def text_chunks(res_json, chunk_chars):
+    """Tam cevabı streamGenerateContent parçalarına böler (fixture oynatma için)"""
+    text = response_text(res_json)
+    pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+    return [{"candidates": [{"content": {"parts": [{"text": p}], "role": "model"}}]} for p in pieces]
+
+class ModelBackend(ABC):
+    """Tüm arka uçların ortak arayüzü"""
+
+    name = "base"
+
+    @abstractmethod
+    def generate_content(self, model_name, payload):
+        """Ham generateContent JSON cevabını döndürür; hata durumunda ModelError"""
+
+    def stream_content(self, model_name, payload):
+        """streamGenerateContent: kısmi cevap JSON'larını sırayla üretir (varsayılan: tek parça)"""
+        yield self.generate_content(model_name, payload)
+
+    def generate_text(self, model_name, prompt, data=None, mime_type=None, generation_config=None):
+        payload = build_payload(prompt, data, mime_type, generation_config)
+        with span("model.generateContent", backend=self.name, model=clean_model_name(model_name), bytes=len(data or b"")):
+            return response_text(self.generate_content(model_name, payload))
+
+    def generate_text_stream(self, model_name, prompt, data=None, mime_type=None, generation_config=None):
+        """Metin parçalarını geldikçe üretir; süre ve ilk parçaya kadar geçen süre span olarak kaydedilir"""
+        payload = build_payload(prompt, data, mime_type, generation_config)
+        t0 = time.perf_counter()
+        first_ms, chunks, error = None, 0, None
+        try:
+            for res in self.stream_content(model_name, payload):
+                text = chunk_text(res)
+                if not text:
+                    continue
+                chunks += 1
+                if first_ms is None:
+                    first_ms = round((time.perf_counter() - t0) * 1000, 1)
+                yield text
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record("model.streamGenerateContent", time.perf_counter() - t0, backend=self.name,
+                   model=clean_model_name(model_name), bytes=len(data or b""), first_chunk_ms=first_ms, chunks=chunks, error=error)
+
+class GoogleModelBackend(ModelBackend):
+    name = "google"
+
+    def __init__(self, api_key, base_url=GOOGLE_BASE_URL, timeout=300):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def url(self, model_name, method="generateContent"):
+        return f"{self.base_url}/v1beta/models/{clean_model_name(model_name)}:{method}?key={self.api_key}"
+
+    def generate_content(self, model_name, payload):
+        try:
+            res = requests.post(self.url(model_name), headers={"Content-Type": "application/json"}, data=json.dumps(payload), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ModelError(str(e))
+        if res.status_code != 200:
+            raise ModelError(f"API Hatası ({res.status_code}): {res.text[:500]}")
+        try:
+            return res.json()
+        except ValueError:
+            # 200 ama JSON değil (vekil sunucu / HTML hata sayfası)
+            raise ModelError(f"API cevabı JSON değil: {res.text[:200]}")
+
+    def stream_content(self, model_name, payload):
+        # alt=sse: her parça "data: {...}" satırı olarak gelir
+        try:
+            res = requests.post(self.url(model_name, "streamGenerateContent") + "&alt=sse", headers={"Content-Type": "application/json"},
+                                data=json.dumps(payload), timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise ModelError(str(e))
+        with res:
+            if res.status_code != 200:
+                raise ModelError(f"API Hatası ({res.status_code}): {res.text[:500]}")
+            res.encoding = "utf-8"  # SSE her zaman UTF-8; başlıkta charset olmayabilir
+            try:
+                for line in res.iter_lines(decode_unicode=True):
+                    if line and line.startswith("data:"):
+                        yield json.loads(line[5:])
+            except (requests.RequestException, ValueError) as e:
+                raise ModelError(f"Akış kesildi: {e}")
+
+class FixtureStore:
+    """fixture_dir/<sha256>.json dosyaları"""
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+
+    def path(self, key):
+        return os.path.join(self.fixture_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, res_json):
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        with open(self.path(key), "w", encoding="utf-8") as f:
+            json.dump(res_json, f, ensure_ascii=False)
+
+class FaultInjector:
+    """Gecikme (ms, ± jitter) ve hata oranı simülasyonu"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self, scale=1.0):
+        """Gecikmeyi (scale katı) uygular; hata çıkacaksa HTTP durum kodunu (429/500/503) döndürür"""
+        with self._lock:
+            delay = (self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)) * scale
+            fail = self._rng.random() < self.error_rate
+            status = self._rng.choice([429, 500, 503]) if fail else None
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return status
+
+class FixtureModelBackend(ModelBackend):
+    """
+    Akışta cevap chunk_chars karakterlik parçalara bölünür; gecikme ilk parçaya
+    (first_chunk_ratio kadarı) ve kalan parçalara eşit dağıtılır.
+    """
+
+    name = "fixture"
+
+    def __init__(self, fixture_dir, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=None, chunk_chars=200, first_chunk_ratio=0.1):
+        self.store = FixtureStore(fixture_dir)
+        self.faults = FaultInjector(latency_ms, jitter_ms, error_rate, seed)
+        self.chunk_chars = chunk_chars
+        self.first_chunk_ratio = first_chunk_ratio
+
+    def _lookup(self, payload):
+        key = payload_key(payload)
+        res = self.store.get(key)
+        if res is None:
+            raise ModelError(f"Fixture bulunamadı: {key[:12]}")
+        return res
+
+    def generate_content(self, model_name, payload):
+        status = self.faults.apply()
+        if status:
+            raise ModelError(f"API Hatası ({status}): simüle edilmiş hata")
+        return self._lookup(payload)
+
+    def stream_content(self, model_name, payload):
+        status = self.faults.apply(scale=self.first_chunk_ratio)
+        if status:
+            raise ModelError(f"API Hatası ({status}): simüle edilmiş hata")
+        chunks = text_chunks(self._lookup(payload), self.chunk_chars)
+        per_chunk = self.faults.latency_ms * (1 - self.first_chunk_ratio) / max(len(chunks) - 1, 1)
+        for i, chunk in enumerate(chunks):
+            if i and per_chunk > 0:
+                time.sleep(per_chunk / 1000)
+            yield chunk
+
+class RecordingModelBackend(ModelBackend):
+    """Canlı arka ucu sarar, her başarılı cevabı fixture olarak kaydeder"""
+
+    name = "record"
+
+    def __init__(self, inner, fixture_dir):
+        self.inner = inner
+        self.store = FixtureStore(fixture_dir)
+
+    def generate_content(self, model_name, payload):
+        res = self.inner.generate_content(model_name, payload)
+        self.store.put(payload_key(payload), res)
+        return res
+
+    def stream_content(self, model_name, payload):
+        # Parçalar aynen iletilir; akış bitince birleşik metin tek fixture olarak yazılır
+        parts = []
+        for res in self.inner.stream_content(model_name, payload):
+            parts.append(chunk_text(res))
+            yield res
+        self.store.put(payload_key(payload), {"candidates": [{"content": {"parts": [{"text": "".join(parts)}], "role": "model"}}]})
+
+# =========================================================
+# 🖥️ YEREL FIXTURE SUNUCUSU
+# =========================================================
+# Canlı API ile aynı URL şemasını konuşur; GoogleModelBackend(base_url="http://127.0.0.1:8765")
+# ya da MODEL_BASE_URL ayarı ile uygulama hiç değişmeden buna yönlendirilebilir.
+#   python -m modules.model_backend --dir data/model_fixtures --port 8765 --latency-ms 1500 --error-rate 0.05
+
+def make_fixture_server(fixture_dir, host="127.0.0.1", port=8765, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=None, chunk_chars=200):
+    store = FixtureStore(fixture_dir)
+    faults = FaultInjector(latency_ms, jitter_ms, error_rate, seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _send_sse(self, chunks):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.end_headers()
+            for chunk in chunks:
+                self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\r\n\r\n")
+                self.wfile.flush()
+
+        def do_POST(self):
+            stream = ":streamGenerateContent" in self.path
+            if not stream and ":generateContent" not in self.path:
+                return self._send(404, {"error": {"code": 404, "message": "Desteklenmeyen yol"}})
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            status = faults.apply()
+            if status:
+                return self._send(status, {"error": {"code": status, "message": "simüle edilmiş hata"}})
+            res = store.get(payload_key(payload))
+            if res is None:
+                return self._send(404, {"error": {"code": 404, "message": "Fixture bulunamadı"}})
+            if stream:
+                return self._send_sse(text_chunks(res, chunk_chars))
+            self._send(200, res)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def serve_fixtures_in_thread(fixture_dir, **kwargs):
+    """Benchmark'lar için: sunucuyu arka planda başlatır, (server, base_url) döndürür"""
+    server = make_fixture_server(fixture_dir, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+# =========================================================
+# ⚙️ SEÇİM
+# =========================================================
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_model_backend():
+    """MODEL_BACKEND ayarına göre paylaşımlı arka ucu kurar (google / fixture / record)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            from modules.utils import get_setting, LOCAL_DATA_DIR
+            kind = str(get_setting("MODEL_BACKEND", "google")).lower()
+            fixture_dir = get_setting("MODEL_FIXTURE_DIR", os.path.join(LOCAL_DATA_DIR, "model_fixtures"))
+            if kind == "fixture":
+                _backend = FixtureModelBackend(
+                    fixture_dir,
+                    latency_ms=float(get_setting("MODEL_LATENCY_MS", 0) or 0),
+                    error_rate=float(get_setting("MODEL_ERROR_RATE", 0) or 0),
+                )
+            else:
+                live = GoogleModelBackend(get_setting("GOOGLE_API_KEY", ""), get_setting("MODEL_BASE_URL", GOOGLE_BASE_URL))
+                _backend = RecordingModelBackend(live, fixture_dir) if kind == "record" else live
+        return _backend
+
+def set_model_backend(backend):
+    """Benchmark/testlerin kendi arka ucunu takması için"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Yerel generateContent fixture sunucusu")
+    ap.add_argument("--dir", default=os.path.join("data", "model_fixtures"))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    srv = make_fixture_server(args.dir, args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Fixture sunucusu: http://{args.host}:{args.port}  ({args.dir})")
+    srv.serve_forever()
@@ -0,0 +1,221 @@
+import contextvars
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from modules.extraction import extract, ExtractionError
+from modules.model_backend import ModelError
+from modules.tracing import span
+from modules.utils import get_setting, turkish_lower, LOCAL_DATA_DIR
+
+# =========================================================
+# 📄 ÇOK SAYFALI PDF OKUMA
+# =========================================================
+# Uzun toptancı ekstreleri tek istekte gönderilince boyut sınırına takılıyor ya da
+# cevap kesiliyordu. PDF sayfa gruplarına bölünür, gruplar paralel okunur, kalemler
+# sayfa sırasıyla birleştirilir ve her sayfada tekrarlanan başlık/devreden satırları
+# atılır (sayfa sınırında aynı kalem iki kez görünürse atılmaz, uyarılır). Grup sonuçları diske yazılır (model başına): tekrar denemede sadece düşen
+# gruplar okunur; önbellek yaş ve boyut sınırıyla budanır.
+# pypdf isteğe bağlıdır; yoksa belge eskisi gibi tek parça gönderilir.
+
+PAGE_CACHE_DIR = os.path.join(LOCAL_DATA_DIR, "page_cache")
+PAGE_CACHE_PRUNE_EVERY = 3600  # saniye; budama süreç başına en fazla saatte bir
+
+# Tabloların her sayfada tekrarlanan başlık ve devir satırları (turkish_lower ile)
+HEADER_WORDS = {"ürün adı", "ürün", "mal/hizmet", "mal hizmet", "açıklama", "stok adı", "malzeme"}
+CARRY_WORDS = ("nakli yekün", "nakli yekun", "devreden", "önceki sayfa", "sayfa toplamı", "ara toplam", "toplam")
+# Devir satırı: ifadenin kendisi, ardından en fazla bir tutar ("Nakli Yekün: 1.234,50 TL").
+# "Toplam Gıda Unu" gibi ifadeyle başlayan ürün adları devir sayılmaz.
+_CARRY_RE = re.compile(r"^(?:" + "|".join(map(re.escape, CARRY_WORDS)) + r")\s*[:*|-]?\s*[\d.,]*\s*(?:tl|₺)?$")
+
+class PdfPageError(Exception):
+    """Bazı sayfa grupları okunamadı; okunanlar önbellekte"""
+
+def split_pdf(data, pages_per_batch):
+    """
+    PDF'i [(ilk_sayfa, son_sayfa, baytlar), ...] gruplarına böler (sayfalar 1'den başlar).
+    pypdf yoksa, belge PDF değilse ya da tek gruba sığıyorsa None.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        n = len(reader.pages)
+    except Exception:
+        return None
+    if n <= pages_per_batch:
+        return None
+    batches = []
+    for start in range(0, n, pages_per_batch):
+        writer = PdfWriter()
+        for i in range(start, min(start + pages_per_batch, n)):
+            writer.add_page(reader.pages[i])
+        buf = io.BytesIO()
+        writer.write(buf)
+        batches.append((start + 1, min(start + pages_per_batch, n), buf.getvalue()))
+    return batches
+
+# --- Sayfa önbelleği ---
+def _spec_digest(spec):
+    # İstem ya da şema değişirse eski sayfa sonuçları kullanılmaz
+    return hashlib.sha256((spec.prompt + json.dumps(spec.schema, sort_keys=True)).encode("utf-8")).hexdigest()[:12]
+
+def _cache_path(spec, model_name, batch_bytes):
+    # Model de anahtarda: kenar çubuğunda model değişince başka modelin sonucu dönmesin
+    model = hashlib.sha256(str(model_name).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(PAGE_CACHE_DIR, f"{spec.name}_{_spec_digest(spec)}_{model}_{hashlib.sha256(batch_bytes).hexdigest()}.json")
+
+_pruned_at = 0.0
+_prune_lock = threading.Lock()
+
+def prune_page_cache(max_age_days=None, max_mb=None):
+    """max_age_days'den eski dosyaları siler; toplam max_mb'yi aşarsa en eskilerden başlayarak siler"""
+    max_age_days = max_age_days or float(get_setting("PDF_PAGE_CACHE_DAYS", 30) or 30)
+    max_mb = max_mb or float(get_setting("PDF_PAGE_CACHE_MB", 200) or 200)
+    try:
+        entries = [e for e in os.scandir(PAGE_CACHE_DIR) if e.is_file()]
+    except OSError:
+        return 0
+    files = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries), reverse=True)
+    cutoff, budget, removed = time.time() - max_age_days * 86400, max_mb * 1024 * 1024, 0
+    for mtime, size, path in files:
+        budget -= size
+        if mtime < cutoff or budget < 0:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def _maybe_prune():
+    global _pruned_at
+    with _prune_lock:
+        if time.time() - _pruned_at < PAGE_CACHE_PRUNE_EVERY:
+            return
+        _pruned_at = time.time()
+    prune_page_cache()
+
+def _cache_get(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _cache_put(path, payload):
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _read_batch(spec, model_name, first, last, data):
+    path = _cache_path(spec, model_name, data)
+    cached = _cache_get(path)
+    if cached is not None:
+        return cached, True
+    with span("pdf.batch", pages=f"{first}-{last}", bytes=len(data)):
+        res = extract(spec, model_name, data, "application/pdf")
+    payload = {"rows": res.data.to_dict("records"), "warnings": res.warnings}
+    try:
+        _cache_put(path, payload)
+    except OSError:
+        pass  # Önbellek yazılamazsa (disk dolu, salt okunur) okunan sonuç yine kullanılır
+    return payload, False
+
+# --- Birleştirme ---
+def is_header_row(name):
+    key = turkish_lower(str(name)).strip(" :*-|")
+    return not key or key in HEADER_WORDS or bool(_CARRY_RE.match(key))
+
+def merge_pages(frames, name_col):
+    """
+    Grupları sayfa sırasıyla birleştirir ve başlık/devir satırlarını atar.
+    (DataFrame, atılan satır sayısı, sayfa sınırında tekrarlanan kalem adları) döner:
+    önceki sayfanın son satırıyla aynı olan ilk satır gerçek bir kalem de olabilir,
+    atılmaz; çağıran uyarır.
+    """
+    out, dropped, repeated = [], 0, []
+    prev_last = None
+    for df in frames:
+        if df.empty:
+            continue
+        keep = ~df[name_col].map(is_header_row)
+        dropped += int((~keep).sum())
+        df = df[keep]
+        if prev_last is not None and len(df) and df.iloc[0].astype(str).tolist() == prev_last:
+            repeated.append(str(df.iloc[0][name_col]))
+        if len(df):
+            prev_last = df.iloc[-1].astype(str).tolist()
+            out.append(df)
+    merged = pd.concat(out, ignore_index=True) if out else pd.DataFrame(columns=frames[0].columns if frames else None)
+    return merged, dropped, repeated
+
+def extract_pdf(spec, model_name, data, on_rows=None, pages_per_batch=None, max_workers=None):
+    """
+    Çok sayfalı PDF'i gruplar halinde paralel okur. (DataFrame, uyarılar) döner;
+    bölünemeyen belgeler için None (çağıran tek parça yola düşer).
+    on_rows: sayfa sırasında kesintisiz tamamlanan kısmın DataFrame'i ile çağrılır (ana iş parçacığında).
+    Bir grup düşerse PdfPageError; başarılı gruplar önbellekte kalır.
+    """
+    pages_per_batch = pages_per_batch or int(get_setting("PDF_PAGES_PER_BATCH", 4) or 4)
+    max_workers = max_workers or int(get_setting("PDF_WORKERS", 4) or 4)
+    name_col = spec.columns[next(iter(spec.columns))]
+
+    with span("pdf.split", bytes=len(data)) as s:
+        batches = split_pdf(data, pages_per_batch)
+        s.set(batches=len(batches or []))
+    if not batches:
+        return None
+    _maybe_prune()
+
+    results, errors, hits = {}, {}, 0
+    emitted = 0
+    with span("pdf.extract", batches=len(batches), workers=max_workers) as s:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mutfak-pdf") as pool:
+            # Alt span'ler bu span'in altına düşsün diye bağlam kopyalanır
+            futures = {
+                pool.submit(contextvars.copy_context().run, _read_batch, spec, model_name, first, last, chunk): i
+                for i, (first, last, chunk) in enumerate(batches)
+            }
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    results[i], hit = fut.result()
+                    hits += hit
+                except (ModelError, ExtractionError) as e:
+                    errors[i] = str(e)
+                    continue
+                except Exception as e:
+                    # Diğer hatalar da (pypdf, disk) sadece bu grubu düşürür; uçuştaki gruplar tamamlanır
+                    errors[i] = f"{type(e).__name__}: {e}"
+                    continue
+                # Baştan kesintisiz biten grupları canlı tabloya aktar
+                if on_rows and i == emitted:
+                    while emitted in results:
+                        emitted += 1
+                    on_rows(merge_pages([pd.DataFrame(results[k]["rows"], columns=list(spec.columns.values())) for k in range(emitted)], name_col)[0])
+        s.set(cache_hits=hits, failed=len(errors))
+
+    if errors:
+        pages = ", ".join(f"{batches[i][0]}-{batches[i][1]}" for i in sorted(errors))
+        raise PdfPageError(f"Sayfa {pages} okunamadı ({next(iter(errors.values()))}). Tekrar denendiğinde sadece bu sayfalar okunur.")
+
+    frames = [pd.DataFrame(results[i]["rows"], columns=list(spec.columns.values())) for i in range(len(batches))]
+    merged, dropped, repeated = merge_pages(frames, name_col)
+    warnings = [f"Sayfa {batches[i][0]}-{batches[i][1]}: {w}" for i in range(len(batches)) for w in results[i]["warnings"]]
+    if dropped:
+        warnings.append(f"{dropped} tekrarlanan başlık/devir satırı atıldı.")
+    for name in repeated:
+        warnings.append(f"'{name}' sayfa sınırında iki kez okundu; iki ayrı kalem değilse birini silin.")
+    return merged, warnings
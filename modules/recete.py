@@ -0,0 +1,331 @@
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+import pandas as pd
+
+from modules.utils import (
+    clean_number,
+    get_sheet_snapshot,
+    turkish_lower,
+    FILE_MENU,
+    FILE_STOK,
+    PRICE_SHEET_NAME,
+    RECIPE_SHEET_NAME,
+)
+from modules.tracing import traced
+from modules.headcount import menu_headcount
+
+# =========================================================
+# 🧾 REÇETELER VE MALZEME İHTİYACI
+# =========================================================
+# RECETELER sayfası (Menü dosyasında), bir porsiyon için:
+#   YEMEK ADI | ÜRÜN ADI | TEDARİKÇİ | MİKTAR | BİRİM
+# TEDARİKÇİ boşsa ürün FIYAT_ANAHTARI'nda en ucuz olan tedarikçiden alınır.
+# Menünün uzun biçimi (gün x kap) porsiyon sayısıyla ve reçetelerle tek seferde
+# birleştirilir; ürün/tedarikçi/hafta bazında ihtiyaç çıkar ve KALAN KOTA ile
+# karşılaştırılır.
+
+RECIPE_HEADER = ["YEMEK ADI", "ÜRÜN ADI", "TEDARİKÇİ", "MİKTAR", "BİRİM"]
+
+# Birim -> (temel birim, çarpan); reçete GR, kota KG olabilir
+UNIT_BASE = {
+    "KG": ("KG", 1.0), "GR": ("KG", 0.001), "G": ("KG", 0.001),
+    "LT": ("LT", 1.0), "L": ("LT", 1.0), "ML": ("LT", 0.001),
+    "ADET": ("ADET", 1.0), "AD": ("ADET", 1.0),
+}
+
+def normalize_unit(unit):
+    """Birimi temel birime çevirir: (temel, çarpan); bilinmeyen birim kendisi, 1"""
+    u = str(unit or "").strip().upper().replace("İ", "I").rstrip(".")
+    u = {"ADT": "ADET", "KILO": "KG", "LITRE": "LT", "GRAM": "GR"}.get(u, u)
+    return UNIT_BASE.get(u, (u, 1.0))
+
+def _unit_columns(units):
+    base = units.map(lambda u: normalize_unit(u)[0])
+    factor = units.map(lambda u: normalize_unit(u)[1])
+    return base, factor
+
+# --- Kaynak tablolar (sayfa görüntülerinden bir kez türetilir) ---
+def recipes_frame(raw):
+    """RECETELER görüntüsünü temizler; MİKTAR temel birime çevrilir (MİKTAR_TB, BİRİM_TB)"""
+    if raw.empty:
+        return pd.DataFrame(columns=RECIPE_HEADER + ["MİKTAR_TB", "BİRİM_TB", "ANAHTAR"])
+    df = raw.rename(columns=lambda c: str(c).strip().upper()).reindex(columns=RECIPE_HEADER).fillna("")
+    for col in ["YEMEK ADI", "ÜRÜN ADI", "TEDARİKÇİ", "BİRİM"]:
+        df[col] = df[col].astype(str).str.strip()
+    df["MİKTAR"] = df["MİKTAR"].map(clean_number)
+    df = df[(df["YEMEK ADI"] != "") & (df["ÜRÜN ADI"] != "") & (df["MİKTAR"] > 0)].copy()
+    df["BİRİM_TB"], factor = _unit_columns(df["BİRİM"])
+    df["MİKTAR_TB"] = df["MİKTAR"] * factor
+    df["ANAHTAR"] = df["ÜRÜN ADI"].map(turkish_lower)
+    return df.reset_index(drop=True)
+
+def prices_frame(raw):
+    """FIYAT_ANAHTARI görüntüsü: fiyat ve kota sayıya, kota birimi temel birime çevrilir"""
+    cols = ["TEDARİKÇİ", "ÜRÜN ADI", "BİRİM FİYAT", "KALAN KOTA", "KOTA BİRİMİ"]
+    if raw.empty or not set(cols) <= set(raw.columns):
+        return pd.DataFrame(columns=cols + ["KOTA_TB", "BİRİM_TB", "ANAHTAR"])
+    df = raw[cols].copy()
+    df["TEDARİKÇİ"] = df["TEDARİKÇİ"].astype(str).str.strip()
+    df["ÜRÜN ADI"] = df["ÜRÜN ADI"].astype(str).str.strip()
+    df["BİRİM FİYAT"] = df["BİRİM FİYAT"].map(clean_number)
+    df["KALAN KOTA"] = df["KALAN KOTA"].map(clean_number)
+    df["BİRİM_TB"], factor = _unit_columns(df["KOTA BİRİMİ"].astype(str))
+    df["KOTA_TB"] = df["KALAN KOTA"] * factor
+    df["ANAHTAR"] = df["ÜRÜN ADI"].map(turkish_lower)
+    return df
+
+def get_recipes():
+    return get_sheet_snapshot(FILE_MENU, RECIPE_SHEET_NAME).derived("recipes", recipes_frame)
+
+def get_prices():
+    return get_sheet_snapshot(FILE_STOK, PRICE_SHEET_NAME).derived("prices", prices_frame)
+
+def source_version():
+    """Reçete ve fiyat görüntülerinin okunma anları; görüntü yenilenince değişir"""
+    return (
+        get_sheet_snapshot(FILE_MENU, RECIPE_SHEET_NAME).loaded_at,
+        get_sheet_snapshot(FILE_STOK, PRICE_SHEET_NAME).loaded_at,
+    )
+
+def resolve_suppliers(recipes, prices):
+    """Tedarikçisi boş reçete satırlarına ürünün en ucuz tedarikçisini yazar"""
+    missing = recipes["TEDARİKÇİ"] == ""
+    if not missing.any() or prices.empty:
+        return recipes
+    cheapest = prices.sort_values("BİRİM FİYAT").drop_duplicates("ANAHTAR")[["ANAHTAR", "TEDARİKÇİ"]]
+    filled = recipes[missing].drop(columns="TEDARİKÇİ").merge(cheapest, on="ANAHTAR", how="left")
+    filled["TEDARİKÇİ"] = filled["TEDARİKÇİ"].fillna("")
+    return pd.concat([recipes[~missing], filled[recipes.columns]], ignore_index=True)
+
+# --- İhtiyaç hesabı ---
+def portions_frame(long, portions):
+    """portions: sabit sayı ya da (TARİH, ÖĞÜN, PORSİYON) tablosu -> long'a PORSİYON sütunu"""
+    if isinstance(portions, pd.DataFrame):
+        out = long.merge(portions[["TARİH", "ÖĞÜN", "PORSİYON"]], on=["TARİH", "ÖĞÜN"], how="left")
+        out["PORSİYON"] = out["PORSİYON"].fillna(0)
+        return out
+    return long.assign(PORSİYON=float(portions))
+
+@traced("recete.explode_demand")
+def explode_demand(long, recipes, prices, portions):
+    """
+    Menü (melt_menu çıktısı) x porsiyon x reçete -> ürün/tedarikçi/hafta ihtiyacı ve kota karşılaştırması.
+    (ihtiyaç tablosu, reçetesi olmayan yemekler) döndürür.
+    """
+    served = portions_frame(long, portions)
+    recipes = resolve_suppliers(recipes, prices)
+    no_recipe = sorted(set(served["YEMEK ADI"]) - set(recipes["YEMEK ADI"]))
+
+    lines = served.merge(recipes, on="YEMEK ADI", how="inner")
+    if lines.empty:
+        return pd.DataFrame(), no_recipe
+    lines["İHTİYAÇ"] = lines["PORSİYON"] * lines["MİKTAR_TB"]
+
+    keys = ["TEDARİKÇİ", "ANAHTAR", "BİRİM_TB"]
+    weekly = lines.groupby(keys + ["HAFTA"], observed=True)["İHTİYAÇ"].sum().unstack(fill_value=0.0)
+    weekly.columns = [str(c) for c in weekly.columns]
+    weekly["TOPLAM"] = weekly.sum(axis=1)
+    demand = weekly.reset_index()
+    # Görünen ürün adı: reçetedeki ilk yazım
+    names = lines.drop_duplicates("ANAHTAR").set_index("ANAHTAR")["ÜRÜN ADI"]
+    demand.insert(1, "ÜRÜN ADI", demand["ANAHTAR"].map(names))
+
+    stock = prices[["TEDARİKÇİ", "ANAHTAR", "BİRİM_TB", "KOTA_TB"]].rename(columns={"BİRİM_TB": "KOTA_BİRİM"})
+    stock = stock.groupby(["TEDARİKÇİ", "ANAHTAR"], as_index=False).agg({"KOTA_BİRİM": "first", "KOTA_TB": "sum"})
+    demand = demand.merge(stock, on=["TEDARİKÇİ", "ANAHTAR"], how="left")
+
+    in_quota = demand["KOTA_TB"].notna()
+    same_unit = demand["KOTA_BİRİM"] == demand["BİRİM_TB"]
+    demand["KALAN KOTA"] = demand["KOTA_TB"].where(in_quota & same_unit)
+    demand["EKSİK"] = (demand["TOPLAM"] - demand["KALAN KOTA"]).clip(lower=0).where(in_quota & same_unit)
+    demand["DURUM"] = "✅ Yeterli"
+    demand.loc[demand["EKSİK"] > 0, "DURUM"] = "⚠️ Eksik"
+    demand.loc[in_quota & ~same_unit, "DURUM"] = "❓ Birim uyumsuz"
+    demand.loc[~in_quota, "DURUM"] = "❓ Kotada yok"
+
+    demand = demand.rename(columns={"BİRİM_TB": "BİRİM"}).drop(columns=["ANAHTAR", "KOTA_TB", "KOTA_BİRİM"])
+    order = {"⚠️ Eksik": 0, "❓ Birim uyumsuz": 1, "❓ Kotada yok": 2, "✅ Yeterli": 3}
+    demand = demand.sort_values(["DURUM", "TEDARİKÇİ", "ÜRÜN ADI"], key=lambda s: s.map(order) if s.name == "DURUM" else s)
+    num = demand.select_dtypes("number").columns
+    demand[num] = demand[num].round(2)
+    return demand.reset_index(drop=True), no_recipe
+
+# --- Maliyet ---
+# Porsiyon maliyeti = Σ reçete miktarı x tedarikçinin birim fiyatı (fiyat, kota birimi başına).
+# Fiyat görüntüsü ve reçeteler değişmedikçe tablo yeniden hesaplanmaz.
+
+@traced("recete.dish_costs")
+def dish_costs(recipes, prices):
+    """Yemek başına porsiyon maliyeti: YEMEK ADI, MALİYET, FİYATLI (fiyatı bulunan satır oranı)"""
+    if recipes.empty:
+        return pd.DataFrame(columns=["YEMEK ADI", "MALİYET", "FİYATLI"])
+    lines = resolve_suppliers(recipes, prices)
+    unit_price = prices.assign(TB_FİYAT=prices["BİRİM FİYAT"] / prices["KOTA BİRİMİ"].astype(str).map(lambda u: normalize_unit(u)[1]))
+    unit_price = unit_price.sort_values("TB_FİYAT").drop_duplicates(["TEDARİKÇİ", "ANAHTAR"])
+    lines = lines.merge(
+        unit_price[["TEDARİKÇİ", "ANAHTAR", "BİRİM_TB", "TB_FİYAT"]].rename(columns={"BİRİM_TB": "FİYAT_BİRİM"}),
+        on=["TEDARİKÇİ", "ANAHTAR"], how="left"
+    )
+    priced = lines["TB_FİYAT"].notna() & (lines["FİYAT_BİRİM"] == lines["BİRİM_TB"])
+    lines["TUTAR"] = (lines["MİKTAR_TB"] * lines["TB_FİYAT"]).where(priced, 0.0)
+    lines["FİYATLI"] = priced.astype(float)
+    costs = lines.groupby("YEMEK ADI", as_index=False).agg(MALİYET=("TUTAR", "sum"), FİYATLI=("FİYATLI", "mean"))
+    return costs.round({"MALİYET": 2, "FİYATLI": 2})
+
+_COSTS = {}
+_COSTS_LOCK = threading.Lock()
+
+def get_dish_costs():
+    """Güncel reçete ve fiyat görüntülerinden yemek maliyetleri; reçete yoksa None"""
+    recipes, prices = get_recipes(), get_prices()
+    if recipes.empty:
+        return None
+    key = (id(recipes), id(prices))
+    with _COSTS_LOCK:
+        entry = _COSTS.get(key)
+    if entry is None:
+        # Girdiler de saklanır: id() başka nesneye geçemez
+        entry = (recipes, prices, dish_costs(recipes, prices))
+        with _COSTS_LOCK:
+            _COSTS.clear()
+            _COSTS[key] = entry
+    return entry[2]
+
+def cost_map(costs):
+    """dish_costs tablosu -> {yemek: porsiyon maliyeti}; fiyatı hiç bulunamayanlar hariç"""
+    if costs is None or costs.empty:
+        return {}
+    known = costs[costs["FİYATLI"] > 0]
+    return dict(zip(known["YEMEK ADI"], known["MALİYET"]))
+
+def cost_report(long, costs, portions):
+    """
+    Planlanan menünün maliyeti: (günlük tablo, yemek tablosu, kişi başı toplam).
+    Günlük tabloda kişi başı ve porsiyonla çarpılmış toplam vardır.
+    """
+    served = portions_frame(long, portions).merge(costs[["YEMEK ADI", "MALİYET"]], on="YEMEK ADI", how="left")
+    served["MALİYET"] = served["MALİYET"].fillna(0.0)
+    served["TUTAR"] = served["MALİYET"] * served["PORSİYON"]
+    daily = served.groupby(["TARİH", "GÜN", "HAFTA"], sort=False, observed=True).agg(
+        KİŞİ_BAŞI=("MALİYET", "sum"), TOPLAM=("TUTAR", "sum")
+    ).reset_index().rename(columns={"KİŞİ_BAŞI": "KİŞİ BAŞI"})
+    by_dish = served.groupby("YEMEK ADI", as_index=False).agg(
+        KEZ=("MALİYET", "size"), PORSİYON_MALİYETİ=("MALİYET", "first"), TOPLAM=("TUTAR", "sum")
+    ).rename(columns={"PORSİYON_MALİYETİ": "PORSİYON MALİYETİ"}).sort_values("TOPLAM", ascending=False)
+    return daily.round(2), by_dish.round(2).reset_index(drop=True), round(float(daily["KİŞİ BAŞI"].sum()), 2)
+
+DEMAND_CACHE_MAX = 8
+_DEMAND = OrderedDict()
+_DEMAND_LOCK = threading.Lock()
+
+def _portions_key(portions):
+    if isinstance(portions, pd.DataFrame):
+        return int(pd.util.hash_pandas_object(portions, index=False).sum())
+    return portions
+
+def menu_demand(long, portions):
+    """
+    Sayfa görüntüleriyle ihtiyaç hesabı; reçete sayfası boşsa (None, []).
+    Aynı menü tablosu, porsiyon ve görüntüler için saklanan sonuç döner.
+    """
+    recipes = get_recipes()
+    if recipes.empty:
+        return None, []
+    prices = get_prices()
+    key = (id(long), _portions_key(portions), id(recipes), id(prices))
+    with _DEMAND_LOCK:
+        entry = _DEMAND.get(key)
+        if entry is not None:
+            _DEMAND.move_to_end(key)
+            return entry[3]
+    result = explode_demand(long, recipes, prices, portions)
+    with _DEMAND_LOCK:
+        # Girdiler de saklanır: id() başka nesneye geçemez
+        _DEMAND[key] = (long, recipes, prices, result)
+        while len(_DEMAND) > DEMAND_CACHE_MAX:
+            _DEMAND.popitem(last=False)
+    return result
+
+# =========================================================
+# 🖥️ ARAYÜZ
+# =========================================================
+
+PORTION_SOURCES = ["Öğrenci listesi", "Sabit sayı"]
+
+def selected_portions(long, holidays=()):
+    """
+    Arayüzde seçilen porsiyon kaynağı: öğrenci listelerinden gün x öğün tablosu ya da sabit sayı.
+    Listeler boşsa sabit sayıya düşer.
+    """
+    fixed = st.session_state.get("recete_porsiyon", 100)
+    if st.session_state.get("recete_porsiyon_kaynak", PORTION_SOURCES[0]) != PORTION_SOURCES[0]:
+        return fixed
+    heads = menu_headcount(long, holidays)
+    return heads if heads["PORSİYON"].sum() > 0 else fixed
+
+def render_headcount(long, holidays):
+    heads = menu_headcount(long, holidays)
+    served = heads[heads["TARİH"].isin(long["TARİH"])]
+    if served["PORSİYON"].sum() == 0:
+        st.warning("Öğrenci listelerinden kişi sayısı çıkmadı; sabit porsiyon kullanılıyor.")
+        st.number_input("Öğün başına porsiyon", min_value=1, value=100, step=10, key="recete_porsiyon")
+        return
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Yatılı (her öğün)", int(heads["YATILI"].max()))
+    m2.metric("Gündüzlü (hafta içi öğle)", int(heads["GÜNDÜZLÜ"].max()))
+    m3.metric("Aylık Öğün", f"{int(served['PORSİYON'].sum()):,}")
+    with st.expander("📅 Gün x öğün kişi sayısı"):
+        st.dataframe(
+            served.pivot_table(index="TARİH", columns="ÖĞÜN", values="PORSİYON", sort=False).reindex(columns=["KAHVALTI", "ÖĞLE", "AKŞAM", "GECE"]),
+            use_container_width=True
+        )
+
+def render_demand_tab(long, holidays=()):
+    st.subheader("🛒 Malzeme İhtiyacı ve Kota Kontrolü")
+    st.caption(f"Reçeteler '{RECIPE_SHEET_NAME}' sayfasından (bir porsiyon için: {' | '.join(RECIPE_HEADER)}).")
+    source = st.radio("Porsiyon", PORTION_SOURCES, horizontal=True, key="recete_porsiyon_kaynak")
+    if source == PORTION_SOURCES[0]:
+        render_headcount(long, holidays)
+    else:
+        st.number_input("Öğün başına porsiyon", min_value=1, value=100, step=10, key="recete_porsiyon")
+    portions = selected_portions(long, holidays)
+
+    demand, no_recipe = menu_demand(long, portions)
+    if demand is None:
+        st.info(f"'{RECIPE_SHEET_NAME}' sayfası boş ya da bulunamadı.")
+        return
+    if no_recipe:
+        with st.expander(f"⚠️ Reçetesi olmayan {len(no_recipe)} yemek"):
+            st.write(", ".join(no_recipe))
+    if demand.empty:
+        st.info("Menüdeki yemeklerin hiçbirinin reçetesi yok.")
+        return
+
+    short = demand[demand["DURUM"] == "⚠️ Eksik"]
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Ürün", len(demand))
+    m2.metric("Eksik Ürün", len(short))
+    m3.metric("Kotada Olmayan", int((demand["DURUM"] == "❓ Kotada yok").sum()))
+
+    supplier = st.selectbox("Tedarikçi", ["Tümü"] + sorted(demand["TEDARİKÇİ"].unique()))
+    shown = demand if supplier == "Tümü" else demand[demand["TEDARİKÇİ"] == supplier]
+    st.dataframe(shown, hide_index=True, use_container_width=True, height=500)
+
+    render_cost_section(long, portions)
+
+def render_cost_section(long, portions):
+    st.divider()
+    st.markdown("#### 💰 Planlanan Maliyet")
+    costs = get_dish_costs()
+    if costs is None or costs.empty:
+        st.info("Maliyet için reçete ve fiyat bilgisi gerekli.")
+        return
+    daily, by_dish, per_person = cost_report(long, costs, portions)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Kişi Başı (Ay)", f"{per_person:,.2f} TL")
+    c2.metric("Toplam (Ay)", f"{daily['TOPLAM'].sum():,.2f} TL")
+    c3.metric("Eksik Fiyatlı Yemek", int((costs["FİYATLI"] < 1).sum()))
+    st.bar_chart(daily.set_index("TARİH")["KİŞİ BAŞI"])
+    st.dataframe(by_dish, hide_index=True, use_container_width=True, height=400)
@@ -0,0 +1,73 @@
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+# =========================================================
+# 🧭 SAYFA YÖNLENDİRİCİ (İSTEĞE BAĞLI YÜKLEME)
+# =========================================================
+# Sayfa modülleri ilk açıldıklarında import edilir; giriş ekranı ve ana sayfa
+# fatura/irsaliye/menü kütüphanelerini beklemez.
+
+PAGES = {
+    "📝 Tüketim Fişi (İrsaliye)": "modules.irsaliye",
+    "🧾 Fatura & Fiyat Girişi": "modules.fatura",
+    "📅 Menü Planlayıcı": "modules.menu",
+    "💰 Öğrenci Finans": "modules.finans",
+}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modül adı -> ilk yükleme süresi (sn); süreç boyunca tutulur
+_load_times = {}
+
+def load_module(module_name):
+    """Modülü import eder; ilk yüklemenin süresini kaydeder."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    t0 = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _load_times[module_name] = time.perf_counter() - t0
+    return module
+
+def render(page, sel_model):
+    """Seçili sayfanın modülünü yükleyip render_page'ini çağırır."""
+    load_module(PAGES[page]).render_page(sel_model)
+
+def get_load_times():
+    return dict(_load_times)
+
+# =========================================================
+# ⏱️ IMPORT PROFİLİ (-X importtime)
+# =========================================================
+
+def profile_imports(module_name, timeout=120):
+    """
+    Modülü temiz bir Python sürecinde `-X importtime` ile import eder ve
+    [{modul, self_ms, cumulative_ms, derinlik}, ...] döndürür (kümülatife göre azalan).
+    Çalışan uygulamanın önbelleğinden etkilenmeyen soğuk açılış ölçümüdür.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=timeout
+    )
+    return parse_importtime(proc.stderr)
+
+def parse_importtime(stderr_text):
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        self_us, cum_us, name = parts
+        rows.append({
+            "modul": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cum_us) / 1000,
+            "derinlik": (len(name) - len(name.lstrip())) // 2,
+        })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows
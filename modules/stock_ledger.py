@@ -0,0 +1,309 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+from modules.tracing import span
+from modules.utils import turkish_lower
+
+# =========================================================
+# 📒 STOK HAREKET DEFTERİ
+# =========================================================
+# KALAN KOTA hücresi fatura (+) ve irsaliye (-) tarafından oku-değiştir-yaz ile
+# güncelleniyordu: aynı anda iki kayıt birbirinin artışını silebiliyordu.
+# Her hareket artık data/stock_ledger.sqlite'a sadece eklenir (silinmez, değişmez);
+# tedarikçi x ürün bakiyeleri ayrı bir tabloda tutulur ve son işlenen hareketten
+# (kontrol noktası) itibaren artımlı güncellenir. Sayfadaki KALAN KOTA defterdeki
+# bakiyenin görüntüsüdür. Sayfada elle yapılan değişiklikler kayıt sırasında
+# DÜZELTME hareketi olarak deftere alınır: sayfa okunmadan hemen önce defterin
+# bakiyesi ve sayfaya en son yazılan değer (sheet_state) alınır, sayfa bunlardan
+# farklıysa elle değiştirilmiştir. Eski bir okuma böylece düzeltme sayılmaz. "X'in D günündeki bakiyesi" ürün-gün
+# indeksi üzerinden toplanır; tedarikçi sayfaları taranmaz.
+
+KIND_INVOICE = "FATURA"
+KIND_WAYBILL = "İRSALİYE"
+KIND_OPENING = "AÇILIŞ"
+KIND_ADJUSTMENT = "DÜZELTME"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    day TEXT NOT NULL,
+    supplier TEXT NOT NULL,
+    product TEXT NOT NULL,
+    key TEXT NOT NULL,
+    qty REAL NOT NULL,
+    unit TEXT DEFAULT '',
+    price REAL DEFAULT 0,
+    kind TEXT NOT NULL,
+    ref TEXT UNIQUE,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS ix_mov_key_day ON movements(key, supplier, day, qty);
+CREATE INDEX IF NOT EXISTS ix_mov_supplier_day ON movements(supplier, day);
+CREATE TABLE IF NOT EXISTS balances (
+    supplier TEXT NOT NULL,
+    key TEXT NOT NULL,
+    product TEXT NOT NULL,
+    unit TEXT DEFAULT '',
+    qty REAL NOT NULL DEFAULT 0,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    synced REAL,
+    PRIMARY KEY (supplier, key)
+);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+def product_key(name):
+    """Defter anahtarı: Türkçe küçük harf, baş/son boşluksuz"""
+    return turkish_lower(str(name or ""))
+
+def iso_day(day):
+    """date ya da 'gg.aa.yyyy' -> 'yyyy-aa-gg'"""
+    if isinstance(day, date):
+        return day.isoformat()
+    s = str(day).strip()
+    if len(s) == 10 and s[2] == "." and s[5] == ".":
+        return f"{s[6:10]}-{s[3:5]}-{s[0:2]}"
+    return s
+
+def batch_id(kind, supplier, day, moves):
+    """Belge içeriğinden kayıt kimliği: aynı belge tekrar denenirse aynı, düzeltilmiş belge farklı"""
+    digest = hashlib.sha256(json.dumps([list(m) for m in moves], ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{kind}|{supplier}|{iso_day(day)}|{digest[:16]}"
+
+class StockLedger:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # --- Yazma ---
+    def record(self, supplier, day, moves, kind, batch, sheet_quotas=None):
+        """
+        moves: [(ürün, işaretli miktar, birim, birim fiyat)] tek işlemde eklenir.
+        batch: kaydın kimliği; aynı batch ile tekrar çağrılırsa (iş yeniden denenirse)
+        hareketler ikinci kez eklenmez. sheet_quotas: {ürün: [sayfadaki KALAN KOTA,
+        okuma anındaki bakiye, okuma anındaki son yazılan değer]} (bkz. sheet_state);
+        verilirse önce sayfayla mutabakat yapılır. Eklenen hareket sayısını döndürür.
+        """
+        day = iso_day(day)
+        with span("stock_ledger.record", kind=kind, rows=len(moves)), self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._refresh(conn)
+            rows = self._reconcile(conn, supplier, sheet_quotas, day, batch) if sheet_quotas else []
+            rows += [
+                (day, supplier, str(p).strip(), product_key(p), float(q), str(u or "").strip().upper(), float(f or 0), kind, f"{batch}#{i}")
+                for i, (p, q, u, f) in enumerate(moves)
+            ]
+            added = self._insert(conn, rows)
+            self._refresh(conn)
+        return added
+
+    def sheet_state(self, supplier):
+        """
+        {ürün anahtarı: [bakiye, sayfaya son yazılan değer]}; sayfa okunmadan hemen önce
+        alınır ve sheet_quotas'ta sayfa değerinin yanına konur.
+        """
+        self.refresh()
+        with self._conn() as conn:
+            return {
+                key: [qty, synced] for key, qty, synced in
+                conn.execute("SELECT key, qty, synced FROM balances WHERE supplier = ?", (supplier,))
+            }
+
+    def mark_synced(self, supplier, values):
+        """{ürün: değer}: sayfaya en son yazılan KALAN KOTA (elle değişiklikleri ayırt etmek için)"""
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE balances SET synced = ? WHERE supplier = ? AND key = ?",
+                [(float(v), supplier, product_key(p)) for p, v in values.items()]
+            )
+
+    def _insert(self, conn, rows):
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO movements (day, supplier, product, key, qty, unit, price, kind, ref, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [r + (time.time(),) for r in rows]
+        )
+        return conn.total_changes - before
+
+    def _reconcile(self, conn, supplier, sheet_quotas, day, batch):
+        """
+        Sayfa ile defter arasındaki farkı (belge gününe, belgenin hareketlerinden önce) hareket olarak döndürür.
+        Defterde olmayan ürün: sayfadaki değer AÇILIŞ. Sayfa, okunduğu andaki bakiyeden
+        ve o ana kadar en son yazdığımız değerden farklıysa elle değiştirilmiştir: fark
+        DÜZELTME. Okumadan sonra başka kayıtların eklediği hareketler karşılaştırmaya
+        girmez; eski bir okuma onları geri almaz.
+        """
+        known = {key for (key,) in conn.execute("SELECT key FROM balances WHERE supplier = ?", (supplier,))}
+        rows = []
+        for product, read in sheet_quotas.items():
+            sheet, qty, synced = read if isinstance(read, (list, tuple)) else (read, None, None)
+            key, sheet = product_key(product), float(sheet or 0)
+            if key not in known:
+                if sheet:
+                    rows.append((day, supplier, str(product).strip(), key, sheet, "", 0.0, KIND_OPENING, f"{batch}|{KIND_OPENING}|{key}"))
+                continue
+            if qty is None:
+                # Okunduğunda defterde yoktu; arada başka bir kayıt açılışı yaptı
+                continue
+            if any(v is not None and math.isclose(sheet, v, abs_tol=1e-6) for v in (qty, synced)):
+                continue
+            delta = sheet - (synced if synced is not None else qty)
+            rows.append((day, supplier, str(product).strip(), key, delta, "", 0.0, KIND_ADJUSTMENT, f"{batch}|{KIND_ADJUSTMENT}|{key}"))
+        return rows
+
+    # --- Bakiyeler ---
+    def _refresh(self, conn):
+        """Kontrol noktasından sonraki hareketleri bakiyelere ekler"""
+        row = conn.execute("SELECT last_id FROM checkpoint WHERE name = 'balances'").fetchone()
+        last = row[0] if row else 0
+        # MAX(id) ile seçilen düz sütunlar (ürün, birim) en son hareketin değerleridir.
+        # NOT INDEXED: planlayıcı GROUP BY için tüm ürün indeksini taramasın, id aralığı okunsun
+        delta = conn.execute(
+            "SELECT supplier, key, product, unit, SUM(qty), MAX(id) FROM movements NOT INDEXED WHERE id > ? GROUP BY supplier, key",
+            (last,)
+        ).fetchall()
+        if not delta:
+            return 0
+        conn.executemany(
+            """INSERT INTO balances (supplier, key, product, unit, qty, last_id) VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(supplier, key) DO UPDATE SET
+                   qty = qty + excluded.qty,
+                   last_id = excluded.last_id,
+                   product = excluded.product,
+                   unit = CASE WHEN excluded.unit != '' THEN excluded.unit ELSE unit END""",
+            delta
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoint (name, last_id) VALUES ('balances', ?)",
+            (max(r[5] for r in delta),)
+        )
+        return len(delta)
+
+    def refresh(self):
+        with span("stock_ledger.refresh") as s, self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            s.set(products=self._refresh(conn))
+
+    def rebuild(self):
+        """Bakiyeleri tüm defterden baştan kurar (sayfaya yazılan son değerler korunur)"""
+        with span("stock_ledger.rebuild"), self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE balances SET qty = 0, last_id = 0")
+            conn.execute("DELETE FROM checkpoint WHERE name = 'balances'")
+            self._refresh(conn)
+
+    def balance_of(self, supplier, products):
+        """Tedarikçinin verilen ürünleri için güncel bakiye: {ürün: miktar}"""
+        self.refresh()
+        with self._conn() as conn:
+            known = dict(conn.execute("SELECT key, qty FROM balances WHERE supplier = ?", (supplier,)))
+        return {p: round(known.get(product_key(p), 0.0), 6) for p in products}
+
+    def balances(self, supplier=None):
+        """Güncel bakiye tablosu: TEDARİKÇİ, ÜRÜN ADI, BAKİYE, BİRİM"""
+        self.refresh()
+        q, args = "SELECT supplier, product, qty, unit FROM balances", []
+        if supplier:
+            q, args = q + " WHERE supplier = ?", [supplier]
+        with self._conn() as conn:
+            rows = conn.execute(q + " ORDER BY supplier, key", args).fetchall()
+        return pd.DataFrame(rows, columns=["TEDARİKÇİ", "ÜRÜN ADI", "BAKİYE", "BİRİM"])
+
+    # --- Sorgular ---
+    def balance_at(self, product, day, supplier=None):
+        """
+        product'ın day günü sonundaki bakiyesi (ürün-gün indeksi üzerinden).
+        supplier verilmezse {tedarikçi: bakiye}.
+        """
+        key, day = product_key(product), iso_day(day)
+        with self._conn() as conn:
+            if supplier is not None:
+                row = conn.execute(
+                    "SELECT COALESCE(SUM(qty), 0) FROM movements WHERE key = ? AND supplier = ? AND day <= ?",
+                    (key, supplier, day)
+                ).fetchone()
+                return row[0]
+            return dict(conn.execute(
+                "SELECT supplier, SUM(qty) FROM movements WHERE key = ? AND day <= ? GROUP BY supplier",
+                (key, day)
+            ).fetchall())
+
+    def movements(self, product=None, supplier=None, since=None, until=None):
+        """Hareket dökümü; her satırda o ana kadarki yürüyen bakiye"""
+        q, args = "SELECT id, day, supplier, product, qty, unit, price, kind FROM movements WHERE 1 = 1", []
+        if product:
+            q += " AND key = ?"
+            args.append(product_key(product))
+        if supplier:
+            q += " AND supplier = ?"
+            args.append(supplier)
+        if until:
+            q += " AND day <= ?"
+            args.append(iso_day(until))
+        with self._conn() as conn:
+            rows = conn.execute(q + " ORDER BY supplier, key, day, id", args).fetchall()
+        df = pd.DataFrame(rows, columns=["ID", "TARİH", "TEDARİKÇİ", "ÜRÜN ADI", "MİKTAR", "BİRİM", "BİRİM FİYAT", "TÜR"])
+        df["BAKİYE"] = df.groupby(["TEDARİKÇİ", df["ÜRÜN ADI"].map(product_key)])["MİKTAR"].cumsum()
+        if since:
+            df = df[df["TARİH"] >= iso_day(since)]
+        return df.reset_index(drop=True)
+
+# =========================================================
+# ⚙️ PAYLAŞIMLI DEFTER
+# =========================================================
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_stock_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            from modules.utils import get_setting, LOCAL_DATA_DIR
+            _ledger = StockLedger(get_setting("STOCK_LEDGER_PATH", os.path.join(LOCAL_DATA_DIR, "stock_ledger.sqlite")))
+        return _ledger
+
+def set_stock_ledger(ledger):
+    """Benchmark/testlerin kendi defterini takması için"""
+    global _ledger
+    with _ledger_lock:
+        _ledger = ledger
+
+# =========================================================
+# 🖥️ ARAYÜZ
+# =========================================================
+
+def render_ledger_panel(company):
+    """Firmanın defter bakiyeleri, seçilen ürünün belirli gündeki bakiyesi ve hareketleri"""
+    ledger = get_stock_ledger()
+    with st.expander(f"📒 Stok Defteri — {company}"):
+        balances = ledger.balances(company)
+        if balances.empty:
+            st.caption("Bu firma için henüz hareket yok; ilk fatura/irsaliye kaydında sayfadaki kotalar açılış olarak alınır.")
+            return
+        st.dataframe(balances.drop(columns="TEDARİKÇİ"), hide_index=True, use_container_width=True)
+        c1, c2 = st.columns(2)
+        product = c1.selectbox("Ürün", balances["ÜRÜN ADI"].tolist(), key=f"defter_urun_{company}")
+        day = c2.date_input("Tarih", date.today(), key=f"defter_tarih_{company}")
+        st.metric(f"{day:%d.%m.%Y} bakiyesi", f"{ledger.balance_at(product, day, company):,.2f}")
+        st.dataframe(ledger.movements(product, company, until=day).drop(columns=["ID", "TEDARİKÇİ", "ÜRÜN ADI"]), hide_index=True, use_container_width=True)
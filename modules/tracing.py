@@ -0,0 +1,210 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# =========================================================
+# 🔬 HAFİF İZLEME (TRACE) KATMANI
+# =========================================================
+# Kullanım:
+#   with span("sheets.get_all_values", sheet="AKTIF_MENU") as s:
+#       data = ws.get_all_values()
+#       s.set(bytes=payload_size(data))
+# İç içe span'ler ağaç oluşturur; en dıştaki span bitince "trace" olarak
+# son N trace listesine eklenir ve isim bazında sayaç/süre istatistiği tutulur.
+
+MAX_TRACES = 50
+TRACE_EXPORT_PATH = os.environ.get("MUTFAK_TRACE_EXPORT")  # doluysa her trace JSONL olarak eklenir
+
+_current = contextvars.ContextVar("mutfak_current_span", default=None)
+_traces = deque(maxlen=MAX_TRACES)
+_stats = {}
+_lock = threading.Lock()
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "duration", "children", "error", "trace_id")
+
+    def __init__(self, name, attrs, trace_id):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self.children = []
+        self.error = None
+        self.trace_id = trace_id
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": self.start,
+            "ms": round((self.duration or 0) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+            "children": [c.to_dict() for c in self.children],
+        }
+
+@contextmanager
+def span(name, **attrs):
+    parent = _current.get()
+    s = Span(name, attrs, parent.trace_id if parent else uuid.uuid4().hex[:12])
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - t0
+        _current.reset(token)
+        _record(s, parent)
+
+def record(name, seconds, **attrs):
+    """Süresi dışarıda ölçülmüş bir span'i (ör. generator boyunca süren akış) mevcut span'in altına ekler"""
+    parent = _current.get()
+    s = Span(name, attrs, parent.trace_id if parent else uuid.uuid4().hex[:12])
+    s.start = time.time() - seconds
+    s.duration = seconds
+    _record(s, parent)
+
+def traced(name):
+    """Fonksiyonun her çağrısını bir span içinde çalıştıran dekoratör"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def _record(s, parent):
+    with _lock:
+        st = _stats.setdefault(s.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes": 0, "errors": 0})
+        ms = s.duration * 1000
+        st["count"] += 1
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+        st["bytes"] += int(s.attrs.get("bytes", 0) or 0)
+        if s.error: st["errors"] += 1
+        if parent is not None:
+            parent.children.append(s)
+            return
+        _traces.append(s)
+    if TRACE_EXPORT_PATH:
+        try:
+            with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass
+
+def payload_size(obj, _depth=0):
+    """Yaklaşık veri boyutu (karakter); satır listeleri için ucuz tahmin"""
+    if obj is None: return 0
+    if isinstance(obj, (bytes, str)): return len(obj)
+    if isinstance(obj, dict): return sum(payload_size(v, _depth + 1) for v in obj.values()) if _depth < 3 else 0
+    if isinstance(obj, (list, tuple)): return sum(payload_size(v, _depth + 1) for v in obj) if _depth < 3 else 0
+    if isinstance(obj, (int, float)): return 8
+    return 0
+
+# =========================================================
+# 🔌 SHEETS İSTEMCİSİ SARMALAYICI
+# =========================================================
+
+# Ağ çağrısı yapan gspread metodları; diğerleri olduğu gibi geçer
+_SHEETS_IO = {
+    "open", "worksheet", "worksheets", "add_worksheet",
+    "get_all_values", "get_all_records", "get_values", "get", "col_values", "row_values", "acell", "cell",
+    "batch_update", "batch_get", "append_row", "append_rows", "update", "update_cell", "update_cells",
+    "clear", "delete_rows", "insert_rows",
+}
+
+class TracedSheets:
+    """gspread Client/Spreadsheet/Worksheet nesnelerini saran vekil (proxy)."""
+
+    def __init__(self, target, label="sheets"):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_label", label)
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if attr not in _SHEETS_IO or not callable(value):
+            return value
+        label = self._label
+
+        def call(*args, **kwargs):
+            with span(f"sheets.{attr}", target=label) as s:
+                out = value(*args, **kwargs)
+                if attr.startswith(("get", "col_", "row_", "batch_get")):
+                    s.set(bytes=payload_size(out))
+                else:
+                    s.set(bytes=payload_size(args) + payload_size(kwargs.get("values")))
+            return _wrap(out, attr, args)
+        return call
+
+    def __setattr__(self, attr, value):
+        setattr(self._target, attr, value)
+
+    def __repr__(self):
+        return f"TracedSheets({self._target!r})"
+
+def _wrap(out, attr, args):
+    # open/worksheet/add_worksheet dönüşleri de sarılır ki alt çağrılar izlensin
+    if attr in ("open", "worksheet", "add_worksheet"):
+        name = str(args[0]) if args else getattr(out, "title", "")
+        return TracedSheets(out, name)
+    if attr == "worksheets":
+        return [TracedSheets(ws, getattr(ws, "title", "")) for ws in out]
+    return out
+
+# =========================================================
+# 📤 OKUMA / DIŞA AKTARMA
+# =========================================================
+
+def get_traces():
+    """Son trace'ler, en yenisi başta"""
+    with _lock:
+        return list(reversed(_traces))
+
+def get_stats():
+    """[{isim, count, total_ms, avg_ms, max_ms, bytes, errors}, ...] toplam süreye göre"""
+    with _lock:
+        rows = [dict(name=k, avg_ms=v["total_ms"] / v["count"], **v) for k, v in _stats.items()]
+    for r in rows:
+        r["total_ms"] = round(r["total_ms"], 1)
+        r["avg_ms"] = round(r["avg_ms"], 1)
+        r["max_ms"] = round(r["max_ms"], 1)
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+def flatten(trace):
+    """Trace ağacını girintili satırlara çevirir (arayüz tablosu için)"""
+    rows = []
+
+    def walk(s, depth):
+        rows.append({
+            "span": ("  " * depth) + s.name,
+            "ms": round((s.duration or 0) * 1000, 1),
+            "bytes": s.attrs.get("bytes", ""),
+            "detay": ", ".join(f"{k}={v}" for k, v in s.attrs.items() if k != "bytes"),
+            "hata": s.error or "",
+        })
+        for c in s.children: walk(c, depth + 1)
+
+    walk(trace, 0)
+    return rows
+
+def export_jsonl(traces=None):
+    traces = get_traces() if traces is None else traces
+    return "".join(json.dumps(t.to_dict(), ensure_ascii=False, default=str) + "\n" for t in traces)
+
+def reset():
+    with _lock:
+        _traces.clear()
+        _stats.clear()
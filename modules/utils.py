@@ -1,10 +1,12 @@
 import streamlit as st
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from googleapiclient.discovery import build
 import re
 import difflib
 import requests
+import threading
+import time
+import os
+import pandas as pd
+from modules.tracing import span, traced, TracedSheets
 
 # =========================================================
 # 📂 DOSYA İSİMLERİ (Senin Ekran Görüntüne Göre)
@@ -24,6 +26,22 @@ SHEET_FINANS_AYARLAR = "FINANS_AYARLAR"
 SHEET_STOK_AYARLAR = "AYARLAR" 
 PRICE_SHEET_NAME = "FIYAT_ANAHTARI"
 MENU_POOL_SHEET_NAME = "YEMEK_HAVUZU"
+MAPPING_SHEET_NAME = "ESLESTIRME_SOZLUGU"
+RECIPE_SHEET_NAME = "RECETELER"
+
+# Yerel (sunucu diskindeki) önbellek/özet dosyaları; MUTFAK_DATA_DIR ile değiştirilebilir (ölçümler, testler)
+LOCAL_DATA_DIR = os.environ.get("MUTFAK_DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# =========================================================
+# ⚙️ AYARLAR
+# =========================================================
+
+def get_setting(key, default=None):
+    """Önce MUTFAK_<KEY> ortam değişkeni, sonra st.secrets, yoksa varsayılan"""
+    env = os.environ.get(f"MUTFAK_{key}")
+    if env is not None: return env
+    try: return st.secrets.get(key, default)
+    except Exception: return default
 
 # =========================================================
 # 🔐 BAĞLANTILAR
@@ -42,15 +60,52 @@ def check_password():
             else: st.error("Yanlış şifre.")
     return False
 
+@st.cache_resource(show_spinner=False)
+def _cached_gspread_client():
+    # Google kütüphaneleri ilk bağlantıda yüklenir — giriş ekranı bunları beklemesin
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    # KAPSAM (SCOPE) - Robotun hem Sheets hem Drive yetkisi olsun
+    scope = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets["gcp_service_account"]), scope)
+    return gspread.authorize(creds)
+
+# --- SAHTE SHEETS (Yük testi / ağsız çalışma) ---
+_FAKE_SHEETS_CLIENT = None
+
+def get_fake_sheets_client():
+    """SHEETS_BACKEND = "fake" iken kullanılan paylaşımlı bellek içi istemci"""
+    global _FAKE_SHEETS_CLIENT
+    if _FAKE_SHEETS_CLIENT is None:
+        from modules.fake_sheets import FakeSheetsClient
+        quota = get_setting("FAKE_SHEETS_QUOTA_PER_MIN")
+        kwargs = dict(
+            latency_ms=float(get_setting("FAKE_SHEETS_LATENCY_MS", 0) or 0),
+            jitter_ms=float(get_setting("FAKE_SHEETS_JITTER_MS", 0) or 0),
+            quota_per_minute=int(quota) if quota else None,
+        )
+        data_path = get_setting("FAKE_SHEETS_DATA")
+        if data_path and os.path.exists(data_path):
+            _FAKE_SHEETS_CLIENT = FakeSheetsClient.load(data_path, **kwargs)
+        else:
+            _FAKE_SHEETS_CLIENT = FakeSheetsClient(**kwargs)
+    return _FAKE_SHEETS_CLIENT
+
+def set_fake_sheets_client(client):
+    """Benchmark/testlerin kendi hazırladığı istemciyi takması için"""
+    global _FAKE_SHEETS_CLIENT
+    _FAKE_SHEETS_CLIENT = client
+
 def get_gspread_client():
+    # İstemci her rerun'da yeniden kurulmasın diye süreç boyunca paylaşılır.
+    # Hata önbelleğe alınmaz, bir sonraki çağrıda tekrar denenir.
     try:
-        # KAPSAM (SCOPE) - Robotun hem Sheets hem Drive yetkisi olsun
-        scope = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets["gcp_service_account"]), scope)
-        return gspread.authorize(creds)
+        if str(get_setting("SHEETS_BACKEND", "google")).lower() == "fake":
+            return TracedSheets(get_fake_sheets_client(), "fake")
+        return TracedSheets(_cached_gspread_client())
     except Exception as e:
         st.error(f"Sheets Bağlantı Hatası: {e}")
         return None
@@ -59,6 +114,8 @@ def get_gspread_client():
 def get_drive_service():
     scope = ['https://www.googleapis.com/auth/drive']
     try:
+        from oauth2client.service_account import ServiceAccountCredentials
+        from googleapiclient.discovery import build
         creds_dict = dict(st.secrets["gcp_service_account"])
         creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
         return build('drive', 'v3', credentials=creds)
@@ -69,7 +126,8 @@ def find_folder_id(service, folder_name, parent_id=None):
     try:
         query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
         if parent_id: query += f" and '{parent_id}' in parents"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
+        with span("drive.files.list", folder=folder_name):
+            results = service.files().list(q=query, fields="files(id, name)").execute()
         files = results.get('files', [])
         if files: return files[0]['id']
         return None
@@ -79,19 +137,81 @@ def fetch_google_models():
     api_key = st.secrets["GOOGLE_API_KEY"]
     try:
         url = f"https://generativelanguage.googleapis.com/v1beta/models?key={api_key}"
-        res = requests.get(url)
+        with span("model.listModels"):
+            res = requests.get(url)
         if res.status_code == 200:
             data = res.json()
             return sorted([m['name'] for m in data.get('models', []) if 'generateContent' in m['supportedGenerationMethods']])
         return []
     except: return []
 
+# =========================================================
+# 🗂️ SAYFA ÖNBELLEĞİ (SNAPSHOT)
+# =========================================================
+
+SNAPSHOT_TTL = 300  # saniye
+SNAPSHOT_ERROR_TTL = 60  # okunamayan sayfa bu süre boyunca tekrar denenmez
+
+class SheetSnapshot:
+    """Bir sayfanın belirli bir anda indirilmiş hali ve ondan türetilen yapılar (ok=False: okunamadı)"""
+
+    def __init__(self, df, ok=True):
+        self.df = df
+        self.ok = ok
+        self.loaded_at = time.time()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name, builder):
+        """builder(df) sonucunu bu görüntü için bir kez hesaplar (örn. isim indeksi)"""
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = builder(self.df)
+            return self._derived[name]
+
+_SNAPSHOTS = {}
+_SNAPSHOT_LOCK = threading.Lock()
+
+def get_sheet_snapshot(file_name, sheet_name, ttl=SNAPSHOT_TTL, ws=None, client=None):
+    """
+    Sayfanın get_all_records görüntüsünü döndürür; ttl saniyeden yeniyse indirmez.
+    ttl=0 her zaman taze okur (yazma öncesi okuma için). Elde açık worksheet varsa
+    ws ile verilir, dosya tekrar açılmaz; client verilirse dosya onunla açılır.
+    Olmayan sayfa boş görüntü olarak ttl boyunca saklanır; diğer hatalarda ok=False
+    boş görüntü SNAPSHOT_ERROR_TTL boyunca saklanır (her rerun'da dosya açılmasın).
+    """
+    key = (file_name, sheet_name)
+    with _SNAPSHOT_LOCK:
+        snap = _SNAPSHOTS.get(key)
+    if snap is not None and ttl > 0 and time.time() - snap.loaded_at < (ttl if snap.ok else min(ttl, SNAPSHOT_ERROR_TTL)):
+        return snap
+
+    try:
+        if ws is None:
+            ws = (client or get_gspread_client()).open(file_name).worksheet(sheet_name)
+        snap = SheetSnapshot(pd.DataFrame(ws.get_all_records()))
+    except Exception as e:
+        snap = SheetSnapshot(pd.DataFrame(), ok=type(e).__name__.endswith("WorksheetNotFound"))
+
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOTS[key] = snap
+    return snap
+
+def invalidate_snapshot(file_name, sheet_name=None):
+    """Yazma sonrası çağrılır; sheet_name verilmezse dosyanın tüm sayfaları düşer."""
+    with _SNAPSHOT_LOCK:
+        for key in list(_SNAPSHOTS):
+            if key[0] == file_name and (sheet_name is None or key[1] == sheet_name):
+                del _SNAPSHOTS[key]
+
 # =========================================================
 # 🛠️ YARDIMCI ARAÇLAR
 # =========================================================
 
 def clean_number(num_str):
     if not num_str: return 0.0
+    # JSON'dan gelen sayılar metne çevrilmez ("1.375" binlik ayracı sanılmasın)
+    if isinstance(num_str, (int, float)) and not isinstance(num_str, bool): return float(num_str)
     clean = re.sub(r'[^\d.,-]', '', str(num_str))
     try:
         if '.' in clean and ',' in clean: clean = clean.replace('.', '').replace(',', '.')
@@ -147,17 +267,148 @@ def get_company_list(client):
         return sorted(list(set(companies)))
     except: return []
 
+# =========================================================
+# 🔤 OCR EŞLEŞTİRME SÖZLÜĞÜ (ESLESTIRME_SOZLUGU)
+# =========================================================
+# TEDARİKÇİ | OCR METNİ (Ham) | STANDART ÜRÜN ADI
+# SNAPSHOT_TTL süresince bir kez okunur, {(tedarikçi, normalize metin): standart ad}
+# haritasında tutulur (sayfada ya da başka süreçte yapılan eklemeler TTL sonunda görünür). Tedarikçi boşsa eşleşme tüm firmalar için geçerlidir (eski 2 sütunlu satırlar).
+# Faturada/irsaliyede ürün adı elle düzeltilince yeni eşleşme buraya eklenir.
+
+MAPPING_HEADER = ["TEDARİKÇİ", "OCR METNİ (Ham)", "STANDART ÜRÜN ADI"]
+_WS_RE = re.compile(r"\s+")
+
+def alias_key(text):
+    return _WS_RE.sub(" ", turkish_lower(str(text).replace("*", "")))
+
+class AliasStore:
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self._map = None
+        self._loaded_at = 0.0
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _ensure(self, client):
+        if self._map is not None and time.time() - self._loaded_at < self.ttl:
+            return
+        mapping = {}
+        try:
+            with span("aliases.load"):
+                ws = get_or_create_worksheet(client.open(FILE_STOK), MAPPING_SHEET_NAME, 3, MAPPING_HEADER)
+                rows = ws.get_all_values()[1:]
+            for row in rows:
+                row = [c.strip() for c in row]
+                if len(row) >= 3 and row[2]:
+                    ted, ocr, std = row[:3]
+                elif len(row) >= 2:
+                    ted, ocr, std = "", row[0], row[1]  # Eski biçim: OCR | STANDART (tedarikçisiz)
+                else:
+                    continue
+                if ocr and std:
+                    mapping[(ted, alias_key(ocr))] = std
+        except Exception:
+            # Sözlük okunamazsa bulanık eşleştirmeyle devam; eski harita varsa bir TTL daha kullanılır
+            if self._map is not None:
+                self._loaded_at = time.time()
+            return
+        self._map = mapping
+        self._loaded_at = time.time()
+
+    def lookup(self, client, company_name, ocr_text):
+        with self._lock:
+            self._ensure(client)
+            if not self._map:
+                return None
+            key = alias_key(ocr_text)
+            return self._map.get((company_name, key)) or self._map.get(("", key))
+
+    def add_many(self, client, company_name, pairs):
+        """
+        pairs: [(ocr_metni, standart_ad), ...]; yeni olanları tek append_rows ile yazar.
+        Bellekteki harita ancak yazma başarılı olursa güncellenir.
+        """
+        with self._lock:
+            self._ensure(client)
+            known = self._map or {}
+            staged = {}
+            rows = []
+            for ocr, std in pairs:
+                ocr, std = str(ocr).strip(), str(std).strip()
+                key = (company_name, alias_key(ocr))
+                if not ocr or not std or key[1] == alias_key(std) or staged.get(key, known.get(key)) == std:
+                    continue
+                staged[key] = std
+                rows.append([company_name, ocr, std])
+            if not rows:
+                return 0
+            try:
+                ws = get_or_create_worksheet(client.open(FILE_STOK), MAPPING_SHEET_NAME, 3, MAPPING_HEADER)
+                ws.append_rows(rows)
+            except Exception:
+                return 0
+            # Harita hiç okunamadıysa sonraki arama sayfadan (yeni satırlarla) okur
+            if self._map is not None:
+                self._map.update(staged)
+            return len(rows)
+
+    def invalidate(self):
+        """Sözlük sayfası dışarıdan değiştiğinde çağrılır; sonraki arama sayfayı yeniden okur"""
+        with self._lock:
+            self._map = None
+
+_ALIASES = AliasStore()
+
+def add_to_mapping(client, company_name, ocr_text, standard_product_name):
+    """Tek eşleşme ekler (yeni ise True)"""
+    return _ALIASES.add_many(client, company_name, [(ocr_text, standard_product_name)]) > 0
+
+def record_corrections(client, company_name, original_df, edited_df, col="ÜRÜN ADI"):
+    """
+    data_editor'de elle değiştirilen ürün adlarını sözlüğe kaydeder. Satırlar index ile
+    eşlenir (editörde eklenen/silinen satırlar atlanır). Eklenen eşleşme sayısını döndürür.
+    """
+    if original_df is None or col not in original_df or col not in edited_df:
+        return 0
+    common = original_df.index.intersection(edited_df.index)
+    before, after = original_df.loc[common, col].astype(str), edited_df.loc[common, col].astype(str)
+    changed = before.str.strip() != after.str.strip()
+    pairs = list(zip(before[changed], after[changed]))
+    return _ALIASES.add_many(client, company_name, pairs) if pairs else 0
+
+def _company_products(df):
+    """Fiyat anahtarı görüntüsünden {tedarikçi: (ürün adları, küçük harfli anahtarlar)}"""
+    out = {}
+    if df.empty or "ÜRÜN ADI" not in df.columns:
+        return out
+    ted_col = df.columns[0]
+    for ted, grp in df.groupby(df[ted_col].astype(str).str.strip()):
+        names = [str(n).strip() for n in grp["ÜRÜN ADI"] if str(n).strip()]
+        out[ted] = (names, [turkish_lower(n) for n in names])
+    return out
+
 def resolve_product_name(ocr_prod, client, company_name):
+    """
+    Önce sözlükte birebir (O(1)) eşleşme, yoksa firmanın ürünleri içinde bulanık arama.
+    Firma ürün listesi fiyat anahtarı görüntüsünden bir kez türetilir (satır başına indirme yok).
+    """
     clean_prod = ocr_prod.replace("*", "").strip()
     try:
-        price_db = get_price_database(client)
-        if company_name in price_db:
-            company_products = list(price_db[company_name].keys())
-            best = find_best_match(clean_prod, company_products, cutoff=0.7)
-            if best: return best
+        alias = _ALIASES.lookup(client, company_name, clean_prod)
+        if alias: return alias
+        products = get_sheet_snapshot(FILE_STOK, PRICE_SHEET_NAME, client=client).derived("company_products", _company_products)
+        if not products:
+            # Başlıksız/eski sayfa: get_all_records okunamadı, tam tabloya düş
+            price_db = get_price_database(client)
+            names = list(price_db.get(company_name, {}).keys())
+            products = {company_name: (names, [turkish_lower(n) for n in names])}
+        if company_name in products:
+            names, keys = products[company_name]
+            matches = difflib.get_close_matches(turkish_lower(clean_prod), keys, n=1, cutoff=0.7)
+            if matches: return names[keys.index(matches[0])]
         return clean_prod
     except: return clean_prod
 
+@traced("utils.get_price_database")
 def get_price_database(client):
     price_db = {}
     try:
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modüller yüklenmeden önce: testler uygulamanın data/ klasörüne ve gerçek Sheets'e dokunmaz
+os.environ["MUTFAK_SHEETS_BACKEND"] = "fake"
+os.environ["MUTFAK_DATA_DIR"] = tempfile.mkdtemp(prefix="mutfak-test-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,179 @@
+import json
+
+import pytest
+
+from modules.extraction import (
+    ExtractionError,
+    JsonArrayStream,
+    compile_schema,
+    extract,
+    extract_stream,
+    parse_response,
+)
+from modules.fatura import INVOICE_SPEC
+from modules.model_backend import ModelBackend, set_model_backend, get_model_backend
+
+ITEMS = [
+    {"urun_adi": "Un", "birim_fiyat": 12.5, "miktar": 10, "birim": "KG"},
+    {"urun_adi": 'Salça "Tat" [5 kg] {teneke}', "birim_fiyat": "1.250,50", "miktar": "2", "birim": "AD"},
+    {"urun_adi": "Yağ \\ Ayçiçek, 5 L", "birim_fiyat": 300, "miktar": 1, "birim": "AD"},
+]
+
+def model_json(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+class ScriptedBackend(ModelBackend):
+    """Sıradaki cevabı döndürür; akışta cevap chunk_chars'lık parçalara bölünür"""
+
+    name = "test"
+
+    def __init__(self, *answers, chunk_chars=7):
+        self.answers = list(answers)
+        self.prompts = []
+        self.chunk_chars = chunk_chars
+
+    def generate_content(self, model_name, payload):
+        self.prompts.append(payload["contents"][0]["parts"][0]["text"])
+        return model_json(self.answers.pop(0))
+
+    def stream_content(self, model_name, payload):
+        text = self.generate_content(model_name, payload)["candidates"][0]["content"]["parts"][0]["text"]
+        for i in range(0, len(text), self.chunk_chars):
+            yield model_json(text[i:i + self.chunk_chars])
+
+@pytest.fixture
+def backend():
+    previous = get_model_backend()
+    holder = {}
+
+    def install(*answers, **kw):
+        holder["b"] = ScriptedBackend(*answers, **kw)
+        set_model_backend(holder["b"])
+        return holder["b"]
+
+    yield install
+    set_model_backend(previous)
+
+def feed_in_chunks(stream, text, size):
+    out = []
+    for i in range(0, len(text), size):
+        out += stream.feed(text[i:i + size])
+    return out + stream.close()
+
+# --- JsonArrayStream ---
+@pytest.mark.parametrize("size", [1, 3, 17, 10_000])
+def test_stream_yields_items_across_split_chunks(size):
+    text = json.dumps({"kalemler": ITEMS}, ensure_ascii=False)
+    assert feed_in_chunks(JsonArrayStream("kalemler"), text, size) == ITEMS
+
+def test_stream_waits_for_incomplete_item():
+    stream = JsonArrayStream("kalemler")
+    assert stream.feed('{"kalemler": [{"urun_adi": "Un", "mik') == []
+    assert stream.feed('tar": 3}, {"urun_adi": "Tu') == [{"urun_adi": "Un", "miktar": 3}]
+    assert stream.feed('z"}]}') == [{"urun_adi": "Tuz"}]
+    assert stream.done
+
+def test_stream_keeps_escaped_quotes_and_brackets_in_strings():
+    item = {"urun_adi": 'a "b" ] } [ { \\ c', "miktar": 1}
+    text = json.dumps({"kalemler": [item, {"urun_adi": "d", "miktar": 2}]})
+    assert feed_in_chunks(JsonArrayStream("kalemler"), text, 2) == [item, {"urun_adi": "d", "miktar": 2}]
+
+def test_stream_skips_broken_item_and_recovers_next():
+    text = '{"kalemler": [{"urun_adi": "Un", "miktar": 1}, {"urun_adi": "Bozuk", "miktar": 1,, }, {"urun_adi": "Tuz", "miktar": 2}]}'
+    stream = JsonArrayStream("kalemler")
+    assert [i["urun_adi"] for i in feed_in_chunks(stream, text, 5)] == ["Un", "Tuz"]
+    assert stream.skipped == 1
+
+def test_stream_truncated_array_returns_completed_items():
+    text = json.dumps({"kalemler": ITEMS}, ensure_ascii=False)
+    cut = text[:text.index("Yağ") + 2]
+    stream = JsonArrayStream("kalemler")
+    assert feed_in_chunks(stream, cut, 11) == ITEMS[:2]
+
+def test_stream_without_key_yields_nothing():
+    assert feed_in_chunks(JsonArrayStream("kalemler"), "Un | 12 | 3 | KG\n", 4) == []
+
+# --- compile_schema ---
+def test_schema_converts_numbers_and_strips_strings():
+    errors = []
+    out = INVOICE_SPEC.validate({"kalemler": ITEMS}, errors)
+    assert errors == []
+    assert out["kalemler"][1] == {"urun_adi": 'Salça "Tat" [5 kg] {teneke}', "birim_fiyat": 1250.5, "miktar": 2.0, "birim": "AD"}
+
+def test_schema_type_failure_drops_only_bad_item():
+    errors = []
+    items = [ITEMS[0], {"urun_adi": "Tuz", "birim_fiyat": "bedava", "miktar": 1}]
+    out = INVOICE_SPEC.validate({"kalemler": items}, errors)
+    assert [i["urun_adi"] for i in out["kalemler"]] == ["Un"]
+    assert errors == ["[1] $.kalemler[].birim_fiyat: sayı değil ('bedava')"]
+
+def test_schema_required_field_failure():
+    errors = []
+    out = INVOICE_SPEC.validate({"kalemler": [{"urun_adi": "Un", "birim_fiyat": 3}]}, errors)
+    assert out == {"kalemler": []}
+    assert errors == ["[0] $.kalemler[].miktar: eksik"]
+
+def test_schema_object_enum_boolean_and_integer():
+    check = compile_schema({
+        "type": "OBJECT",
+        "properties": {
+            "tur": {"type": "STRING", "enum": ["TAKSİT", "PEŞİN"]},
+            "onay": {"type": "BOOLEAN"},
+            "adet": {"type": "INTEGER"},
+        },
+        "required": ["tur"],
+    })
+    errors = []
+    assert check({"tur": "TAKSİT", "onay": "true", "adet": "3"}, errors) == {"tur": "TAKSİT", "onay": True, "adet": 3}
+    assert errors == []
+    check({"tur": "KREDİ", "onay": "belki", "adet": True}, errors)
+    assert len(errors) == 3
+    errors = []
+    check([], errors)
+    assert errors == ["$: nesne bekleniyordu"]
+
+# --- parse_response / extract ---
+def test_parse_response_recovers_items_from_truncated_answer():
+    raw = "```json\n" + json.dumps({"kalemler": ITEMS}, ensure_ascii=False)[:-20]
+    data, warnings, retry = parse_response(INVOICE_SPEC, raw)
+    assert [i["urun_adi"] for i in data["kalemler"]] == [i["urun_adi"] for i in ITEMS[:2]]
+    assert not retry
+    assert warnings[0].startswith("Cevap bozuk; 2 kalem kurtarıldı")
+
+def test_parse_response_asks_again_when_nothing_valid():
+    data, warnings, retry = parse_response(INVOICE_SPEC, '{"kalemler": [{"urun_adi": "Un"}]}')
+    assert data is None and retry
+
+def test_extract_retries_with_errors_in_prompt(backend):
+    b = backend('{"kalemler": [{"urun_adi": "Un"}]}', json.dumps({"kalemler": ITEMS[:1]}))
+    res = extract(INVOICE_SPEC, "m", b"pdf", "application/pdf")
+    assert res.attempts == 2
+    assert res.data["ÜRÜN ADI"].tolist() == ["Un"]
+    assert "ÖNCEKİ CEVAP GEÇERSİZDİ" in b.prompts[1] and "miktar: eksik" in b.prompts[1]
+
+def test_extract_raises_after_retries(backend):
+    backend("{}", "{}")
+    with pytest.raises(ExtractionError):
+        extract(INVOICE_SPEC, "m", b"pdf", "application/pdf", retries=1)
+
+def test_extract_legacy_pipe_fallback(backend):
+    backend("ÜRÜN ADI | FİYAT | MİKTAR | BİRİM\n---\nUn | 12,50 | 10 | KG\nTuz | 4 | 2 | KG\n")
+    res = extract(INVOICE_SPEC, "m", b"pdf", "application/pdf")
+    assert res.data.to_dict("records") == [
+        {"ÜRÜN ADI": "Un", "BİRİM FİYAT": "12,50", "MİKTAR": "10", "BİRİM": "KG"},
+        {"ÜRÜN ADI": "Tuz", "BİRİM FİYAT": "4", "MİKTAR": "2", "BİRİM": "KG"},
+    ]
+
+def test_extract_stream_reports_rows_as_they_complete(backend):
+    backend(json.dumps({"kalemler": ITEMS}, ensure_ascii=False), chunk_chars=5)
+    seen = []
+    res = extract_stream(INVOICE_SPEC, "m", b"pdf", "application/pdf", on_rows=lambda df: seen.append(len(df)))
+    assert seen == [1, 2, 3]
+    assert res.data["ÜRÜN ADI"].tolist() == [i["urun_adi"] for i in ITEMS]
+
+def test_extract_stream_legacy_pipe_fallback(backend):
+    backend("Un | 12,50 | 10 | KG\nTuz | 4 | 2 | KG\n", chunk_chars=6)
+    seen = []
+    res = extract_stream(INVOICE_SPEC, "m", b"pdf", "application/pdf", on_rows=lambda df: seen.append(len(df)))
+    assert seen[-1] == 2
+    assert res.data["ÜRÜN ADI"].tolist() == ["Un", "Tuz"]
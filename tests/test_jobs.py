@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from modules.jobs import (
+    JobError,
+    JobRunner,
+    register,
+    CANCELLED,
+    DONE,
+    FAILED,
+    FINISHED,
+    QUEUED,
+    RUNNING,
+)
+
+CALLS = {}
+
+class Crash(BaseException):
+    """Sürecin iş ortasında ölmesi: _run yakalamaz, iş RUNNING kalır"""
+
+@register("test.adimlar")
+def steps_job(ctx, n, crash_after=None):
+    total = 0
+    for i in range(n):
+        def work(i=i):
+            CALLS[i] = CALLS.get(i, 0) + 1
+            return i * 10
+        total += ctx.step(f"adim{i}", work)
+        ctx.progress((i + 1) / n, f"{i + 1}/{n}")
+        if crash_after == i:
+            raise Crash()
+    return {"toplam": total}
+
+@register("test.hata")
+def failing_job(ctx, user_message):
+    if user_message:
+        raise JobError("Bağlantı hatası!")
+    raise ValueError("beklenmeyen")
+
+GATE = threading.Event()
+
+@register("test.bekle")
+def waiting_job(ctx):
+    ctx.progress(0.1, "bekliyor")
+    GATE.wait(5)
+    ctx.progress(0.5, "devam")
+    return "bitmemeliydi"
+
+@pytest.fixture
+def runners(tmp_path):
+    CALLS.clear()
+    GATE.clear()
+    made = []
+
+    def make():
+        runner = JobRunner(str(tmp_path / "jobs.sqlite"), max_workers=2)
+        made.append(runner)
+        return runner
+
+    yield make
+    GATE.set()
+    for r in made:
+        r._pool.shutdown(wait=True)
+
+def wait_for(runner, job_id, statuses=FINISHED, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"{job_id}: {runner.get(job_id)['status']}")
+
+def test_submit_runs_steps_and_stores_result(runners):
+    runner = runners()
+    job_id = runner.submit("test.adimlar", {"n": 3}, label="Deneme")
+    job = wait_for(runner, job_id)
+    assert job["status"] == DONE
+    assert job["result"] == {"toplam": 30}
+    assert job["progress"] == 1.0 and job["attempts"] == 1
+    assert job["label"] == "Deneme" and job["params"] == {"n": 3}
+    assert runner._step_result(job_id, "adim2") == (True, 20)
+    assert [j["id"] for j in runner.list(kinds=["test.adimlar"])] == [job_id]
+
+def test_failed_job_records_error(runners):
+    runner = runners()
+    user = wait_for(runner, runner.submit("test.hata", {"user_message": True}))
+    other = wait_for(runner, runner.submit("test.hata", {"user_message": False}))
+    assert (user["status"], user["error"]) == (FAILED, "Bağlantı hatası!")
+    assert (other["status"], other["error"]) == (FAILED, "ValueError: beklenmeyen")
+
+def test_cancel_running_job(runners):
+    runner = runners()
+    job_id = runner.submit("test.bekle")
+    wait_for(runner, job_id, statuses=(RUNNING,))
+    runner.cancel(job_id)
+    GATE.set()
+    job = wait_for(runner, job_id)
+    assert job["status"] == CANCELLED
+    assert job["result"] is None
+
+def test_cancel_queued_job_never_runs(runners, tmp_path):
+    runner = JobRunner(str(tmp_path / "jobs.sqlite"), max_workers=1)
+    try:
+        blocker = runner.submit("test.bekle")
+        wait_for(runner, blocker, statuses=(RUNNING,))
+        queued = runner.submit("test.adimlar", {"n": 1})
+        assert runner.get(queued)["status"] == QUEUED
+        runner.cancel(queued)
+        GATE.set()
+        assert wait_for(runner, queued)["status"] == CANCELLED
+        assert CALLS == {}
+    finally:
+        GATE.set()
+        runner._pool.shutdown(wait=True)
+
+def test_cancel_finished_job_is_ignored(runners):
+    runner = runners()
+    job_id = runner.submit("test.adimlar", {"n": 1})
+    wait_for(runner, job_id)
+    runner.cancel(job_id)
+    job = runner.get(job_id)
+    assert job["status"] == DONE and not job["cancel_requested"]
+
+def test_resume_pending_continues_from_last_step(runners):
+    first = runners()
+    job_id = first.submit("test.adimlar", {"n": 3, "crash_after": 1})
+    wait_for(first, job_id, statuses=(RUNNING,))
+    first._pool.shutdown(wait=True)
+    assert first.get(job_id)["status"] == RUNNING  # süreç öldü, iş yarım
+    assert CALLS == {0: 1, 1: 1}
+
+    # Yeni süreç: aynı veritabanı; kaydı düzeltilmiş parametreyle devam ettir
+    second = runners()
+    with second._conn() as conn:
+        conn.execute("UPDATE jobs SET params = ? WHERE id = ?", ('{"n": 3}', job_id))
+    assert second.resume_pending() == [job_id]
+    job = wait_for(second, job_id)
+    assert job["status"] == DONE and job["result"] == {"toplam": 30}
+    assert job["attempts"] == 2
+    assert CALLS == {0: 1, 1: 1, 2: 1}  # tamamlanan adımlar tekrar koşmadı
+    assert second.resume_pending() == []
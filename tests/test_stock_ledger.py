@@ -0,0 +1,114 @@
+import sqlite3
+
+import pytest
+
+from modules.stock_ledger import (
+    StockLedger,
+    batch_id,
+    product_key,
+    KIND_ADJUSTMENT,
+    KIND_INVOICE,
+    KIND_OPENING,
+    KIND_WAYBILL,
+)
+
+SUPPLIER = "ACME Gıda"
+
+@pytest.fixture
+def ledger(tmp_path):
+    return StockLedger(str(tmp_path / "stock_ledger.sqlite"))
+
+def read_sheet(ledger, product, sheet_value):
+    """Fatura/irsaliye gibi: defter durumu sayfadan önce alınır ve kotanın yanına konur"""
+    state = ledger.sheet_state(SUPPLIER)
+    return {product: [sheet_value, *state.get(product_key(product), [None, None])]}
+
+def kinds(ledger, product):
+    return ledger.movements(product, SUPPLIER)["TÜR"].tolist()
+
+def open_with(ledger, product, qty):
+    """Sayfada qty ile duran ürünü deftere açar ve sayfayı senkron sayar"""
+    ledger.record(SUPPLIER, "01.09.2025", [], KIND_INVOICE, "acilis", {product: [qty, None, None]})
+    ledger.mark_synced(SUPPLIER, {product: qty})
+
+def test_invoice_then_waybill(ledger):
+    invoice = [["Un", 50, "KG", 12.5], ["Şeker", 20, "KG", 30.0]]
+    waybill = [["Un", -15, "KG", 12.5]]
+    assert ledger.record(SUPPLIER, "02.09.2025", invoice, KIND_INVOICE, batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", invoice)) == 2
+    assert ledger.record(SUPPLIER, "03.09.2025", waybill, KIND_WAYBILL, batch_id(KIND_WAYBILL, SUPPLIER, "03.09.2025", waybill)) == 1
+
+    assert ledger.balance_of(SUPPLIER, ["Un", "Şeker", "Tuz"]) == {"Un": 35.0, "Şeker": 20.0, "Tuz": 0.0}
+    assert kinds(ledger, "Un") == [KIND_INVOICE, KIND_WAYBILL]
+    assert ledger.movements("Un", SUPPLIER)["BAKİYE"].tolist() == [50.0, 35.0]
+
+def test_product_key_ignores_case_and_spaces(ledger):
+    ledger.record(SUPPLIER, "02.09.2025", [["  İNCE BULGUR ", 10, "KG", 1.0]], KIND_INVOICE, "a")
+    ledger.record(SUPPLIER, "03.09.2025", [["ince bulgur", -4, "KG", 1.0]], KIND_WAYBILL, "b")
+    assert ledger.balance_of(SUPPLIER, ["İnce Bulgur"]) == {"İnce Bulgur": 6.0}
+
+def test_duplicate_batch_is_ignored(ledger):
+    moves = [["Un", 50, "KG", 12.5]]
+    batch = batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", moves)
+    assert ledger.record(SUPPLIER, "02.09.2025", moves, KIND_INVOICE, batch) == 1
+    assert ledger.record(SUPPLIER, "02.09.2025", moves, KIND_INVOICE, batch) == 0
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 50.0}
+
+def test_batch_id_follows_document_contents():
+    moves = [["Un", 50, "KG", 12.5]]
+    assert batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", moves) == batch_id(KIND_INVOICE, SUPPLIER, "2025-09-02", [("Un", 50, "KG", 12.5)])
+    assert batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", moves) != batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", [["Un", 60, "KG", 12.5]])
+    assert batch_id(KIND_INVOICE, SUPPLIER, "02.09.2025", moves) != batch_id(KIND_WAYBILL, SUPPLIER, "02.09.2025", moves)
+
+def test_unknown_product_opens_from_sheet(ledger):
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 5, "KG", 1.0]], KIND_INVOICE, "a", read_sheet(ledger, "Un", 15))
+    assert kinds(ledger, "Un") == [KIND_OPENING, KIND_INVOICE]
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 20.0}
+
+def test_external_sheet_edit_books_one_adjustment(ledger):
+    open_with(ledger, "Un", 15)
+    edited = read_sheet(ledger, "Un", 12)  # biri hücreyi 15 -> 12 yaptı
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 5, "KG", 1.0]], KIND_INVOICE, "a", edited)
+    ledger.mark_synced(SUPPLIER, ledger.balance_of(SUPPLIER, ["Un"]))
+
+    # Sayfa artık defterle aynı: sonraki kayıt yeni düzeltme açmaz
+    ledger.record(SUPPLIER, "03.09.2025", [["Un", -2, "KG", 1.0]], KIND_WAYBILL, "b", read_sheet(ledger, "Un", 17))
+    mov = ledger.movements("Un", SUPPLIER)
+    assert kinds(ledger, "Un") == [KIND_OPENING, KIND_ADJUSTMENT, KIND_INVOICE, KIND_WAYBILL]
+    assert mov.loc[mov["TÜR"] == KIND_ADJUSTMENT, "MİKTAR"].tolist() == [-3.0]
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 15.0}
+
+def test_stale_sheet_read_keeps_concurrent_movement(ledger):
+    open_with(ledger, "Un", 15)
+    read_a = read_sheet(ledger, "Un", 15)
+    read_b = read_sheet(ledger, "Un", 15)
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 5, "KG", 1.0]], KIND_INVOICE, "b", read_b)
+    ledger.mark_synced(SUPPLIER, ledger.balance_of(SUPPLIER, ["Un"]))
+    # A sayfayı B yazmadan önce okumuştu (15): düzeltme sayılmamalı
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 3, "KG", 1.0]], KIND_INVOICE, "a", read_a)
+    assert KIND_ADJUSTMENT not in kinds(ledger, "Un")
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 23.0}
+
+def test_balance_at_before_and_after_movement(ledger):
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 50, "KG", 1.0]], KIND_INVOICE, "a")
+    ledger.record(SUPPLIER, "10.09.2025", [["Un", -15, "KG", 1.0]], KIND_WAYBILL, "b")
+    ledger.record("Başka Firma", "05.09.2025", [["Un", 7, "KG", 1.0]], KIND_INVOICE, "c")
+
+    assert ledger.balance_at("Un", "01.09.2025", SUPPLIER) == 0
+    assert ledger.balance_at("Un", "02.09.2025", SUPPLIER) == 50.0
+    assert ledger.balance_at("Un", "09.09.2025", SUPPLIER) == 50.0
+    assert ledger.balance_at("Un", "10.09.2025", SUPPLIER) == 35.0
+    assert ledger.balance_at("Un", "2025-09-06") == {SUPPLIER: 50.0, "Başka Firma": 7.0}
+
+def test_refresh_resumes_from_checkpoint_and_rebuild_matches(ledger):
+    ledger.record(SUPPLIER, "02.09.2025", [["Un", 50, "KG", 1.0]], KIND_INVOICE, "a")
+    # Başka bir süreç hareket ekledi; bakiye kontrol noktasından itibaren güncellenir
+    with sqlite3.connect(ledger.db_path) as conn:
+        conn.execute(
+            "INSERT INTO movements (day, supplier, product, key, qty, kind, ref) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("2025-09-03", SUPPLIER, "Un", product_key("Un"), -10.0, KIND_WAYBILL, "dis"),
+        )
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 40.0}
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 40.0}  # ikinci okuma tekrar eklemez
+
+    ledger.rebuild()
+    assert ledger.balance_of(SUPPLIER, ["Un"]) == {"Un": 40.0}